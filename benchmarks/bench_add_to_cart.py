@@ -0,0 +1,32 @@
+"""
+Measures the per-request cost of POST /add as the catalog grows from 100 to 100k products.
+With the indexed lookup on Products.code the cost should stay flat.
+
+Usage: python benchmarks/bench_add_to_cart.py [requests_per_size]
+"""
+
+import sys
+
+from harness import load_app, logged_in_client, seed_products, seed_user, timed
+
+CATALOG_SIZES = [100, 1000, 10000, 100000]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app_module = load_app()
+    client = logged_in_client(app_module, seed_user(app_module))
+    seeded = 0
+    print("{:>10} {:>16}".format("products", "us per request"))
+    for size in CATALOG_SIZES:
+        seed_products(app_module, size - seeded, start=seeded)
+        seeded = size
+        client.get("/empty")
+        # ask for the last product so a linear scan would have to walk the whole table
+        form = {"code": "code{}".format(size - 1), "quantity": "1"}
+        mean = timed(lambda: client.post("/add", data=form), repeat)
+        print("{:>10} {:>16.1f}".format(size, mean))
+
+
+if __name__ == "__main__":
+    main()
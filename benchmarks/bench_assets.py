@@ -0,0 +1,59 @@
+"""
+CSS/JS cost of a page view. For the original static files and for the fingerprinted bundles
+the script reports the number of requests and the bytes transferred on a first visit, and
+the requests a repeat visit still makes, which are revalidations unless the response
+allows the browser to reuse its copy without asking.
+
+Usage: python benchmarks/bench_assets.py [accept_encoding]
+"""
+
+import sys
+
+from harness import load_app
+
+ORIGINAL = [
+    "/static/css/bootstrap.css",
+    "/static/css/style.css",
+    "/static/css/responsive.css",
+    "/static/js/jquery-3.6.4.min.js",
+    "/static/js/bootstrap.js",
+]
+
+
+def visit(client, urls, encoding):
+    """
+    :return: requests and bytes of a first visit and the requests of a repeat visit
+    """
+    transferred = 0
+    repeat_requests = 0
+    for url in urls:
+        response = client.get(url, headers={"Accept-Encoding": encoding})
+        transferred += len(response.data)
+        cache_control = response.cache_control
+        if not (cache_control.immutable and cache_control.max_age):
+            repeat_requests += 1
+    return len(urls), transferred, repeat_requests
+
+
+def main():
+    encoding = sys.argv[1] if len(sys.argv) > 1 else "gzip, deflate, br"
+    app_module = load_app()
+    client = app_module.app.test_client()
+    with app_module.app.app_context():
+        bundles = [app_module.asset_url("site.css"), app_module.asset_url("site.js")]
+    print(
+        "{:<10} {:>10} {:>10} {:>16}".format(
+            "assets", "requests", "KiB", "repeat requests"
+        )
+    )
+    for name, urls in [("original", ORIGINAL), ("bundled", bundles)]:
+        requests, transferred, repeat_requests = visit(client, urls, encoding)
+        print(
+            "{:<10} {:>10} {:>10.1f} {:>16}".format(
+                name, requests, transferred / 1024, repeat_requests
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cost of loading a catalog through the admin portal. The script adds products one POST
+/add_product form at a time, then imports files of new and changed products through
+/admin/products/import, and reports rows per second and database statements per row for
+each, followed by the time of a full /admin/products/export.
+
+Usage: python benchmarks/bench_bulk_import.py [form_rows] [import_rows]
+"""
+
+import io
+import sys
+import time
+
+from harness import load_app, logged_in_client, seed_user
+
+
+def csv_file(count, start, price):
+    lines = ["code,name,brand,price,image"]
+    lines.extend(
+        "bulk{0},product {0},brand{1},{2},chair.png".format(i, i % 50, price)
+        for i in range(start, start + count)
+    )
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def main():
+    form_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    import_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    app_module = load_app()
+    app_module.app.config["QUERY_COUNT_HEADER"] = True
+    client = logged_in_client(app_module, seed_user(app_module, accesslevel="admin"))
+
+    print(
+        "{:<22} {:>8} {:>10} {:>12} {:>10}".format(
+            "method", "rows", "s", "rows/s", "sql/row"
+        )
+    )
+    queries = 0
+    start = time.perf_counter()
+    for i in range(form_rows):
+        response = client.post(
+            "/add_product",
+            data={
+                "name": "form {}".format(i),
+                "brand": "form",
+                "code": "form{}".format(i),
+                "price": "1",
+                "image": "chair.png",
+            },
+        )
+        queries += int(response.headers["X-Query-Count"])
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<22} {:>8} {:>10.2f} {:>12.0f} {:>10.2f}".format(
+            "POST /add_product",
+            form_rows,
+            elapsed,
+            form_rows / elapsed,
+            queries / form_rows,
+        )
+    )
+
+    for label, price in [("import, new rows", 1), ("import, updates", 2)]:
+        start = time.perf_counter()
+        response = client.post(
+            "/admin/products/import",
+            data={"file": (csv_file(import_rows, 0, price), "products.csv")},
+            content_type="multipart/form-data",
+        )
+        elapsed = time.perf_counter() - start
+        report = response.get_json()
+        assert report["failed"] == 0, report["errors"][:5]
+        print(
+            "{:<22} {:>8} {:>10.2f} {:>12.0f} {:>10.3f}".format(
+                label,
+                import_rows,
+                elapsed,
+                import_rows / elapsed,
+                int(response.headers["X-Query-Count"]) / import_rows,
+            )
+        )
+
+    start = time.perf_counter()
+    response = client.get("/admin/products/export", headers={"Accept-Encoding": ""})
+    print(
+        "\nexport of {} products: {:.2f} s, {:.0f} KiB".format(
+            response.get_data(as_text=True).count("\n") - 1,
+            time.perf_counter() - start,
+            len(response.data) / 1024,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
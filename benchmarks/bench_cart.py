@@ -0,0 +1,69 @@
+"""
+Measures session cookie size and POST /add latency as a cart grows, for both cart store
+backends, next to the size the cookie had when the whole cart was kept in the session.
+
+Usage: python benchmarks/bench_cart.py [requests_per_size]
+"""
+
+import sys
+
+from harness import load_app, logged_in_client, seed_products, seed_user, timed
+
+CART_SIZES = [1, 10, 100, 500]
+
+
+def legacy_cookie_bytes(app_module, cart):
+    """
+    :return: size of the signed cookie holding the cart, as the session stored it before
+    """
+    legacy_session = {
+        "_user_id": "1",
+        "_fresh": True,
+        "cart_item": cart.items,
+        "all_total_quantity": cart.total_quantity,
+        "all_total_price": float(cart.total_price),
+    }
+    serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+    return len(serializer.dumps(legacy_session))
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app_module = load_app()
+    from cart_store import MemoryCartStore
+
+    seed_products(app_module, max(CART_SIZES))
+    user_id = seed_user(app_module)
+    backends = [("sql", app_module.carts), ("memory", MemoryCartStore())]
+
+    print(
+        "{:>8} {:>6} {:>14} {:>14} {:>16}".format(
+            "backend", "items", "cookie bytes", "legacy bytes", "us per /add"
+        )
+    )
+    for name, store in backends:
+        app_module.carts = store
+        client = logged_in_client(app_module, user_id)
+        filled = 0
+        for size in CART_SIZES:
+            for i in range(filled, size):
+                client.post("/add", data={"code": "code{}".format(i), "quantity": "1"})
+            filled = size
+            form = {"code": "code0", "quantity": "1"}
+            mean = timed(lambda: client.post("/add", data=form), repeat)
+            cookie = client.get_cookie("session").value
+            with client.session_transaction() as session:
+                cart = store.get(session["cart_id"])
+            print(
+                "{:>8} {:>6} {:>14} {:>14} {:>16.1f}".format(
+                    name,
+                    size,
+                    len(cookie),
+                    legacy_cookie_bytes(app_module, cart),
+                    mean,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Latency of POST /cart when the order is written in the request, with the order queue set to
+0 workers, and when it is only recorded for the worker threads. For each mode the script
+checks out carts of the given size and reports p50/p99 of the checkout request, then the
+time the workers took to write every order.
+
+Usage: python benchmarks/bench_checkout.py [checkouts] [items]
+"""
+
+import sys
+import time
+
+from harness import load_app, logged_in_client, percentile, seed_products, seed_user
+
+FORM = {
+    "fullname": "Bench",
+    "address": "1 Bench Street",
+    "city": "Dublin",
+    "eir": "D01",
+}
+
+
+def main():
+    checkouts = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(
+        "{:<8} {:>10} {:>10} {:>12} {:>8}".format(
+            "workers", "p50 ms", "p99 ms", "drain ms", "orders"
+        )
+    )
+    for workers in [0, 2]:
+        app_module = load_app(extra_config="[orders]\n workers = {}\n".format(workers))
+        seed_products(app_module, 1000)
+        client = logged_in_client(app_module, seed_user(app_module))
+        latencies = []
+        for i in range(checkouts):
+            for item in range(items):
+                client.post(
+                    "/add",
+                    data={"code": "code{}".format((i + item) % 1000), "quantity": "1"},
+                )
+            start = time.perf_counter()
+            client.post("/cart", data=dict(FORM, checkout_token="bench{}".format(i)))
+            latencies.append((time.perf_counter() - start) * 1e3)
+            client.get("/empty")
+        start = time.perf_counter()
+        with app_module.app.app_context():
+            while app_module.checkouts.stats()["pending"]:
+                time.sleep(0.01)
+            drained = (time.perf_counter() - start) * 1e3
+            orders = app_module.OrderHeaders.query.count()
+        app_module.checkouts.stop()
+        print(
+            "{:<8} {:>10.2f} {:>10.2f} {:>12.1f} {:>8}".format(
+                workers,
+                percentile(latencies, 50),
+                percentile(latencies, 99),
+                drained,
+                orders,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Bytes on the wire for the rendered pages with no encoding, gzip and brotli, the time each
+request takes, and what a revalidation with the page's ETag costs, made more than a second
+later so the CSRF token in the page has been signed again. The streamed csv export
+is checked too, as the time to its first compressed chunk against the whole export.
+
+Usage: python benchmarks/bench_compression.py [repeat] [orders]
+"""
+
+import sys
+import time
+
+from harness import (
+    load_app,
+    logged_in_client,
+    seed_orders,
+    seed_products,
+    seed_user,
+    timed,
+)
+
+PAGES = ["/", "/shop", "/about", "/faq", "/orders"]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    app_module = load_app()
+    seed_products(app_module, 1000)
+    seed_orders(app_module, orders)
+    client = logged_in_client(
+        app_module, seed_user(app_module, accesslevel="fulfillment")
+    )
+
+    print(
+        "{:<8} {:>10} {:>10} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "page",
+            "identity",
+            "gzip",
+            "br",
+            "id ms",
+            "gzip ms",
+            "br ms",
+            "304 B",
+            "304 ms",
+        )
+    )
+    for page in PAGES:
+        sizes = []
+        times = []
+        for encoding in ["", "gzip", "br"]:
+            headers = {"Accept-Encoding": encoding}
+            response = client.get(page, headers=headers)
+            sizes.append(len(response.data))
+            times.append(timed(lambda: client.get(page, headers=headers), repeat) / 1e3)
+        headers = {"Accept-Encoding": "br", "If-None-Match": response.headers["ETag"]}
+        time.sleep(1.1)
+        revalidated = client.get(page, headers=headers)
+        assert revalidated.status_code == 304
+        print(
+            "{:<8} {:>10} {:>10} {:>10} {:>9.2f} {:>9.2f} {:>9.2f} {:>9} {:>9.2f}".format(
+                page,
+                *sizes,
+                *times,
+                len(revalidated.data),
+                timed(lambda: client.get(page, headers=headers), repeat) / 1e3,
+            )
+        )
+
+    print(
+        "\n{:<8} {:>12} {:>12} {:>10}".format("export", "first ms", "total ms", "KiB")
+    )
+    for encoding in ["", "gzip", "br"]:
+        start = time.perf_counter()
+        response = client.get(
+            "/orders/export?format=csv",
+            headers={"Accept-Encoding": encoding},
+            buffered=False,
+        )
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in chunks)
+        response.close()
+        print(
+            "{:<8} {:>12.1f} {:>12.1f} {:>10.0f}".format(
+                encoding or "identity",
+                first * 1e3,
+                (time.perf_counter() - start) * 1e3,
+                size / 1024,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Cost of the admin sales dashboard as the order history grows. For each size the orders
+table is extended and the summary tables rebuilt, then the script reports the time of the
+dashboard read from the summary tables, of the same figures computed from the orders table
+and of a full /admin request. It ends with the time to write a 3 line order with and
+without the summary table updates.
+
+Usage: python benchmarks/bench_dashboard.py [sizes] [repeat]
+sizes is a comma separated list of order counts, 10000,100000,300000 by default
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from harness import load_app, logged_in_client, seed_orders, seed_user, timed
+
+ORDER = {
+    "user_id": 1,
+    "username": "bench",
+    "email": "bench@bench",
+    "address": "Bench, 1 Bench Street, Dublin, D01 B3N4",
+    "items": [
+        {"code": "code{}".format(i), "name": "product{}".format(i), "price": i + 1}
+        for i in range(3)
+    ],
+}
+
+
+class NoSummaries:
+    def add_orders(self, conn, lines):
+        pass
+
+
+def write_orders(app_module, count):
+    """
+    :return: mean time in ms of writing an order in its own transaction
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        order = dict(ORDER, created_at=datetime.utcnow().isoformat())
+        order["items"] = [dict(item, quantity=i % 3 + 1) for item in ORDER["items"]]
+        with app_module.db.engine.begin() as conn:
+            app_module.write_order(conn, i, order)
+    return (time.perf_counter() - start) / count * 1e3
+
+
+def main():
+    sizes = [
+        int(size)
+        for size in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000,300000").split(
+            ","
+        )
+    ]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    app_module = load_app()
+    client = logged_in_client(app_module, seed_user(app_module, accesslevel="admin"))
+    summaries = app_module.summaries
+    Orders = app_module.Orders
+
+    print(
+        "{:>8} {:>12} {:>14} {:>14} {:>12}".format(
+            "orders", "rebuild s", "summary ms", "orders ms", "/admin ms"
+        )
+    )
+    seeded = 0
+    for size in sizes:
+        seed_orders(app_module, size - seeded, start=seeded)
+        seeded = size
+        with app_module.app.app_context():
+            start = time.perf_counter()
+            summaries.rebuild(Orders.__table__)
+            rebuilt = time.perf_counter() - start
+            from_summary = timed(summaries.dashboard, repeat) / 1e3
+            from_orders = timed(lambda: app_module.sales_summary(Orders.query), 3) / 1e3
+        page = timed(lambda: client.get("/admin"), repeat) / 1e3
+        print(
+            "{:>8} {:>12.2f} {:>14.2f} {:>14.2f} {:>12.2f}".format(
+                size, rebuilt, from_summary, from_orders, page
+            )
+        )
+
+    with app_module.app.app_context():
+        before = summaries.dashboard()
+        with_summaries = write_orders(app_module, 200)
+        after = summaries.dashboard()
+        assert (
+            sum(row.lines for row in after["statuses"])
+            == sum(row.lines for row in before["statuses"]) + 600
+        )
+        app_module.summaries = NoSummaries()
+        without_summaries = write_orders(app_module, 200)
+        app_module.summaries = summaries
+    print(
+        "\norder write: {:.2f} ms without summaries, {:.2f} ms with".format(
+            without_summaries, with_summaries
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Image weight of the rendered pages. Every page is rendered and the script adds up the bytes
+of the images a browser would download, first as the original files and then as the srcset
+candidates it would pick for the given viewport width and pixel density, after generating
+the derivatives with the same code as the build-images command.
+
+Usage: python benchmarks/bench_images.py [viewport_width] [pixel_ratio]
+"""
+
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+from harness import APP_DIR, load_app, logged_in_client, seed_products, seed_user
+
+STATIC_DIR = os.path.join(APP_DIR, "static")
+PAGES = ["/", "/shop", "/about", "/contact", "/faq", "/cart", "/login"]
+
+
+class ImageParser(HTMLParser):
+    """
+    Collects one (src, sources) pair per image, sources being the (mime type, srcset, sizes)
+    of the <source> tags of the enclosing <picture>.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.images = []
+        self.sources = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "picture":
+            self.sources = []
+        elif tag == "source" and self.sources is not None:
+            self.sources.append(
+                (attrs["type"], attrs["srcset"], attrs.get("sizes", ""))
+            )
+        elif tag == "img" and attrs.get("src", "").startswith("/static/images/"):
+            self.images.append((attrs["src"], self.sources or []))
+
+    def handle_endtag(self, tag):
+        if tag == "picture":
+            self.sources = None
+
+
+def slot_width(sizes, viewport):
+    """
+    :return: width in css pixels of the first matching entry of a sizes attribute
+    """
+    for entry in sizes.split(","):
+        entry = entry.strip()
+        condition = re.match(r"\(min-width:\s*(\d+)px\)\s*(.*)", entry)
+        if condition:
+            if viewport < int(condition.group(1)):
+                continue
+            entry = condition.group(2)
+        value = re.match(r"(\d+(?:\.\d+)?)(px|vw)", entry)
+        if value:
+            number = float(value.group(1))
+            return number if value.group(2) == "px" else viewport * number / 100
+    return viewport
+
+
+def file_size(url):
+    path = os.path.join(STATIC_DIR, url[len("/static/") :])
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+
+def chosen_size(sources, viewport, pixel_ratio):
+    """
+    :return: bytes of the candidate of the first source a browser would download
+    """
+    _, srcset, sizes = sources[0]
+    wanted = slot_width(sizes, viewport) * pixel_ratio
+    candidates = sorted(
+        (int(width[:-1]), url)
+        for url, width in (candidate.split() for candidate in srcset.split(","))
+    )
+    for width, url in candidates:
+        if width >= wanted:
+            return file_size(url)
+    return file_size(candidates[-1][1])
+
+
+def main():
+    viewport = int(sys.argv[1]) if len(sys.argv) > 1 else 1280
+    pixel_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+    app_module = load_app()
+    seed_products(app_module, 24)
+    user_id = seed_user(app_module)
+    client = logged_in_client(app_module, user_id)
+    client.post("/add", data={"code": "code1", "quantity": "1"})
+
+    start = time.perf_counter()
+    built = [name for name, image_set in app_module.images.build() if image_set]
+    print(
+        "built derivatives of {} images in {:.1f}s\n".format(
+            len(built), time.perf_counter() - start
+        )
+    )
+    print(
+        "{:<10} {:>7} {:>14} {:>14} {:>8}".format(
+            "page", "images", "original KiB", "srcset KiB", "saved"
+        )
+    )
+    for page in PAGES:
+        parser = ImageParser()
+        parser.feed(client.get(page).get_data(as_text=True))
+        original = sum(file_size(src) for src, _ in parser.images)
+        derived = sum(
+            chosen_size(sources, viewport, pixel_ratio) if sources else file_size(src)
+            for src, sources in parser.images
+        )
+        print(
+            "{:<10} {:>7} {:>14.0f} {:>14.0f} {:>7.1f}%".format(
+                page,
+                len(parser.images),
+                original / 1024,
+                derived / 1024,
+                100 - derived * 100 / original if original else 0,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
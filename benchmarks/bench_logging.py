@@ -0,0 +1,112 @@
+"""
+Request latency with logging disabled, with records written straight to the file by the
+request threads as before, and with the queue and listener thread of log_queue.py. Every
+request is access logged and a share of them also logs an exception, from several threads
+at once. The script reports p50/p99 latency per mode and the lines written.
+
+Usage: python benchmarks/bench_logging.py [threads] [requests] [error_every]
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from harness import load_app, percentile
+
+MODES = ["disabled", "sync", "queue"]
+
+
+def use_sync_handler(path):
+    """
+    Writes every record on the calling thread, with the same JSON format and request fields.
+    """
+    from log_queue import JSONFormatter, RequestContextFilter, stop_logging
+
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(JSONFormatter())
+    handler.addFilter(RequestContextFilter())
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def run(app_module, threads, requests, error_every):
+    """
+    :return: list of request latencies in ms
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        test_client = app_module.app.test_client()
+        test_client.environ_base["wsgi.url_scheme"] = "https"
+        own = []
+        for i in range(requests):
+            start = time.perf_counter()
+            if error_every and i % error_every == 0:
+                with app_module.app.test_request_context("/about"):
+                    try:
+                        raise ValueError("benchmark error {}".format(i))
+                    except ValueError as e:
+                        logging.exception(e)
+            test_client.get("/about")
+            own.append((time.perf_counter() - start) * 1e3)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    error_every = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(
+        "{:<10} {:>10} {:>10} {:>10} {:>12}".format(
+            "mode", "p50 ms", "p99 ms", "total s", "log lines"
+        )
+    )
+    for mode in MODES:
+        app_module = load_app(
+            extra_config="[logging]\n enabled = {}\n access_sample = 1\n".format(
+                mode != "disabled"
+            )
+        )
+        path = os.path.abspath("spwebapp.log")
+        if mode == "sync":
+            use_sync_handler(path)
+        run(app_module, threads, 20, 0)
+        start = time.perf_counter()
+        latencies = run(app_module, threads, requests, error_every)
+        total = time.perf_counter() - start
+        from log_queue import stop_logging
+
+        stop_logging()
+        logging.getLogger().handlers[0].close()
+        lines = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as log_file:
+                lines = sum(1 for _ in log_file)
+        print(
+            "{:<10} {:>10.2f} {:>10.2f} {:>10.2f} {:>12}".format(
+                mode,
+                percentile(latencies, 50),
+                percentile(latencies, 99),
+                total,
+                lines,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Load test for the password hashing pool. Concurrent clients log in while others fetch the
+about page, and the script reports p50/p99 latency for both along with the number of 503
+answers, first with hashes run inline and then with the configured worker pool.
+
+Usage: python benchmarks/bench_login_load.py [login_clients] [page_clients] [seconds]
+"""
+
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from harness import BENCH_PASSWORD, load_app, percentile, seed_user, serve
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_clients(send, clients, seconds):
+    """
+    :return: list of latencies in ms and number of 503 answers
+    """
+    latencies = []
+    busy = [0]
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                send()
+            except urllib.error.HTTPError as error:
+                if error.code == 503:
+                    busy[0] += 1
+                    continue
+                if error.code != 302:
+                    raise
+            latencies.append((time.perf_counter() - start) * 1e3)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads, latencies, busy
+
+
+def main():
+    login_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    page_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    app_module = load_app()
+    from hashing import PasswordHasher
+
+    seed_user(app_module)
+    base_url = serve(app_module)
+    opener = urllib.request.build_opener(NoRedirect)
+    form = urllib.parse.urlencode(
+        {"username": "bench", "password": BENCH_PASSWORD}
+    ).encode()
+
+    def login():
+        opener.open(base_url + "/login", data=form).read()
+
+    def page():
+        opener.open(base_url + "/about").read()
+
+    configured = app_module.hasher
+    print(
+        "{:<8} {:>10} {:>10} {:>8} {:>10} {:>10}".format(
+            "mode", "login p50", "login p99", "503s", "page p50", "page p99"
+        )
+    )
+    for mode, hasher in [
+        ("inline", PasswordHasher(rounds=configured.rounds, workers=0)),
+        ("pool", configured),
+    ]:
+        app_module.hasher = hasher
+        login_threads, login_ms, busy = run_clients(login, login_clients, seconds)
+        page_threads, page_ms, _ = run_clients(page, page_clients, seconds)
+        for thread in login_threads + page_threads:
+            thread.join()
+        print(
+            "{:<8} {:>10.1f} {:>10.1f} {:>8} {:>10.1f} {:>10.1f}".format(
+                mode,
+                percentile(login_ms, 50),
+                percentile(login_ms, 99),
+                busy[0],
+                percentile(page_ms, 50),
+                percentile(page_ms, 99),
+            )
+        )
+    configured.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Overhead of the request metrics and what they report. The script first times a few routes
+with metrics disabled and enabled, then runs a mixed shop / cart / add-to-cart / login
+workload and prints, per endpoint, the request count and mean latency, SQL statements, SQL
+time and response size read back from the /metrics endpoint.
+
+Usage: python benchmarks/bench_metrics.py [repeat] [products]
+"""
+
+import re
+import sys
+
+from harness import (
+    BENCH_PASSWORD,
+    load_app,
+    logged_in_client,
+    seed_products,
+    seed_user,
+    timed,
+)
+
+SAMPLE = re.compile(r'^(\w+)_(sum|count)\{endpoint="(\w+)"[^}]*\} (\S+)$')
+
+
+def read_means(text):
+    """
+    :param text: /metrics response body
+    :return: dict of endpoint to dict of metric name to mean value
+    """
+    sums = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            name, kind, endpoint, value = match.groups()
+            entry = sums.setdefault(endpoint, {}).setdefault(name, [0.0, 0])
+            entry[0 if kind == "sum" else 1] += float(value)
+    return {
+        endpoint: {name: total / count for name, (total, count) in values.items()}
+        for endpoint, values in sums.items()
+    }
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    products = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    app_module = load_app(extra_config="[bcrypt]\n rounds = 4\n workers = 0\n")
+    seed_products(app_module, products)
+    admin = logged_in_client(
+        app_module, seed_user(app_module, "admin", accesslevel="admin")
+    )
+    client = logged_in_client(app_module, seed_user(app_module))
+    form = {"code": "code1", "quantity": "1"}
+    configured = app_module.metrics
+
+    print("{:<12} {:>12} {:>12}".format("request", "off us", "on us"))
+    for label, send in [
+        ("GET /about", lambda: client.get("/about")),
+        ("GET /shop", lambda: client.get("/shop")),
+        ("POST /add", lambda: client.post("/add", data=form)),
+    ]:
+        app_module.metrics = None
+        disabled = timed(send, repeat)
+        app_module.metrics = configured
+        print("{:<12} {:>12.1f} {:>12.1f}".format(label, disabled, timed(send, repeat)))
+
+    anonymous = app_module.app.test_client()
+    anonymous.environ_base["wsgi.url_scheme"] = "https"
+    login = {"username": "bench", "password": BENCH_PASSWORD}
+    for i in range(repeat):
+        client.get("/shop")
+        client.post(
+            "/add", data={"code": "code{}".format(i % products), "quantity": "1"}
+        )
+        client.get("/cart")
+        if i % 10 == 0:
+            anonymous.post("/login", data=login)
+    response = admin.get("/metrics", headers={"Accept-Encoding": ""})
+    scrape = timed(lambda: admin.get("/metrics"), 20)
+    print(
+        "\n/metrics: {} bytes, scraped in {:.0f} us\n".format(
+            len(response.data), scrape
+        )
+    )
+    print(
+        "{:<22} {:>8} {:>10} {:>9} {:>10} {:>10}".format(
+            "endpoint", "count", "mean ms", "queries", "sql ms", "bytes"
+        )
+    )
+    means = read_means(response.get_data(as_text=True))
+    counts = {}
+    for line in response.get_data(as_text=True).splitlines():
+        match = re.match(r'^spwebapp_requests_total\{endpoint="(\w+)".*\} (\d+)$', line)
+        if match:
+            counts[match.group(1)] = counts.get(match.group(1), 0) + int(match.group(2))
+    for endpoint in ["shop", "cart_load", "add_product_to_cart", "login"]:
+        values = means.get(endpoint, {})
+        print(
+            "{:<22} {:>8} {:>10.2f} {:>9.1f} {:>10.2f} {:>10.0f}".format(
+                endpoint,
+                counts.get(endpoint, 0),
+                values.get("spwebapp_request_duration_seconds", 0) * 1e3,
+                values.get("spwebapp_request_queries", 0),
+                values.get("spwebapp_request_sql_seconds", 0) * 1e3,
+                values.get("spwebapp_response_size_bytes", 0),
+            )
+        )
+    bcrypt = re.search(
+        r'spwebapp_bcrypt_duration_seconds_count\{operation="check"\} (\d+)',
+        response.get_data(as_text=True),
+    )
+    print("\nbcrypt checks recorded: {}".format(bcrypt.group(1) if bcrypt else 0))
+
+
+if __name__ == "__main__":
+    main()
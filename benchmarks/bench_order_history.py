@@ -0,0 +1,95 @@
+"""
+Cost of the per-user order history and of the admin sales figures. Orders are spread over
+many users, then the script reports the time of a /my_orders request and of its query, with
+the query plan SQLite picks, and the time of the sales figures computed by pulling every
+order into Python compared with the SUM/GROUP BY queries of sales_summary and a full
+/admin/sales request.
+
+Usage: python benchmarks/bench_order_history.py [orders] [users] [repeat]
+"""
+
+import sys
+import time
+from collections import Counter
+
+from harness import load_app, logged_in_client, seed_orders, seed_user, timed
+
+
+def python_summary(main):
+    """
+    Sales figures computed the way a Python loop over the orders table would.
+    """
+    revenue = Counter()
+    units = Counter()
+    for order in main.Orders.query.all():
+        revenue[order.status] += int(order.price) * int(order.quantity)
+        units[order.product] += int(order.quantity)
+    return sum(revenue.values()), units.most_common(10)
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    app_module = load_app()
+    shopper = seed_user(app_module)
+    admin = seed_user(app_module, "admin", accesslevel="admin")
+    # the other ids only spread the orders, SQLite does not enforce the foreign key
+    seed_orders(app_module, orders, user_ids=[shopper] + list(range(1000, 999 + users)))
+    client = logged_in_client(app_module, shopper)
+    admin_client = logged_in_client(app_module, admin)
+    Orders = app_module.Orders
+
+    print("{} orders over {} users\n".format(orders, users))
+    with app_module.app.app_context():
+        history = (
+            Orders.query.filter(Orders.user_id == shopper)
+            .with_entities(*app_module.MY_ORDER_COLUMNS)
+            .order_by(Orders.order_id.desc())
+            .limit(25)
+        )
+        plan = app_module.db.session.execute(
+            app_module.db.text(
+                "EXPLAIN QUERY PLAN "
+                + str(history.statement.compile(compile_kwargs={"literal_binds": True}))
+            )
+        ).all()
+        print("my orders plan: {}".format("; ".join(row[-1] for row in plan)))
+        print("{:<34} {:>12}".format("", "ms"))
+        print(
+            "{:<34} {:>12.2f}".format(
+                "my orders query", timed(lambda: history.all(), repeat) / 1e3
+            )
+        )
+        start = time.perf_counter()
+        total, _ = python_summary(app_module)
+        print(
+            "{:<34} {:>12.2f}".format(
+                "sales, Python loop", (time.perf_counter() - start) * 1e3
+            )
+        )
+        summary = app_module.sales_summary(Orders.query)
+        assert summary["totals"].revenue == total
+        print(
+            "{:<34} {:>12.2f}".format(
+                "sales, SUM/GROUP BY",
+                timed(lambda: app_module.sales_summary(Orders.query), 5) / 1e3,
+            )
+        )
+
+    # requests run outside the app context above, they would share its g otherwise
+    print(
+        "{:<34} {:>12.2f}".format(
+            "GET /my_orders", timed(lambda: client.get("/my_orders"), repeat) / 1e3
+        )
+    )
+    print(
+        "{:<34} {:>12.2f}".format(
+            "GET /admin/sales?status=shipped",
+            timed(lambda: admin_client.get("/admin/sales?status=shipped"), 5) / 1e3,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures peak Python memory while streaming the /orders/export csv and ndjson exports, and the
+time to render one /orders page, as the orders table grows. Peak memory should stay flat.
+
+Usage: python benchmarks/bench_orders_export.py [largest_table_size]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from harness import load_app, logged_in_client, seed_orders, seed_user, timed
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    sizes = [size for size in (10000, 100000, 300000) if size < largest] + [largest]
+    app_module = load_app()
+    client = logged_in_client(
+        app_module, seed_user(app_module, "benchfulfil", "fulfillment")
+    )
+    seeded = 0
+    print(
+        "{:>8} {:>8} {:>12} {:>14} {:>14}".format(
+            "orders", "format", "export s", "peak KiB", "page ms"
+        )
+    )
+    for size in sizes:
+        seed_orders(app_module, size - seeded, start=seeded)
+        seeded = size
+        page_ms = timed(lambda: client.get("/orders?after={}".format(size // 2)), 20)
+        for export_format in ("csv", "ndjson"):
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = client.get(
+                "/orders/export?format={}".format(export_format), buffered=False
+            )
+            exported = sum(len(chunk) for chunk in response.response)
+            response.close()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            print(
+                "{:>8} {:>8} {:>12.2f} {:>14.0f} {:>14.2f}".format(
+                    size, export_format, elapsed, peak, page_ms / 1e3
+                )
+            )
+            assert exported > size
+
+
+if __name__ == "__main__":
+    main()
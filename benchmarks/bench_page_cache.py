@@ -0,0 +1,43 @@
+"""
+Cost of the pages served through the page cache. For each page the script reports the time
+of a full request with the cache disabled and enabled, and the time of the cache lookup alone,
+then the hit/miss counters of the cache.
+
+Usage: python benchmarks/bench_page_cache.py [repeat]
+"""
+
+import sys
+
+from harness import load_app, timed
+
+PAGES = [("/", "index.html"), ("/about", "about.html"), ("/contact", "contact.html")]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    app_module = load_app()
+    from page_cache import PageCache
+
+    client = app_module.app.test_client()
+    configured = app_module.pages
+    disabled = PageCache(ttl=0)
+    print(
+        "{:<10} {:>14} {:>14} {:>14}".format(
+            "page", "uncached us", "cached us", "lookup us"
+        )
+    )
+    for url, template in PAGES:
+        app_module.pages = disabled
+        uncached = timed(lambda: client.get(url), repeat)
+        app_module.pages = configured
+        cached = timed(lambda: client.get(url), repeat)
+        with app_module.app.test_request_context(url):
+            lookup = timed(lambda: app_module.render_page(template), repeat)
+        print(
+            "{:<10} {:>14.1f} {:>14.1f} {:>14.1f}".format(url, uncached, cached, lookup)
+        )
+    print("\n{}".format(configured.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Concurrency test for the connection pool settings of the [sql] section. Client threads
+fetch the cart page, which reads the SQL cart store, while the pool is sized from small
+to large; the script reports throughput, p99 latency and the checkout waits and timeouts
+recorded by the pool.
+
+Usage: python benchmarks/bench_pool.py [clients] [seconds]
+"""
+
+import sys
+import threading
+import time
+
+from harness import load_app, logged_in_client, percentile, seed_products, seed_user
+
+SETTINGS = [(2, 0), (4, 0), (5, 5), (10, 10)]
+
+
+def pool_config(pool_size, max_overflow):
+    return "pool_size = {}\nmax_overflow = {}\npool_timeout = 2\n".format(
+        pool_size, max_overflow
+    )
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    app_module = load_app(extra_config=pool_config(*SETTINGS[0]))
+    seed_products(app_module, 100)
+    user_id = seed_user(app_module)
+    config_path = app_module.os.environ["SPWEBAPP_CONFIG"]
+    with open(config_path) as config_file:
+        base_config = config_file.read().split("pool_size")[0]
+    print(
+        "{:>5} {:>9} {:>8} {:>8} {:>8} {:>12} {:>12} {:>9}".format(
+            "size",
+            "overflow",
+            "req/s",
+            "p99 ms",
+            "errors",
+            "mean wait ms",
+            "max wait ms",
+            "timeouts",
+        )
+    )
+    for pool_size, max_overflow in SETTINGS:
+        with open(config_path, "w") as config_file:
+            config_file.write(base_config + pool_config(pool_size, max_overflow))
+        app_module.app = app_module.create_app(config_path)
+        app_module.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+        latencies = []
+        errors = [0]
+        deadline = time.monotonic() + seconds
+
+        def client():
+            http = logged_in_client(app_module, user_id)
+            http.post("/add", data={"code": "code1", "quantity": "1"})
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                if http.get("/cart").status_code != 200:
+                    errors[0] += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1e3)
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app_module.app.app_context():
+            stats = app_module.pool_stats(app_module.db.engine)
+        print(
+            "{:>5} {:>9} {:>8.1f} {:>8.1f} {:>8} {:>12.3f} {:>12.1f} {:>9}".format(
+                pool_size,
+                max_overflow,
+                len(latencies) / seconds,
+                percentile(latencies, 99),
+                errors[0],
+                stats["mean_wait"] * 1e3,
+                stats["max_wait"] * 1e3,
+                stats["timeouts"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
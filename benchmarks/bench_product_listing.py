@@ -0,0 +1,53 @@
+"""
+Compares render time and response size of the paginated /shop and /admin listings with
+rendering the whole catalog in one page, against a 50k product table.
+
+Usage: python benchmarks/bench_product_listing.py [catalog_size] [requests]
+"""
+
+import sys
+import time
+
+from harness import load_app, logged_in_client, seed_products, seed_user, timed
+
+
+def main():
+    catalog_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    app_module = load_app()
+    from pagination import KeysetPage
+
+    seed_products(app_module, catalog_size)
+    shop_client = logged_in_client(app_module, seed_user(app_module))
+    admin_client = logged_in_client(
+        app_module, seed_user(app_module, "benchadmin", "admin")
+    )
+
+    print("{:<34} {:>12} {:>14}".format("listing", "ms per page", "bytes"))
+    for label, client, url in [
+        ("/shop first page", shop_client, "/shop"),
+        ("/shop deep page", shop_client, "/shop?after={}".format(catalog_size - 100)),
+        ("/shop brand filter", shop_client, "/shop?brand=brand7"),
+        ("/shop price range", shop_client, "/shop?min_price=100&max_price=120"),
+        ("/admin first page", admin_client, "/admin"),
+    ]:
+        start = time.perf_counter()
+        size = len(client.get(url).data)
+        cold = (time.perf_counter() - start) * 1e3
+        warm = timed(lambda: client.get(url), repeat) / 1e3
+        print("{:<34} {:>12.2f} {:>14}".format(label + " (cold)", cold, size))
+        print("{:<34} {:>12.2f} {:>14}".format(label + " (cached)", warm, size))
+
+    # render the whole catalog into one page, as the listings did before pagination
+    with app_module.app.test_request_context("/shop"):
+        app_module.app.preprocess_request()
+        products = app_module.catalog.all()
+        page = KeysetPage(products, lambda row: row.id, False, False, {})
+        start = time.perf_counter()
+        html = app_module.render_template("shop.html", products=products, page=page)
+        elapsed = (time.perf_counter() - start) * 1e3
+    print("{:<34} {:>12.2f} {:>14}".format("/shop whole catalog", elapsed, len(html)))
+
+
+if __name__ == "__main__":
+    main()
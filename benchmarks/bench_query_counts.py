@@ -0,0 +1,45 @@
+"""
+Reports the number of database queries made by each authenticated page, using the
+X-Query-Count header. The second request to a page shows the cost with warm caches.
+
+Usage: python benchmarks/bench_query_counts.py
+"""
+
+from harness import load_app, logged_in_client, seed_orders, seed_products, seed_user
+
+
+def main():
+    app_module = load_app()
+    app_module.app.config["QUERY_COUNT_HEADER"] = True
+    seed_products(app_module, 100)
+    seed_orders(app_module, 100)
+    customer = logged_in_client(app_module, seed_user(app_module))
+    admin = logged_in_client(app_module, seed_user(app_module, "benchadmin", "admin"))
+    fulfillment = logged_in_client(
+        app_module, seed_user(app_module, "benchfulfil", "fulfillment")
+    )
+
+    print("{:<22} {:>8} {:>8}".format("request", "first", "second"))
+    for label, send in [
+        ("GET /shop", lambda: customer.get("/shop")),
+        (
+            "POST /add",
+            lambda: customer.post("/add", data={"code": "code1", "quantity": "1"}),
+        ),
+        ("GET /cart", lambda: customer.get("/cart")),
+        ("GET /admin", lambda: admin.get("/admin")),
+        ("GET /orders", lambda: fulfillment.get("/orders")),
+        (
+            "POST /cart",
+            lambda: customer.post(
+                "/cart",
+                data={"fullname": "a", "address": "b", "city": "c", "eir": "d"},
+            ),
+        ),
+    ]:
+        counts = [send().headers["X-Query-Count"] for _ in range(2)]
+        print("{:<22} {:>8} {:>8}".format(label, *counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Read replica routing with two SQLite files standing in for the primary and a replica, plus
+a replica that cannot be opened. The primary is seeded and copied to the replica, then the
+script checks that /my_orders reads the replica, that the shopper's reads stay on the
+primary after a checkout, and that the replica which cannot be opened is skipped. It ends
+with the POST /cart latency while admins keep reading /admin/sales, with the reads on the
+primary and on the replica.
+
+Usage: python benchmarks/bench_replicas.py [orders] [checkouts] [readers]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from harness import (
+    load_app,
+    logged_in_client,
+    percentile,
+    seed_orders,
+    seed_products,
+    seed_user,
+)
+
+FORM = {
+    "fullname": "Bench",
+    "address": "1 Bench Street",
+    "city": "Dublin",
+    "eir": "D01",
+}
+
+
+def copy_database(source, target):
+    """
+    Copies the SQLite file source to target, as replication would.
+    """
+    with sqlite3.connect(source) as primary, sqlite3.connect(target) as replica:
+        primary.backup(replica)
+    primary.close()
+    replica.close()
+
+
+def setup(orders, replicas):
+    """
+    :return: app module, shopper id and admin id, with orders seeded and the primary
+    copied to replica.db when replicas is set
+    """
+    workdir = tempfile.mkdtemp(prefix="spwebapp-bench-")
+    extra = ""
+    if replicas:
+        extra = (
+            "replicas = sqlite:///{}, sqlite:///file:{}?mode=ro&uri=true\n"
+            "replica_health_interval = 1\n"
+        ).format(
+            os.path.join(workdir, "replica.db"), os.path.join(workdir, "missing.db")
+        )
+    app_module = load_app(workdir, extra)
+    seed_products(app_module, 1000)
+    shopper = seed_user(app_module)
+    admin = seed_user(app_module, "admin", accesslevel="admin")
+    seed_orders(app_module, orders, user_ids=[shopper, 1000, 1001, 1002])
+    if replicas:
+        copy_database(
+            os.path.join(workdir, "bench.db"), os.path.join(workdir, "replica.db")
+        )
+    return app_module, shopper, admin
+
+
+def add_product(app_module, code, name):
+    with app_module.app.app_context():
+        app_module.db.session.add(
+            app_module.Products(
+                code=code, name=name, brand="bench", price=10, image="chair.png"
+            )
+        )
+        app_module.bump_catalog_version()
+        app_module.db.session.commit()
+
+
+def check_out(app_module, client, code, token):
+    """
+    :return: POST /cart latency in ms
+    """
+    client.post("/add", data={"code": code, "quantity": "1"})
+    start = time.perf_counter()
+    client.post("/cart", data=dict(FORM, checkout_token=token))
+    latency = (time.perf_counter() - start) * 1e3
+    client.get("/empty")
+    return latency
+
+
+def drain(app_module):
+    with app_module.app.app_context():
+        while app_module.checkouts.stats()["pending"]:
+            time.sleep(0.01)
+
+
+def routing(orders):
+    app_module, shopper, _ = setup(orders, replicas=True)
+    replicas = app_module.app.extensions["replicas"]
+    shopper_client = logged_in_client(app_module, shopper)
+    other_session = logged_in_client(app_module, shopper)
+
+    add_product(app_module, "replicated", "replicated chair")
+    check_out(app_module, shopper_client, "replicated", "replicated")
+    drain(app_module)
+    page = shopper_client.get("/my_orders").get_data(as_text=True)
+    print("order placed after the copy, seen by:")
+    print("  the shopper right after checkout: {}".format("replicated chair" in page))
+    page = other_session.get("/my_orders").get_data(as_text=True)
+    print("  another session of the shopper:   {}".format("replicated chair" in page))
+    print("\nreplicas:")
+    for replica in replicas.stats():
+        print(
+            "  {:<60} healthy={:<6} picks={}".format(
+                replica["url"], str(replica["healthy"]), replica["picks"]
+            )
+        )
+    replicas.stop()
+    app_module.checkouts.stop()
+
+
+def contention(orders, checkouts, readers, replicas):
+    """
+    :return: p50 and p99 POST /cart latency in ms while readers threads load /admin/sales
+    """
+    app_module, shopper, admin = setup(orders, replicas)
+    client = logged_in_client(app_module, shopper)
+    stopping = threading.Event()
+    reads = []
+
+    def read():
+        admin_client = logged_in_client(app_module, admin)
+        while not stopping.is_set():
+            admin_client.get("/admin/sales")
+            reads.append(1)
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    latencies = [
+        check_out(app_module, client, "code{}".format(i % 1000), "bench{}".format(i))
+        for i in range(checkouts)
+    ]
+    stopping.set()
+    for thread in threads:
+        thread.join()
+    drain(app_module)
+    if replicas:
+        app_module.app.extensions["replicas"].stop()
+    app_module.checkouts.stop()
+    return percentile(latencies, 50), percentile(latencies, 99), len(reads)
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    checkouts = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    routing(orders)
+    print(
+        "\n{:<10} {:>12} {:>12} {:>14}".format(
+            "reads on", "cart p50 ms", "cart p99 ms", "/admin/sales"
+        )
+    )
+    for replicas in [False, True]:
+        p50, p99, reads = contention(orders, checkouts, readers, replicas)
+        print(
+            "{:<10} {:>12.2f} {:>12.2f} {:>14}".format(
+                "replica" if replicas else "primary", p50, p99, reads
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
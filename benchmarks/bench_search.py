@@ -0,0 +1,167 @@
+"""
+Cost of product search. The catalog is seeded with products named from a small vocabulary,
+like a real furniture catalog, then the script reports for a set of queries the time of a
+SQL LIKE query ordered by price, of the in-process search index alone and of a full /search
+request, and checks both return the same products. It ends with the time to build the index
+and to apply a product change to it.
+
+Usage: python benchmarks/bench_search.py [products] [repeat]
+"""
+
+import sys
+import time
+
+from harness import load_app, logged_in_client, seed_user, timed
+
+COLOURS = ["black", "white", "oak", "walnut", "grey", "green", "navy", "cream"]
+STYLES = ["modern", "classic", "rustic", "nordic", "vintage", "industrial"]
+ITEMS = [
+    "chair",
+    "chaise",
+    "table",
+    "sofa",
+    "stool",
+    "bench",
+    "desk",
+    "lamp",
+    "shelf",
+    "cabinet",
+    "bed",
+    "mirror",
+    "rug",
+    "armchair",
+    "dresser",
+    "wardrobe",
+]
+
+# (query text, extra /search arguments)
+QUERIES = [
+    ("chair", {}),
+    ("ch", {}),
+    ("oak table", {}),
+    ("walnut nordic desk", {}),
+    ("sofa", {"min_price": 100, "max_price": 120}),
+    ("brand7 lamp", {}),
+    ("", {"min_price": 250, "max_price": 260}),
+    ("zebra", {}),
+]
+
+
+def seed_catalog(main, count):
+    """
+    Bulk inserts count products with generated "<style> <colour> <item> <n>" names.
+    """
+    with main.app.app_context():
+        for start in range(0, count, 5000):
+            rows = [
+                {
+                    "name": "{} {} {} {}".format(
+                        STYLES[i % len(STYLES)],
+                        COLOURS[i // 7 % len(COLOURS)],
+                        ITEMS[i // 3 % len(ITEMS)],
+                        i,
+                    ),
+                    "brand": "brand{}".format(i % 50),
+                    "code": "code{}".format(i),
+                    "price": i * 7919 % 500 + 1,
+                    "image": "chair.png",
+                }
+                for i in range(start, min(start + 5000, count))
+            ]
+            main.db.session.execute(main.Products.__table__.insert(), rows)
+        main.bump_catalog_version()
+        main.db.session.commit()
+
+
+def like_query(main, text, args, limit):
+    """
+    Search as a SQL query would do it, one LIKE per query word on the name and brand.
+    """
+    query = main.Products.query
+    for word in text.split():
+        pattern = "%{}%".format(word)
+        query = query.filter(
+            main.Products.name.like(pattern) | main.Products.brand.like(pattern)
+        )
+    if "min_price" in args:
+        query = query.filter(main.Products.price >= args["min_price"])
+    if "max_price" in args:
+        query = query.filter(main.Products.price <= args["max_price"])
+    return query.order_by(main.Products.price, main.Products.code).limit(limit).all()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    app_module = load_app()
+    seed_catalog(app_module, count)
+    client = logged_in_client(app_module, seed_user(app_module))
+    index = app_module.search_index
+
+    with app_module.app.app_context():
+        start = time.perf_counter()
+        index.sync(app_module.catalog.current_version())
+        built = time.perf_counter() - start
+        print("{} products, {} words\n".format(count, index.stats()["words"]))
+        print(
+            "{:<28} {:>10} {:>12} {:>12} {:>12}".format(
+                "query", "results", "LIKE us", "index us", "/search us"
+            )
+        )
+        for text, args in QUERIES:
+            found, _ = index.search(
+                text,
+                min_price=args.get("min_price"),
+                max_price=args.get("max_price"),
+                limit=24,
+            )
+            # LIKE matches inside words too, compare with the rows starting a word only
+            expected = [
+                product.code
+                for product in like_query(app_module, text, args, count)
+                if all(
+                    any(
+                        word.startswith(term)
+                        for word in "{} {}".format(product.name, product.brand)
+                        .lower()
+                        .split()
+                    )
+                    for term in text.split()
+                )
+            ][:24]
+            assert [product.code for product in found] == expected, text
+            sql = timed(lambda: like_query(app_module, text, args, 25), repeat // 10)
+            indexed = timed(
+                lambda: index.search(
+                    text,
+                    min_price=args.get("min_price"),
+                    max_price=args.get("max_price"),
+                    limit=24,
+                ),
+                repeat,
+            )
+            url = "/search?" + "&".join(
+                "{}={}".format(key, value)
+                for key, value in dict(args, q=text.replace(" ", "+")).items()
+            )
+            request = timed(lambda: client.get(url), repeat // 10)
+            print(
+                "{:<28} {:>10} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                    text or "(price range)", len(found), sql, indexed, request
+                )
+            )
+
+        product = app_module.load_product("code1")
+        version = index.version
+        start = time.perf_counter()
+        for step in range(1, repeat + 1):
+            index.updated(
+                version + step,
+                products=[product._replace(name="{} {}".format(product.name, step))],
+            )
+        updated = (time.perf_counter() - start) / repeat * 1e6
+    print("\nindex build: {:.2f} s, product update: {:.1f} us".format(built, updated))
+
+
+if __name__ == "__main__":
+    main()
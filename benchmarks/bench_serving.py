@@ -0,0 +1,151 @@
+"""
+Compares the development server started by main.py (app.run with an adhoc certificate)
+with gunicorn serving wsgi.py using gunicorn.conf.py. For each server the script reports
+the time from spawning the process to the first answered request, then the throughput
+and p50/p99 latency of concurrent clients fetching the about page.
+
+Usage: python benchmarks/bench_serving.py [clients] [seconds] [gunicorn_workers]
+"""
+
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from harness import APP_DIR, load_app, percentile
+
+TLS = ssl.create_default_context()
+TLS.check_hostname = False
+TLS.verify_mode = ssl.CERT_NONE
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, context=TLS, timeout=10) as response:
+        response.read()
+
+
+def start(command, url, workdir):
+    """
+    Spawns the server and polls url until it answers.
+    :return: the process and the seconds it took to answer the first request
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError("{} exited with {}".format(command, process.returncode))
+        try:
+            fetch(url)
+            return process, time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, ssl.SSLError):
+            time.sleep(0.05)
+
+
+def load(url, clients, seconds):
+    """
+    :return: list of latencies in ms and number of failed requests
+    """
+    latencies = []
+    errors = [0]
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            begin = time.perf_counter()
+            try:
+                fetch(url)
+            except (urllib.error.URLError, ConnectionError, ssl.SSLError):
+                errors[0] += 1
+                continue
+            latencies.append((time.perf_counter() - begin) * 1e3)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    workdir = tempfile.mkdtemp(prefix="spwebapp-bench-")
+    # creates the config, the tables and the catalog version row used by both servers
+    load_app(workdir)
+    dev_port = free_port()
+    gunicorn_port = free_port()
+    config_path = os.path.join(workdir, "config.ini")
+    with open(config_path) as config_file:
+        config = config_file.read().replace("port = 8000", "port = {}".format(dev_port))
+    config += "[server]\nhost = 127.0.0.1\nport = {}\nworkers = {}\n".format(
+        gunicorn_port, workers
+    )
+    with open(config_path, "w") as config_file:
+        config_file.write(config)
+
+    servers = [
+        (
+            "app.run",
+            [sys.executable, os.path.join(APP_DIR, "main.py")],
+            "https://127.0.0.1:{}/about".format(dev_port),
+        ),
+        (
+            "gunicorn",
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "--pythonpath",
+                APP_DIR,
+                "-c",
+                os.path.join(APP_DIR, "gunicorn.conf.py"),
+                "wsgi:app",
+            ],
+            "http://127.0.0.1:{}/about".format(gunicorn_port),
+        ),
+    ]
+    print(
+        "{:<10} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+            "server", "startup s", "req/s", "p50 ms", "p99 ms", "errors"
+        )
+    )
+    for name, command, url in servers:
+        process, startup = start(command, url, workdir)
+        try:
+            latencies, errors = load(url, clients, seconds)
+        finally:
+            process.terminate()
+            process.wait()
+        print(
+            "{:<10} {:>10.2f} {:>10.1f} {:>10.1f} {:>10.1f} {:>8}".format(
+                name,
+                startup,
+                len(latencies) / seconds,
+                percentile(latencies, 50),
+                percentile(latencies, 99),
+                errors,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Checkout contention on a single product. Buyers fill their carts with one unit of the same
+product, then all POST /cart at once. For an untracked stock, a stock covering every buyer
+and a stock of half the buyers the script reports the checkout throughput, p50/p99 latency,
+the checkouts that sold and those sent back as sold out, and checks that the units sold
+never exceed the stock and match the orders written by the order queue workers. A last run
+replaces the conditional decrement with a read of the stock followed by an update, to show
+the units it oversells.
+
+Usage: python benchmarks/bench_stock.py [buyers]
+"""
+
+import sys
+import threading
+import time
+
+from sqlalchemy import select, update
+
+from harness import load_app, logged_in_client, percentile, seed_products, seed_user
+
+FORM = {
+    "fullname": "Bench",
+    "address": "1 Bench Street",
+    "city": "Dublin",
+    "eir": "D01",
+}
+
+
+def read_then_write(conn, products, quantities):
+    """
+    Stock check as a read followed by an update of the value read, racing other checkouts.
+    """
+    from stock import OutOfStock
+
+    for code, quantity in quantities.items():
+        left = conn.execute(
+            select(products.c.stock).where(products.c.code == code)
+        ).scalar()
+        if left is None:
+            continue
+        if left < quantity:
+            raise OutOfStock({code: left})
+        conn.execute(
+            update(products)
+            .where(products.c.code == code)
+            .values(stock=left - quantity)
+        )
+
+
+def run(app_module, user_id, buyers, stock, name, check=True):
+    """
+    :param name: name of the run, keeps its checkout tokens apart from the other runs
+    :param check: whether to check the units sold against the stock
+    :return: dict with the checkout throughput, latencies and outcomes
+    """
+    with app_module.app.app_context():
+        product = app_module.Products.query.filter_by(code="code0").first()
+        product.stock = stock
+        app_module.db.session.commit()
+    clients = [logged_in_client(app_module, user_id) for _ in range(buyers)]
+    for client in clients:
+        client.post("/add", data={"code": "code0", "quantity": "1"})
+    ready = threading.Barrier(buyers + 1)
+    latencies = []
+    outcomes = []
+
+    def buy(index):
+        ready.wait()
+        start = time.perf_counter()
+        response = clients[index].post(
+            "/cart",
+            data=dict(FORM, checkout_token="{}-{}".format(name, index)),
+        )
+        latencies.append((time.perf_counter() - start) * 1e3)
+        if response.status_code != 302:
+            outcomes.append("error")
+        elif response.headers["Location"].endswith("/empty"):
+            outcomes.append("sold")
+        else:
+            outcomes.append("sold out")
+
+    threads = [threading.Thread(target=buy, args=(i,)) for i in range(buyers)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    with app_module.app.app_context():
+        while app_module.checkouts.stats()["pending"]:
+            time.sleep(0.01)
+        Orders = app_module.Orders
+        written = (
+            Orders.query.filter(Orders.product == "code0")
+            .with_entities(app_module.db.func.sum(Orders.quantity))
+            .scalar()
+            or 0
+        )
+        left = app_module.Products.query.filter_by(code="code0").first().stock
+        # orders of the earlier runs stay in the table
+        app_module.db.session.execute(app_module.db.delete(Orders))
+        app_module.db.session.commit()
+    sold = outcomes.count("sold")
+    assert written == sold, (written, sold)
+    if stock is not None and check:
+        assert sold <= stock and left == stock - sold, (sold, left)
+    return {
+        "throughput": buyers / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "sold": sold,
+        "sold out": outcomes.count("sold out"),
+        "errors": outcomes.count("error"),
+        "left": left,
+    }
+
+
+def main():
+    buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app_module = load_app(
+        extra_config="pool_size = 20\nmax_overflow = 20\npool_timeout = 30\n"
+    )
+    seed_products(app_module, 100)
+    user_id = seed_user(app_module)
+    print("{} buyers of the same product\n".format(buyers))
+    print(
+        "{:<22} {:>12} {:>10} {:>10} {:>6} {:>9} {:>7} {:>6}".format(
+            "stock",
+            "checkouts/s",
+            "p50 ms",
+            "p99 ms",
+            "sold",
+            "sold out",
+            "errors",
+            "left",
+        )
+    )
+    reserve = app_module.reserve
+    runs = [
+        ("untracked", None, reserve),
+        (str(buyers), buyers, reserve),
+        (str(buyers // 2), buyers // 2, reserve),
+        ("{}, read then write".format(buyers // 2), buyers // 2, read_then_write),
+    ]
+    for label, stock, function in runs:
+        app_module.reserve = function
+        result = run(
+            app_module, user_id, buyers, stock, label, check=function is reserve
+        )
+        print(
+            "{:<22} {:>12.1f} {:>10.1f} {:>10.1f} {:>6} {:>9} {:>7} {:>6}".format(
+                label,
+                result["throughput"],
+                result["p50"],
+                result["p99"],
+                result["sold"],
+                result["sold out"],
+                result["errors"],
+                "-" if result["left"] is None else result["left"],
+            )
+        )
+    app_module.reserve = reserve
+    app_module.checkouts.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Cost of rendering the product grid pages. For the shop and the admin product table the script
+reports the time of a full request with the fragment cache disabled and enabled, and the time
+of render_template alone, then the hit/miss counters of the fragment cache.
+
+Usage: python benchmarks/bench_templates.py [repeat] [products]
+"""
+
+import sys
+
+from harness import load_app, logged_in_client, seed_products, seed_user, timed
+
+PAGES = ["/shop", "/admin", "/shop?size=100"]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    products = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    app_module = load_app()
+    seed_products(app_module, products)
+    client = logged_in_client(app_module, seed_user(app_module, accesslevel="admin"))
+    env = app_module.app.jinja_env
+    configured = env.fragment_cache
+    print("{:<28} {:>14} {:>14}".format("page", "uncached us", "cached us"))
+    for url in PAGES:
+        env.fragment_cache = None
+        uncached = timed(lambda: client.get(url), repeat)
+        env.fragment_cache = configured
+        cached = timed(lambda: client.get(url), repeat)
+        print("{:<28} {:>14.1f} {:>14.1f}".format(url, uncached, cached))
+    print("\n{}".format(configured.stats()))
+
+
+if __name__ == "__main__":
+    main()
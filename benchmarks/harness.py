@@ -0,0 +1,158 @@
+# Shared helpers for the benchmark scripts
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "spwebapp")
+BENCH_PASSWORD = "benchmarkpassword"
+
+
+def load_app(workdir=None, extra_config=""):
+    """
+    Imports the application against a throwaway SQLite database so the benchmarks
+    can run without a SQL Server instance.
+    :param workdir: directory for the config, database and log files. A temporary one is used if not given.
+    :param extra_config: ini text appended after the [sql] uri, such as more [sql] keys or other sections
+    :return: the imported main module
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="spwebapp-bench-")
+    config_path = os.path.join(workdir, "config.ini")
+    with open(config_path, "w") as config_file:
+        config_file.write(
+            "[flask]\nsession_secret = bench\nport = 8000\n"
+            "[sql]\nuri = sqlite:///{}\n".format(os.path.join(workdir, "bench.db"))
+            + extra_config
+        )
+    os.environ["SPWEBAPP_CONFIG"] = config_path
+    os.chdir(workdir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import main
+
+    main.app = main.create_app(config_path)
+    main.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with main.app.app_context():
+        main.init_db()
+    return main
+
+
+def seed_products(main, count, start=0):
+    """
+    Bulk inserts generated products into the database.
+    :param main: the imported main module
+    :param count: number of products to insert
+    :param start: first index used when generating codes
+    """
+    rows = [
+        {
+            "name": "product{}".format(i),
+            "brand": "brand{}".format(i % 50),
+            "code": "code{}".format(i),
+            "price": i % 500 + 1,
+            "image": "chair.png",
+        }
+        for i in range(start, start + count)
+    ]
+    with main.app.app_context():
+        main.db.session.execute(main.Products.__table__.insert(), rows)
+        main.db.session.commit()
+
+
+def seed_orders(main, count, start=0, user_ids=()):
+    """
+    Bulk inserts generated orders into the database, spread over the last 30 days.
+    :param main: the imported main module
+    :param count: number of orders to insert
+    :param start: first index used when generating values
+    :param user_ids: ids of the users the orders are spread over, none by default like the
+    orders placed before order headers
+    """
+    now = datetime.utcnow()
+    statuses = ["placed", "packed", "shipped", "delivered"]
+    rows = [
+        {
+            "product": "code{}".format(i % 1000),
+            "name": "product{}".format(i % 1000),
+            "user_id": user_ids[i % len(user_ids)] if user_ids else None,
+            "username": "bench",
+            "email": "bench@bench",
+            "price": i % 500 + 1,
+            "quantity": 1,
+            "Address": "Bench, 1 Bench Street, Dublin, D01 B3N4",
+            "status": statuses[i % len(statuses)],
+            "created_at": now - timedelta(minutes=i % 43200),
+        }
+        for i in range(start, start + count)
+    ]
+    with main.app.app_context():
+        main.db.session.execute(main.Orders.__table__.insert(), rows)
+        main.db.session.commit()
+
+
+def seed_user(main, username="bench", accesslevel="user"):
+    """
+    Creates a user whose password is BENCH_PASSWORD and returns its id.
+    """
+    with main.app.app_context():
+        user = main.Users.query.filter_by(username=username).first()
+        if user is None:
+            user = main.Users(
+                username=username,
+                password=main.hasher.hash(BENCH_PASSWORD),
+                email="{}@bench".format(username),
+                accesslevel=accesslevel,
+            )
+            main.db.session.add(user)
+            main.db.session.commit()
+        return user.id
+
+
+def logged_in_client(main, user_id):
+    """
+    Returns a test client whose session is already authenticated as user_id.
+    """
+    client = main.app.test_client()
+    client.environ_base["wsgi.url_scheme"] = "https"
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
+
+
+def timed(function, repeat):
+    """
+    Calls function repeat times and returns the mean duration in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def serve(main):
+    """
+    Serves the application with the threaded development server on a free local port.
+    :return: base url of the server
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:{}".format(server.server_port)
+
+
+def percentile(values, percent):
+    """
+    :param values: list of measurements
+    :param percent: percentile to return, between 0 and 100
+    :return: nearest-rank percentile of values
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[rank]
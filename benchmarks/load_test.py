@@ -0,0 +1,317 @@
+"""
+Load test of the storefront flows. The app is served on a local port against a throwaway
+SQLite database seeded with the requested catalog, order and user sizes, then concurrent
+clients with their own sessions drive the real flows:
+
++ shoppers log in, then browse /shop, POST /add, open /cart and check out with POST /cart,
+  logging out and back in every 20 rounds
++ fulfillment clients log in and filter /orders
++ admins log in, open /admin and add, update and delete products
+
+For each request the script reports throughput, p50/p99 latency, errors and the database
+queries read from the X-Query-Count header, and writes the results as JSON. A previous JSON
+file given with --compare is diffed against the new run to spot regressions between commits.
+
+Usage: python benchmarks/load_test.py [--seconds 10] [--shoppers 8] [--output results.json]
+see --help for every option
+"""
+
+import argparse
+import http.cookiejar
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from harness import (
+    BENCH_PASSWORD,
+    ROOT_DIR,
+    load_app,
+    percentile,
+    seed_orders,
+    seed_products,
+    seed_user,
+    serve,
+)
+
+CHECKOUT = {"fullname": "Load Test", "address": "1 Bench Street", "city": "Dublin"}
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# This class is one client with its own cookie jar, recording every request it sends
+class Client:
+    def __init__(self, base_url, results, recording):
+        """
+        :param base_url: url of the served app
+        :param results: list shared by the clients, receives (name, status, ms, queries) tuples
+        :param recording: event set once the warmup is over
+        """
+        self.base_url = base_url
+        self.results = results
+        self.recording = recording
+        self.username = None
+        self.opener = urllib.request.build_opener(
+            NoRedirect, urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def send(self, method, path, form=None):
+        """
+        :param method: GET or POST
+        :param path: path and query string
+        :param form: dict of form values for POST
+        :return: status code
+        """
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=30) as reply:
+                reply.read()
+                status, headers = reply.status, reply.headers
+        except urllib.error.HTTPError as error:
+            error.read()
+            status, headers = error.code, error.headers
+        except (urllib.error.URLError, ConnectionError):
+            status, headers = 0, {}
+        elapsed = (time.perf_counter() - start) * 1e3
+        if self.recording.is_set():
+            self.results.append(
+                (
+                    "{} {}".format(method, path.split("?")[0]),
+                    status,
+                    elapsed,
+                    int(headers.get("X-Query-Count", 0)),
+                )
+            )
+        return status
+
+    def login(self, username):
+        self.username = username
+        self.send("POST", "/login", {"username": username, "password": BENCH_PASSWORD})
+
+
+def shopper(client, rng, iteration, settings):
+    client.send("GET", "/shop?after={}".format(rng.randrange(settings.products)))
+    for _ in range(2):
+        client.send(
+            "POST",
+            "/add",
+            {
+                "code": "code{}".format(rng.randrange(settings.products)),
+                "quantity": "1",
+            },
+        )
+    client.send("GET", "/cart")
+    if iteration % 5 == 4:
+        client.send("POST", "/cart", dict(CHECKOUT, eir="D0{}".format(iteration % 10)))
+    if iteration % 20 == 19:
+        client.send("GET", "/logout")
+        client.login(client.username)
+
+
+def fulfillment(client, rng, iteration, settings):
+    client.send("GET", "/orders")
+    client.send(
+        "GET",
+        "/orders?status={}".format(
+            rng.choice(["placed", "packed", "shipped", "delivered"])
+        ),
+    )
+
+
+def admin(client, rng, iteration, settings):
+    code = "load-{}-{}".format(client.username, iteration)
+    client.send("GET", "/admin")
+    client.send(
+        "POST",
+        "/add_product",
+        {
+            "name": "load product",
+            "brand": "load",
+            "code": code,
+            "price": str(rng.randint(1, 500)),
+            "image": "chair.png",
+        },
+    )
+    client.send(
+        "POST", "/update_product", {"code": code, "price": str(rng.randint(1, 500))}
+    )
+    client.send("POST", "/delete_product_data", {"code": code})
+
+
+# Flow run in a loop by each kind of client, with the user it logs in as
+FLOWS = {
+    "shoppers": (shopper, "shopper{}", "user"),
+    "fulfillment": (fulfillment, "fulfil{}", "fulfillment"),
+    "admins": (admin, "admin{}", "admin"),
+}
+
+
+def summarize(results, seconds):
+    """
+    :param results: list of (name, status, ms, queries) tuples
+    :param seconds: length of the recorded window
+    :return: dict of request name to its statistics
+    """
+    by_name = {}
+    for name, status, elapsed, queries in results:
+        by_name.setdefault(name, []).append((status, elapsed, queries))
+    summary = {}
+    for name, samples in sorted(by_name.items()):
+        latencies = [elapsed for _, elapsed, _ in samples]
+        summary[name] = {
+            "count": len(samples),
+            "errors": sum(1 for status, _, _ in samples if not 200 <= status < 400),
+            "throughput": round(len(samples) / seconds, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries": round(sum(q for _, _, q in samples) / len(samples), 2),
+        }
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(summary, baseline_path):
+    """
+    Prints the change in throughput and p99 latency of each request against a previous run.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(
+        "\nagainst {} ({})".format(baseline_path, baseline.get("commit") or "unknown")
+    )
+    print("{:<26} {:>12} {:>12}".format("request", "throughput", "p99"))
+    for name, stats in summary.items():
+        before = baseline["requests"].get(name)
+        if before is None:
+            print("{:<26} {:>12} {:>12}".format(name, "new", "new"))
+            continue
+        print(
+            "{:<26} {:>+11.1f}% {:>+11.1f}%".format(
+                name,
+                (stats["throughput"] / before["throughput"] - 1) * 100,
+                (stats["p99_ms"] / before["p99_ms"] - 1) * 100,
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--shoppers", type=int, default=8)
+    parser.add_argument("--fulfillment", type=int, default=1)
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    return parser.parse_args()
+
+
+def main():
+    settings = parse_args()
+    app_module = load_app(
+        extra_config="[bcrypt]\n rounds = {}\n[logging]\n access_sample = 0\n".format(
+            settings.bcrypt_rounds
+        )
+    )
+    # served over plain http locally, the session cookie would never be sent back otherwise
+    app_module.app.config.update(SESSION_COOKIE_SECURE=False, QUERY_COUNT_HEADER=True)
+    seed_products(app_module, settings.products)
+    seed_orders(app_module, settings.orders)
+    base_url = serve(app_module)
+
+    results = []
+    recording = threading.Event()
+    deadline = time.monotonic() + settings.warmup + settings.seconds
+    threads = []
+    for kind, (flow, username, accesslevel) in FLOWS.items():
+        for index in range(getattr(settings, kind)):
+            seed_user(app_module, username.format(index), accesslevel)
+            client = Client(base_url, results, recording)
+            rng = random.Random("{}-{}-{}".format(settings.seed, kind, index))
+
+            def run(client=client, rng=rng, flow=flow, user=username.format(index)):
+                client.login(user)
+                iteration = 0
+                while time.monotonic() < deadline:
+                    flow(client, rng, iteration, settings)
+                    iteration += 1
+
+            threads.append(threading.Thread(target=run))
+    for thread in threads:
+        thread.start()
+    time.sleep(settings.warmup)
+    recording.set()
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    summary = summarize(results, time.monotonic() - started)
+
+    print(
+        "{:<26} {:>8} {:>7} {:>9} {:>9} {:>9} {:>8}".format(
+            "request", "count", "errors", "req/s", "p50 ms", "p99 ms", "queries"
+        )
+    )
+    for name, stats in summary.items():
+        print(
+            "{:<26} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>8.1f}".format(
+                name,
+                stats["count"],
+                stats["errors"],
+                stats["throughput"],
+                stats["p50_ms"],
+                stats["p99_ms"],
+                stats["queries"],
+            )
+        )
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": vars(settings),
+        "total": {
+            "count": len(results),
+            "errors": sum(stats["errors"] for stats in summary.values()),
+            "throughput": round(sum(s["throughput"] for s in summary.values()), 2),
+        },
+        "requests": summary,
+    }
+    if settings.output:
+        with open(settings.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if settings.compare:
+        compare(summary, settings.compare)
+
+
+if __name__ == "__main__":
+    main()
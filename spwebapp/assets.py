@@ -0,0 +1,130 @@
+# Minified, concatenated and fingerprinted CSS/JS bundles with precompressed variants
+import gzip
+import hashlib
+import json
+import os
+
+import brotli
+import rcssmin
+import rjsmin
+
+# Logical bundle names and the files of the static folder they are built from, in order
+BUNDLES = {
+    "site.css": ["css/bootstrap.css", "css/style.css", "css/responsive.css"],
+    "site.js": ["js/jquery-3.6.4.min.js", "js/bootstrap.js"],
+}
+MINIFIERS = {".css": rcssmin.cssmin, ".js": rjsmin.jsmin}
+SEPARATORS = {".css": "\n", ".js": ";\n"}
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+# This class builds the bundles and resolves their logical names to hashed urls
+class AssetBundler:
+    """
+    Bundles are written to output_dir as name-<hash>.ext along with .gz and .br copies, and a
+    manifest.json maps each logical name to its file. output_dir sits beside css and js in the
+    static folder, so relative urls inside the stylesheets keep working. The bundles are
+    rebuilt by load() whenever a source file is newer than the manifest.
+    """
+
+    def __init__(self, static_dir, output_dir, url_prefix, bundles=None):
+        """
+        :param static_dir: static folder holding the source files
+        :param output_dir: directory the bundles and the manifest are written to
+        :param url_prefix: url the output directory is served from
+        :param bundles: dict of logical name to list of source paths, BUNDLES if not given
+        """
+        self.static_dir = static_dir
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.bundles = bundles or BUNDLES
+        self.manifest = {}
+
+    def _manifest_path(self):
+        return os.path.join(self.output_dir, "manifest.json")
+
+    def _sources(self):
+        return [
+            os.path.join(self.static_dir, source)
+            for sources in self.bundles.values()
+            for source in sources
+        ]
+
+    def load(self):
+        """
+        Reads the manifest, building the bundles first if it is missing or stale.
+        """
+        try:
+            built_at = os.path.getmtime(self._manifest_path())
+            with open(self._manifest_path()) as manifest:
+                self.manifest = json.load(manifest)
+        except (OSError, ValueError):
+            self.build()
+            return
+        if set(self.manifest) != set(self.bundles) or any(
+            os.path.getmtime(source) > built_at for source in self._sources()
+        ):
+            self.build()
+
+    def build(self):
+        """
+        Writes every bundle, its compressed copies and the manifest.
+        :return: dict of logical name to (file name, size, gzip size, brotli size)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = {}
+        sizes = {}
+        for name, sources in self.bundles.items():
+            stem, extension = os.path.splitext(name)
+            parts = []
+            for source in sources:
+                with open(os.path.join(self.static_dir, source), encoding="utf-8") as f:
+                    parts.append(MINIFIERS[extension](f.read()))
+            content = SEPARATORS[extension].join(parts).encode("utf-8")
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            file_name = "{}-{}{}".format(stem, digest, extension)
+            compressed = {
+                "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+                "br": brotli.compress(content, quality=11),
+            }
+            self._write(file_name, content)
+            for encoding, suffix in ENCODINGS.items():
+                self._write(file_name + suffix, compressed[encoding])
+            manifest[name] = file_name
+            sizes[name] = (
+                file_name,
+                len(content),
+                len(compressed["gzip"]),
+                len(compressed["br"]),
+            )
+        self._write("manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+        self.manifest = manifest
+        return sizes
+
+    def _write(self, file_name, content):
+        # written under a temporary name first so no worker serves a partial file
+        path = os.path.join(self.output_dir, file_name)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, "wb") as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    def url(self, name):
+        """
+        :param name: logical name of a bundle, such as site.css
+        :return: url of the fingerprinted bundle
+        """
+        return "{}/{}".format(self.url_prefix, self.manifest[name])
+
+    def variant(self, file_name, accept_encodings):
+        """
+        :param file_name: file requested from the output directory
+        :param accept_encodings: Accept-Encoding header of the request, as parsed by werkzeug
+        :return: file to send and the Content-Encoding to send it with, None for identity
+        """
+        for encoding, suffix in ENCODINGS.items():
+            if accept_encodings[encoding] and os.path.isfile(
+                os.path.join(self.output_dir, file_name + suffix)
+            ):
+                return file_name + suffix, encoding
+        return file_name, None
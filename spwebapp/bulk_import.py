@@ -0,0 +1,174 @@
+# Bulk upsert of products read from a CSV or NDJSON stream, in chunked transactions
+import csv
+import json
+import logging
+
+from sqlalchemy import bindparam, insert, update
+
+# Columns of an import file, also the columns of the catalog export
+PRODUCT_COLUMNS = ["code", "name", "brand", "price", "image"]
+MAX_LENGTH = 128
+
+
+# This function reads the rows of an import file one at a time
+def read_rows(stream, import_format):
+    """
+    :param stream: text stream of the file
+    :param import_format: csv, with a header line naming the columns, or ndjson
+    :return: generator of (line number, dict of values) tuples, the dict is None for lines
+    that could not be parsed
+    """
+    if import_format == "csv":
+        reader = csv.reader(stream)
+        # blank lines are skipped, including any before the header
+        header = next((row for row in reader if row), None)
+        columns = [column.strip() for column in header or []]
+        for row in reader:
+            if row:
+                yield reader.line_num, dict(zip(columns, row))
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+# This function checks one row against the rules of the add product form
+def validate_row(row):
+    """
+    :param row: dict of values read from the file
+    :return: (values, None) with the cleaned product values, or (None, error message)
+    """
+    if row is None:
+        return None, "could not parse the line"
+    values = {}
+    for column in PRODUCT_COLUMNS:
+        value = row.get(column)
+        value = str(value).strip() if value is not None else ""
+        if not value:
+            return None, "{} is required".format(column)
+        if len(value) > MAX_LENGTH:
+            return None, "{} is longer than {} characters".format(column, MAX_LENGTH)
+        values[column] = value
+    try:
+        values["price"] = int(values["price"])
+    except ValueError:
+        return None, "price must be a whole number"
+    if values["price"] < 0:
+        return None, "price must not be negative"
+    return values, None
+
+
+# This class collects the outcome of an import
+class ImportReport:
+    def __init__(self, max_errors=1000):
+        """
+        :param max_errors: number of row errors kept, later ones are only counted
+        """
+        self.max_errors = max_errors
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, code, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "code": code, "error": message})
+
+    def as_dict(self):
+        """
+        :return: dict of the counters and the row errors
+        """
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+# This function inserts or updates products by code, one transaction per chunk of rows
+def upsert_products(
+    session, model, rows, commit, chunk_size=500, report=None, on_commit=None
+):
+    """
+    Invalid rows are reported and skipped. When a code appears more than once in a chunk the
+    last row wins. A chunk that fails to commit is rolled back and each of its rows reported,
+    the chunks committed before it stay. Updates bump the version_id_col of a versioned
+    model without checking it, the import never writes the stock those versions protect.
+    :param session: SQLAlchemy session
+    :param model: products model, with id and the PRODUCT_COLUMNS columns
+    :param rows: iterable of (line number, dict) tuples, see read_rows
+    :param commit: callable committing the session, returning the new catalog version
+    :param chunk_size: number of rows written per transaction
+    :param report: ImportReport to fill, a new one if not given
+    :param on_commit: optional callable taking the catalog version and the list of values
+    written by a committed chunk
+    :return: the ImportReport
+    """
+    report = report or ImportReport()
+    chunk = {}
+    for line, row in rows:
+        report.rows += 1
+        values, error = validate_row(row)
+        if error is not None:
+            report.error(line, (row or {}).get("code"), error)
+            continue
+        chunk[values["code"]] = (line, values)
+        if len(chunk) >= chunk_size:
+            _write_chunk(session, model, chunk, commit, report, on_commit)
+            chunk = {}
+    if chunk:
+        _write_chunk(session, model, chunk, commit, report, on_commit)
+    return report
+
+
+def _update_statement(model):
+    # a Core executemany, the ORM updates a versioned model one row at a time
+    table = model.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values({column: bindparam(column) for column in PRODUCT_COLUMNS})
+    )
+    version = model.__mapper__.version_id_col
+    if version is not None:
+        statement = statement.values({version.key: version + 1})
+    return statement
+
+
+def _write_chunk(session, model, chunk, commit, report, on_commit):
+    try:
+        existing = dict(
+            session.query(model.code, model.id).filter(model.code.in_(list(chunk)))
+        )
+        inserts = [
+            values for _, values in chunk.values() if values["code"] not in existing
+        ]
+        updates = [
+            dict(values, row_id=existing[values["code"]])
+            for _, values in chunk.values()
+            if values["code"] in existing
+        ]
+        if inserts:
+            session.execute(insert(model), inserts)
+        if updates:
+            session.execute(_update_statement(model), updates)
+        version = commit()
+    except Exception as e:
+        logging.exception(e)
+        session.rollback()
+        for line, values in chunk.values():
+            report.error(line, values["code"], "not saved, the chunk failed to commit")
+        return
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+    if on_commit is not None:
+        on_commit(version, [values for _, values in chunk.values()])
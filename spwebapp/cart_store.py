@@ -0,0 +1,283 @@
+# Server-side cart storage, the session only keeps the id of the cart
+import abc
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    delete,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+
+
+def new_cart_id():
+    """
+    :return: random id for a new cart
+    """
+    return uuid.uuid4().hex
+
+
+# This class holds the content of a cart along with its running totals
+class Cart:
+    """
+    items - dict of code to item dict with name, code, quantity, price, image and total_price.
+    total_quantity - sum of the quantities of every item.
+    total_price - sum of the total_price of every item.
+    """
+
+    def __init__(self, items=None, total_quantity=0, total_price=0):
+        self.items = items or {}
+        self.total_quantity = total_quantity
+        self.total_price = total_price
+
+    def __len__(self):
+        return len(self.items)
+
+
+# This class defines the interface every cart backend implements
+class CartStore(abc.ABC):
+    """
+    Totals are updated incrementally when an item is added, so adding to a cart costs
+    the same whatever its size. A backend missing get, add or clear cannot be instantiated.
+    """
+
+    @abc.abstractmethod
+    def get(self, cart_id):
+        """
+        :param cart_id: id stored in the session, may be None
+        :return: Cart, empty if the cart does not exist
+        """
+
+    @abc.abstractmethod
+    def add(self, cart_id, product, quantity):
+        """
+        :param cart_id: id stored in the session
+        :param product: product with code, name, price and image attributes
+        :param quantity: quantity to add to the cart
+        """
+
+    @abc.abstractmethod
+    def clear(self, cart_id):
+        """
+        :param cart_id: id stored in the session, may be None
+        """
+
+    def create_tables(self):
+        """
+        Creates the tables the backend needs, if any. Called by the init-db command.
+        """
+
+
+# This class keeps carts in the memory of the worker process
+class MemoryCartStore(CartStore):
+    """
+    Only suitable when the application runs as a single process, since each worker
+    has its own carts. Carts untouched for ttl seconds or beyond max_carts are dropped.
+    """
+
+    def __init__(self, max_carts=100000, ttl=86400):
+        self.max_carts = max_carts
+        self.ttl = ttl
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cart_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            if entry is None or now - entry[0] >= self.ttl:
+                return Cart()
+            cart = entry[1]
+            return Cart(
+                {code: dict(item) for code, item in cart.items.items()},
+                cart.total_quantity,
+                cart.total_price,
+            )
+
+    def add(self, cart_id, product, quantity):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            cart = (
+                entry[1] if entry is not None and now - entry[0] < self.ttl else Cart()
+            )
+            item = cart.items.get(product.code)
+            if item is None:
+                cart.items[product.code] = {
+                    "name": product.name,
+                    "code": product.code,
+                    "quantity": quantity,
+                    "price": product.price,
+                    "image": product.image,
+                    "total_price": quantity * product.price,
+                }
+            else:
+                item["quantity"] += quantity
+                item["total_price"] += quantity * item["price"]
+            cart.total_quantity += quantity
+            cart.total_price += quantity * cart.items[product.code]["price"]
+            self._carts[cart_id] = (now, cart)
+            self._carts.move_to_end(cart_id)
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+
+# This class keeps carts in SQL tables, shared by every worker using the same database
+class SQLCartStore(CartStore):
+    """
+    Uses the carts and cart_items tables of the given engine, which can be the application
+    database or a separate one such as a local SQLite file. Carts untouched for ttl seconds
+    are purged, at most once every ttl / 10 seconds.
+    """
+
+    def __init__(self, engine, ttl=86400):
+        self.engine = engine
+        self.ttl = ttl
+        self._purged_at = 0.0
+        self.metadata = MetaData()
+        self.carts = Table(
+            "carts",
+            self.metadata,
+            Column("cart_id", String(32), primary_key=True),
+            Column("total_quantity", Integer, nullable=False),
+            Column("total_price", Integer, nullable=False),
+            Column("updated_at", Integer, nullable=False, index=True),
+        )
+        self.cart_items = Table(
+            "cart_items",
+            self.metadata,
+            Column("cart_id", String(32), primary_key=True),
+            Column("code", String(128), primary_key=True),
+            Column("name", String(128), nullable=False),
+            Column("image", String(128), nullable=False),
+            Column("price", Integer, nullable=False),
+            Column("quantity", Integer, nullable=False),
+        )
+
+    def create_tables(self):
+        """
+        Creates the carts and cart_items tables if they do not already exist.
+        """
+        self.metadata.create_all(self.engine)
+
+    def get(self, cart_id):
+        if cart_id is None:
+            return Cart()
+        with self.engine.connect() as conn:
+            totals = conn.execute(
+                select(self.carts.c.total_quantity, self.carts.c.total_price).where(
+                    self.carts.c.cart_id == cart_id
+                )
+            ).first()
+            if totals is None:
+                return Cart()
+            rows = conn.execute(
+                select(self.cart_items).where(self.cart_items.c.cart_id == cart_id)
+            )
+            items = {
+                row.code: {
+                    "name": row.name,
+                    "code": row.code,
+                    "quantity": row.quantity,
+                    "price": row.price,
+                    "image": row.image,
+                    "total_price": row.quantity * row.price,
+                }
+                for row in rows
+            }
+        return Cart(items, totals.total_quantity, totals.total_price)
+
+    def add(self, cart_id, product, quantity):
+        now = int(time.time())
+        try:
+            with self.engine.begin() as conn:
+                self._add(conn, cart_id, product, quantity, now)
+        except IntegrityError:
+            # a concurrent first add to the cart or of the item, from another tab or a double
+            # click, inserted the row after the update found none; it is updated this time
+            with self.engine.begin() as conn:
+                self._add(conn, cart_id, product, quantity, now)
+        self._purge(now)
+
+    def _add(self, conn, cart_id, product, quantity, now):
+        # updates the item and the totals, inserting the rows that do not exist yet
+        item_key = and_(
+            self.cart_items.c.cart_id == cart_id,
+            self.cart_items.c.code == product.code,
+        )
+        updated = conn.execute(
+            update(self.cart_items)
+            .where(item_key)
+            .values(quantity=self.cart_items.c.quantity + quantity)
+        ).rowcount
+        if updated:
+            price = conn.execute(
+                select(self.cart_items.c.price).where(item_key)
+            ).scalar()
+        else:
+            price = product.price
+            conn.execute(
+                self.cart_items.insert().values(
+                    cart_id=cart_id,
+                    code=product.code,
+                    name=product.name,
+                    image=product.image,
+                    price=price,
+                    quantity=quantity,
+                )
+            )
+        updated = conn.execute(
+            update(self.carts)
+            .where(self.carts.c.cart_id == cart_id)
+            .values(
+                total_quantity=self.carts.c.total_quantity + quantity,
+                total_price=self.carts.c.total_price + quantity * price,
+                updated_at=now,
+            )
+        ).rowcount
+        if not updated:
+            conn.execute(
+                self.carts.insert().values(
+                    cart_id=cart_id,
+                    total_quantity=quantity,
+                    total_price=quantity * price,
+                    updated_at=now,
+                )
+            )
+
+    def clear(self, cart_id):
+        if cart_id is None:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(self.cart_items).where(self.cart_items.c.cart_id == cart_id)
+            )
+            conn.execute(delete(self.carts).where(self.carts.c.cart_id == cart_id))
+
+    def _purge(self, now):
+        if now - self._purged_at < self.ttl / 10:
+            return
+        self._purged_at = now
+        expired = select(self.carts.c.cart_id).where(
+            self.carts.c.updated_at < now - self.ttl
+        )
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(self.cart_items).where(self.cart_items.c.cart_id.in_(expired))
+            )
+            conn.execute(
+                delete(self.carts).where(self.carts.c.updated_at < now - self.ttl)
+            )
@@ -0,0 +1,176 @@
+# In-process cache of the product catalog shared by the storefront and admin routes
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Immutable copy of a products row, safe to share between requests and threads
+CachedProduct = namedtuple(
+    "CachedProduct", ["id", "name", "brand", "code", "price", "image"]
+)
+
+
+def snapshot(product):
+    """
+    :param product: Products row
+    :return: CachedProduct holding the row's values
+    """
+    return CachedProduct(
+        id=product.id,
+        name=product.name,
+        brand=product.brand,
+        code=product.code,
+        price=product.price,
+        image=product.image,
+    )
+
+
+# This class keeps products in memory, keyed by code, and stays coherent across workers
+class CatalogCache:
+    """
+    Products are cached by code with LRU eviction once max_size entries are held, and listings
+    (the full catalog while it fits in max_size, or pages of it) are cached by key with LRU
+    eviction once max_listings are held. Every entry expires after ttl seconds.
+    The database holds a version stamp that is bumped on each catalog change; it is read at most
+    once every check_interval seconds and the whole cache is dropped when another worker changed it.
+    Changes are seen through that stamp and updated() only, so a change must bump it.
+    Each change seen bumps a generation counter, and a load started before it is returned but
+    not stored, so a read racing a write cannot cache the row it read before the write.
+    """
+
+    def __init__(
+        self,
+        load_product,
+        load_products,
+        load_version,
+        max_size=10000,
+        ttl=300,
+        check_interval=1.0,
+        max_listings=256,
+    ):
+        """
+        :param load_product: callable taking a code and returning a CachedProduct or None
+        :param load_products: callable returning a list of CachedProduct for the whole catalog
+        :param load_version: callable returning the catalog version stored in the database
+        :param max_size: maximum number of products held in memory
+        :param ttl: seconds after which a cached entry is reloaded
+        :param check_interval: seconds between two reads of the database version stamp
+        :param max_listings: maximum number of listings held in memory
+        """
+        self.load_product = load_product
+        self.load_products = load_products
+        self.load_version = load_version
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.max_listings = max_listings
+        self.version = None
+        self._generation = 0
+        self._checked_at = 0.0
+        self._products = OrderedDict()
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """
+        Drops every entry if the database version moved since the last check.
+        """
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = self.load_version()
+        with self._lock:
+            self._checked_at = now
+            if version != self.version:
+                self._products.clear()
+                self._listings.clear()
+                self.version = version
+                self._generation += 1
+
+    def current_version(self):
+        """
+        :return: catalog version stamp, read from the database at most once per check_interval
+        """
+        self._sync()
+        return self.version
+
+    def _store(self, product, now):
+        self._products[product.code] = (now, product)
+        self._products.move_to_end(product.code)
+        while len(self._products) > self.max_size:
+            self._products.popitem(last=False)
+
+    def get(self, code):
+        """
+        :param code: product code
+        :return: CachedProduct or None if no product has that code
+        """
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._products.get(code)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._products.move_to_end(code)
+                return entry[1]
+            generation = self._generation
+        product = self.load_product(code)
+        if product is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._store(product, now)
+        return product
+
+    def all(self):
+        """
+        :return: list of CachedProduct for the whole catalog
+        """
+        return self.listing(("all",), self.load_products, self.max_size)
+
+    def listing(self, key, load, max_items=None):
+        """
+        :param key: hashable key identifying the listing, e.g. the page and filter values
+        :param load: callable returning the listing when it is not cached
+        :param max_items: listings longer than this are returned without being cached
+        :return: the cached or freshly loaded listing
+        """
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._listings.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._listings.move_to_end(key)
+                return entry[1]
+            generation = self._generation
+        items = load()
+        if max_items is None or len(items) <= max_items:
+            with self._lock:
+                if generation != self._generation:
+                    return items
+                self._listings[key] = (now, items)
+                self._listings.move_to_end(key)
+                while len(self._listings) > self.max_listings:
+                    self._listings.popitem(last=False)
+        return items
+
+    def updated(self, version, product=None, code=None, codes=()):
+        """
+        Write-through after this worker committed a catalog change.
+        :param version: catalog version stamp written by the change
+        :param product: CachedProduct for an added or updated product
+        :param code: code of a deleted product
+        :param codes: codes of products changed in bulk, dropped from the cache
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._generation += 1
+            if self.version is None or version != self.version + 1:
+                # another worker changed the catalog since our last check
+                self._products.clear()
+            self._listings.clear()
+            self.version = version
+            self._checked_at = now
+            if product is not None:
+                self._store(product, now)
+            if code is not None:
+                self._products.pop(code, None)
+            for changed in codes:
+                self._products.pop(changed, None)
@@ -0,0 +1,8 @@
+/****** Unique index on products.code used by the /add, /update_product and /delete_product_data lookups ******/
+USE [users_db]
+GO
+CREATE UNIQUE NONCLUSTERED INDEX [ix_products_code] ON [dbo].[products]
+(
+	[code] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, IGNORE_DUP_KEY = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
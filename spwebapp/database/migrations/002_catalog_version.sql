@@ -0,0 +1,14 @@
+/****** Version stamp bumped on every products change, read by the in-process catalog cache ******/
+USE [users_db]
+GO
+CREATE TABLE [dbo].[catalog_version](
+	[id] [int] NOT NULL,
+	[version] [int] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+INSERT [dbo].[catalog_version] ([id], [version]) VALUES (1, 0)
+GO
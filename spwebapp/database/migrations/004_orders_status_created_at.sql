@@ -0,0 +1,19 @@
+/****** Fulfillment status and placement time for orders, with indexes backing the /orders filters ******/
+USE [users_db]
+GO
+ALTER TABLE [dbo].[orders] ADD [status] [varchar](32) NOT NULL CONSTRAINT [DF_orders_status] DEFAULT ('placed')
+GO
+ALTER TABLE [dbo].[orders] ADD [created_at] [datetime] NOT NULL CONSTRAINT [DF_orders_created_at] DEFAULT (GETUTCDATE())
+GO
+CREATE NONCLUSTERED INDEX [ix_orders_status_order_id] ON [dbo].[orders]
+(
+	[status] ASC,
+	[order_id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [ix_orders_created_at_order_id] ON [dbo].[orders]
+(
+	[created_at] ASC,
+	[order_id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
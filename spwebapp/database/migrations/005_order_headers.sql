@@ -0,0 +1,34 @@
+/****** Order headers hold the user and delivery address once per checkout, orders become order lines ******/
+USE [users_db]
+GO
+CREATE TABLE [dbo].[order_headers](
+	[id] [int] IDENTITY(1,1) NOT NULL,
+	[user_id] [int] NOT NULL,
+	[username] [varchar](255) NOT NULL,
+	[email] [varchar](255) NOT NULL,
+	[Address] [varchar](255) NOT NULL,
+	[created_at] [datetime] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+ALTER TABLE [dbo].[order_headers] WITH CHECK ADD FOREIGN KEY([user_id]) REFERENCES [dbo].[users] ([id])
+GO
+ALTER TABLE [dbo].[orders] ADD [header_id] [int] NULL
+GO
+ALTER TABLE [dbo].[orders] WITH CHECK ADD FOREIGN KEY([header_id]) REFERENCES [dbo].[order_headers] ([id])
+GO
+CREATE NONCLUSTERED INDEX [ix_orders_header_id] ON [dbo].[orders]
+(
+	[header_id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
+/****** Existing orders keep their own copy of the user and address ******/
+ALTER TABLE [dbo].[orders] ALTER COLUMN [username] [varchar](255) NULL
+GO
+ALTER TABLE [dbo].[orders] ALTER COLUMN [email] [varchar](255) NULL
+GO
+ALTER TABLE [dbo].[orders] ALTER COLUMN [Address] [varchar](255) NULL
+GO
@@ -0,0 +1,33 @@
+/****** Server-side cart tables used when the [cart] backend is sql and uri is empty ******/
+USE [users_db]
+GO
+CREATE TABLE [dbo].[carts](
+	[cart_id] [varchar](32) NOT NULL,
+	[total_quantity] [int] NOT NULL,
+	[total_price] [int] NOT NULL,
+	[updated_at] [int] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[cart_id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [ix_carts_updated_at] ON [dbo].[carts]
+(
+	[updated_at] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
+CREATE TABLE [dbo].[cart_items](
+	[cart_id] [varchar](32) NOT NULL,
+	[code] [varchar](128) NOT NULL,
+	[name] [varchar](128) NOT NULL,
+	[image] [varchar](128) NOT NULL,
+	[price] [int] NOT NULL,
+	[quantity] [int] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[cart_id] ASC,
+	[code] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
@@ -0,0 +1,27 @@
+/****** Durable queue of checkout events, written into orders by the order queue workers ******/
+USE [users_db]
+GO
+CREATE TABLE [dbo].[order_events](
+	[id] [int] IDENTITY(1,1) NOT NULL,
+	[idempotency_key] [varchar](64) NOT NULL UNIQUE,
+	[payload] [varchar](max) NOT NULL,
+	[status] [varchar](16) NOT NULL,
+	[attempts] [int] NOT NULL,
+	[available_at] [int] NOT NULL,
+	[locked_by] [varchar](64) NULL,
+	[locked_until] [int] NULL,
+	[last_error] [varchar](255) NULL,
+	[created_at] [int] NOT NULL,
+	[processed_at] [int] NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [ix_order_events_status_available_at] ON [dbo].[order_events]
+(
+	[status] ASC,
+	[available_at] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
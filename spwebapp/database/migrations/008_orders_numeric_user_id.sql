@@ -0,0 +1,35 @@
+/****** Numeric price and quantity on orders, and the user of each order with indexes backing the order history ******/
+USE [users_db]
+GO
+/****** Must return no rows, fix or remove the orders listed before running the rest ******/
+SELECT [order_id], [price], [quantity] FROM [dbo].[orders]
+WHERE TRY_CONVERT(int, [price]) IS NULL OR TRY_CONVERT(int, [quantity]) IS NULL
+GO
+ALTER TABLE [dbo].[orders] ALTER COLUMN [price] [int] NOT NULL
+GO
+ALTER TABLE [dbo].[orders] ALTER COLUMN [quantity] [int] NOT NULL
+GO
+ALTER TABLE [dbo].[orders] ADD [user_id] [int] NULL
+GO
+ALTER TABLE [dbo].[orders] WITH CHECK ADD FOREIGN KEY([user_id]) REFERENCES [dbo].[users] ([id])
+GO
+/****** Orders placed with an order header take its user, older orders the user of their username ******/
+UPDATE [o] SET [user_id] = [h].[user_id]
+FROM [dbo].[orders] [o] INNER JOIN [dbo].[order_headers] [h] ON [o].[header_id] = [h].[id]
+GO
+UPDATE [o] SET [user_id] = [u].[id]
+FROM [dbo].[orders] [o] INNER JOIN [dbo].[users] [u] ON [o].[username] = [u].[username]
+WHERE [o].[user_id] IS NULL
+GO
+CREATE NONCLUSTERED INDEX [ix_orders_user_id_order_id] ON [dbo].[orders]
+(
+	[user_id] ASC,
+	[order_id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [ix_order_headers_user_id_id] ON [dbo].[order_headers]
+(
+	[user_id] ASC,
+	[id] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
@@ -0,0 +1,34 @@
+/****** Sales and fulfillment summary tables read by the admin dashboard ******/
+/****** Fill them from the existing orders afterwards with: flask --app main rebuild-summaries ******/
+USE [users_db]
+GO
+CREATE TABLE [dbo].[product_sales_daily](
+	[product] [varchar](128) NOT NULL,
+	[day] [date] NOT NULL,
+	[name] [varchar](128) NOT NULL,
+	[lines] [int] NOT NULL,
+	[units] [int] NOT NULL,
+	[revenue] [bigint] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[product] ASC,
+	[day] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [ix_product_sales_daily_day] ON [dbo].[product_sales_daily]
+(
+	[day] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, SORT_IN_TEMPDB = OFF, DROP_EXISTING = OFF, ONLINE = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+GO
+CREATE TABLE [dbo].[order_status_counts](
+	[status] [varchar](32) NOT NULL,
+	[lines] [int] NOT NULL,
+	[units] [bigint] NOT NULL,
+	[revenue] [bigint] NOT NULL,
+PRIMARY KEY CLUSTERED 
+(
+	[status] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF, IGNORE_DUP_KEY = OFF, ALLOW_ROW_LOCKS = ON, ALLOW_PAGE_LOCKS = ON) ON [PRIMARY]
+) ON [PRIMARY]
+GO
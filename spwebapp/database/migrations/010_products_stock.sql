@@ -0,0 +1,9 @@
+/****** Stock levels of the products, NULL until tracked, and the version stamp of each row used by optimistic updates ******/
+USE [users_db]
+GO
+ALTER TABLE [dbo].[products] ADD [stock] [int] NULL
+GO
+ALTER TABLE [dbo].[products] ADD [stock_version] [int] NOT NULL CONSTRAINT [DF_products_stock_version] DEFAULT ((1))
+GO
+ALTER TABLE [dbo].[products] WITH CHECK ADD CONSTRAINT [ck_products_stock] CHECK ([stock] >= 0)
+GO
@@ -0,0 +1,88 @@
+# Connection pool settings for the SQLAlchemy engines and the counters read back from the pool
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# This class is a QueuePool that records how long checkouts wait for a free connection
+class TimedQueuePool(QueuePool):
+    """
+    checkouts - number of checkouts, wait_time - seconds spent in them in total,
+    max_wait - longest single checkout, timeouts - checkouts that gave up after pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+# This function builds the create_engine keyword arguments from the [sql] section of config.ini
+def engine_options(config, uri):
+    """
+    In-memory SQLite databases keep SQLAlchemy's single connection pool, the pool settings
+    only apply to databases reached over real connections (SQL Server, Postgres, SQLite files).
+    :param config: ConfigParser holding the [sql] section
+    :param uri: database uri the engine is created for
+    :return: dict of engine options
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": config.getint("sql", "pool_size", fallback=10),
+        "max_overflow": config.getint("sql", "max_overflow", fallback=10),
+        "pool_timeout": config.getfloat("sql", "pool_timeout", fallback=10),
+        "pool_recycle": config.getint("sql", "pool_recycle", fallback=1800),
+        "pool_pre_ping": config.getboolean("sql", "pool_pre_ping", fallback=True),
+    }
+
+
+# This function reads the current state of an engine's connection pool
+def pool_stats(engine):
+    """
+    :param engine: SQLAlchemy engine
+    :return: dict with size, checked_out, overflow and, for a TimedQueuePool, the checkout counters
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                wait_time=round(pool.wait_time, 6),
+                mean_wait=(
+                    round(pool.wait_time / pool.checkouts, 6) if pool.checkouts else 0.0
+                ),
+                max_wait=round(pool.max_wait, 6),
+                timeouts=pool.timeouts,
+            )
+    return stats
@@ -0,0 +1,210 @@
+# Routing of the session's read-only queries to read replicas of the primary database
+import functools
+import itertools
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+
+# Bind keys of the replica engines in SQLALCHEMY_BINDS are this prefix and a number
+REPLICA_BIND = "replica{}"
+
+
+# This class hands out the healthy replicas of the primary database in turn
+class ReplicaSet:
+    """
+    Replicas are picked round-robin, skipping those that failed their last health check.
+    The first pick of each process checks every replica and starts a background thread
+    running the check each health_interval seconds. A replica that cannot be connected to,
+    or whose connection breaks during a query, is skipped at once until it answers a check.
+    """
+
+    def __init__(self, engines, health_interval=5.0):
+        """
+        :param engines: SQLAlchemy engines of the replicas
+        :param health_interval: seconds between two health checks of the replicas
+        """
+        self.engines = list(engines)
+        self.health_interval = health_interval
+        self._healthy = {engine: True for engine in self.engines}
+        self._picks = {engine: 0 for engine in self.engines}
+        self._turn = itertools.count()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._failed)
+
+    def pick(self):
+        """
+        :return: engine of the next healthy replica, or None if none is healthy
+        """
+        self.start()
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._turn) % len(self.engines)]
+            if self._healthy[engine]:
+                self._picks[engine] += 1
+                return engine
+        return None
+
+    def check(self):
+        """
+        Runs the health check of every replica.
+        """
+        for engine in self.engines:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                healthy = True
+            except Exception as e:
+                logging.warning("Replica %s failed its health check: %s", engine.url, e)
+                healthy = False
+            if healthy and not self._healthy[engine]:
+                logging.warning("Replica %s is healthy again", engine.url)
+            self._healthy[engine] = healthy
+
+    def _failed(self, exception_context):
+        # no connection means the error was raised while connecting
+        if exception_context.is_disconnect or exception_context.connection is None:
+            self._healthy[exception_context.engine] = False
+
+    def start(self):
+        """
+        Starts the health check thread of this process if it is not running.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self.check()
+            threading.Thread(
+                target=self._watch, name="replica-health", daemon=True
+            ).start()
+
+    def stop(self):
+        """
+        Stops the health check thread of this process.
+        """
+        self._stopping.set()
+        self._pid = None
+
+    def _watch(self):
+        while not self._stopping.wait(self.health_interval):
+            self.check()
+
+    def stats(self):
+        """
+        :return: list of dicts with the url, password hidden, health and number of picks of
+        each replica
+        """
+        return [
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "healthy": self._healthy[engine],
+                "picks": self._picks[engine],
+            }
+            for engine in self.engines
+        ]
+
+
+# This decorator lets the session of a view read from the replicas
+def replica_reads(view):
+    """
+    Put it below login_required, so the logged in user is still loaded from the primary.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_reads = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+# This decorator keeps the reads of a function on the primary, even in a replica_reads view
+def primary_reads(function):
+    """
+    For the loaders of the caches shared by every request, whose entries are stamped with
+    the catalog version of the primary and must not hold older rows read from a replica.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not has_app_context() or not g.get("replica_reads"):
+            return function(*args, **kwargs)
+        g.replica_reads = False
+        try:
+            return function(*args, **kwargs)
+        finally:
+            g.replica_reads = True
+
+    return wrapper
+
+
+# This function keeps the reads of the current visitor on the primary for a while
+def stick_to_primary(seconds):
+    """
+    Called after the visitor's own writes, so the pages they open next show them even when
+    the replicas lag behind.
+    :param seconds: how long the visitor's reads stay on the primary
+    """
+    session["primary_until"] = time.time() + seconds
+
+
+# This function returns the engine the current request should read from
+def read_engine(primary):
+    """
+    :param primary: engine of the primary database
+    :return: a healthy replica when the request may read from one, the primary otherwise
+    """
+    replicas = current_app.extensions.get("replicas") if has_app_context() else None
+    if replicas is None or not g.get("replica_reads"):
+        return primary
+    if has_request_context() and session.get("primary_until", 0) > time.time():
+        return primary
+    return replicas.pick() or primary
+
+
+# This class sends the session's selects to a replica when the request allows it
+class RoutingSession(Session):
+    """
+    A select goes to read_engine unless the session is flushing or already wrote in its
+    current transaction, so a transaction never reads back its own writes from a replica.
+    Every other statement goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (
+            bind is None
+            and isinstance(clause, Select)
+            and not self._flushing
+            and not self.info.get("wrote")
+        ):
+            return read_engine(primary)
+        return primary
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _wrote(db_session, flush_context):
+    db_session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _ended(db_session, transaction):
+    if transaction.parent is None:
+        db_session.info.pop("wrote", None)
@@ -0,0 +1,41 @@
+# Streaming CSV/NDJSON encoders for the export endpoints
+import csv
+import io
+import json
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+# This function encodes rows one chunk at a time so exports never hold a whole table in memory
+def stream_rows(rows, columns, export_format, chunk_rows=500):
+    """
+    :param rows: iterable of sequences holding the values of columns, e.g. a yield_per query
+    :param columns: column names, written as the csv header or used as the ndjson keys
+    :param export_format: one of EXPORT_FORMATS
+    :param chunk_rows: number of rows encoded into each chunk handed to the server
+    :return: generator of str chunks
+    """
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+
+        def write(row):
+            buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+            buffer.write("\n")
+
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,45 @@
+# Jinja tag caching the output of a template fragment, e.g. the product grid of a catalog version
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from page_cache import CSRF_PLACEHOLDER
+
+
+# This class adds the {% cache key, ... %}...{% endcache %} tag to the Jinja environment
+class FragmentCacheExtension(Extension):
+    """
+    The fragment is rendered once per distinct key and stored in environment.fragment_cache,
+    a PageCache. The visitor's CSRF token, returned by environment.fragment_csrf_token, is
+    swapped for a placeholder before storing and put back on every hit. Without a cache the
+    fragment is rendered as usual.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_csrf_token=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        csrf_token = self.environment.fragment_csrf_token
+        return Markup(
+            cache.get(
+                tuple(key),
+                lambda: str(caller()).replace(csrf_token(), CSRF_PLACEHOLDER),
+                csrf_token,
+            )
+        )
@@ -0,0 +1,29 @@
+# Gunicorn settings read from the [server] section of the config file, run with: gunicorn wsgi:app
+import configparser
+import multiprocessing
+import os
+
+server = configparser.ConfigParser()
+server.read(os.environ.get("SPWEBAPP_CONFIG", "./config.ini"))
+
+bind = "{}:{}".format(
+    server.get("server", "host", fallback="0.0.0.0"),
+    server.getint("server", "port", fallback=8000),
+)
+# workers = 0 sizes the pool from the number of cores
+workers = server.getint("server", "workers", fallback=0) or (
+    multiprocessing.cpu_count() * 2 + 1
+)
+threads = server.getint("server", "threads", fallback=4)
+worker_class = "gthread"
+keepalive = server.getint("server", "keepalive", fallback=5)
+timeout = server.getint("server", "timeout", fallback=30)
+graceful_timeout = server.getint("server", "graceful_timeout", fallback=30)
+# Recycle workers periodically, the jitter keeps them from restarting all at once
+max_requests = server.getint("server", "max_requests", fallback=10000)
+max_requests_jitter = server.getint("server", "max_requests_jitter", fallback=1000)
+# TLS is optional, it is usually terminated by a reverse proxy in front of gunicorn
+certfile = server.get("server", "certfile", fallback="") or None
+keyfile = server.get("server", "keyfile", fallback="") or None
+# Each worker builds its own app so engines, caches and the hashing pool are not shared across a fork
+preload_app = False
@@ -0,0 +1,134 @@
+# Password hashing off the request threads, in a bounded pool of worker processes
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask_bcrypt import check_password_hash, generate_password_hash
+
+
+# This exception is raised when every hashing slot is taken, a hash timed out or its worker died, the request should fail fast
+class HasherBusy(Exception):
+    pass
+
+
+def _hash(password, rounds):
+    return generate_password_hash(password, rounds).decode("utf-8")
+
+
+def _check(pw_hash, password):
+    return check_password_hash(pw_hash, password)
+
+
+def _start_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+# This class runs bcrypt in worker processes so it cannot pin the WSGI threads
+class PasswordHasher:
+    """
+    At most workers hashes run at once and max_pending more may wait for a worker; any
+    further request raises HasherBusy straight away instead of queueing. With workers set
+    to 0 hashes run in the calling thread, without admission control.
+    The pool is started lazily in each process, so it is safe to create before a
+    preforking server forks its workers. Its processes are started by a forkserver, or
+    spawned where there is none, as forking a process already running the log, order queue
+    and pool threads can leave a child stuck on a lock one of them held.
+    A worker that dies breaks the whole pool: the hashes it held raise HasherBusy and the
+    next one starts a new pool.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=16, timeout=10, observe=None):
+        """
+        :param rounds: bcrypt work factor used for new hashes
+        :param workers: number of hashing processes, 0 hashes inline
+        :param max_pending: number of hashes allowed to wait for a free process
+        :param timeout: seconds a request waits for its hash before giving up
+        :param observe: optional callable taking the seconds a hash or check took and the
+        operation name, hash or check
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self.observe = observe
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=_start_context()
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        pool = self._executor()
+        try:
+            future = pool.submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard(pool)
+            raise HasherBusy()
+        except Exception:
+            self._slots.release()
+            raise
+        # the slot is only freed once the worker is done, even if the request timed out
+        future.add_done_callback(lambda done: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise HasherBusy()
+
+    def _timed(self, operation, function, *args):
+        start = time.perf_counter()
+        result = self._run(function, *args)
+        if self.observe is not None:
+            self.observe(time.perf_counter() - start, operation)
+        return result
+
+    def hash(self, password):
+        """
+        :param password: plain text password
+        :return: bcrypt hash as a str
+        """
+        return self._timed("hash", _hash, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        """
+        :param pw_hash: stored bcrypt hash
+        :param password: plain text password to compare
+        :return: True if the password matches the hash
+        """
+        return self._timed("check", _check, pw_hash, password)
+
+    def shutdown(self):
+        """
+        Stops the worker processes of this process's pool.
+        """
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
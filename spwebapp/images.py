@@ -0,0 +1,259 @@
+# Resized WebP/AVIF derivatives of the static images, served through srcset
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+SAVE_OPTIONS = {"avif": {"speed": 8}, "webp": {"method": 4}}
+
+
+# This class describes the derivatives of one source image, as stored in its manifest file
+class ImageSet:
+    """
+    name - file name of the source image, relative to the source directory.
+    digest - start of the sha256 of the source content, part of every derivative name.
+    widths - widths generated, never wider than the source.
+    formats - formats generated, in order of preference.
+    """
+
+    def __init__(self, name, digest, widths, formats, url_prefix):
+        self.name = name
+        self.digest = digest
+        self.widths = widths
+        self.formats = formats
+        self.url_prefix = url_prefix
+
+    def file_name(self, width, image_format):
+        """
+        :return: content-hashed file name of one derivative
+        """
+        stem = os.path.splitext(os.path.basename(self.name))[0]
+        return "{}-{}-{}.{}".format(stem, self.digest, width, image_format)
+
+    @property
+    def sources(self):
+        """
+        :return: list of dicts with the mime type and srcset of each format, for <source> tags
+        """
+        return [
+            {
+                "type": MIME_TYPES[image_format],
+                "srcset": ", ".join(
+                    "{}/{} {}w".format(
+                        self.url_prefix, self.file_name(width, image_format), width
+                    )
+                    for width in self.widths
+                ),
+            }
+            for image_format in self.formats
+        ]
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "digest": self.digest,
+            "widths": self.widths,
+            "formats": self.formats,
+        }
+
+
+# This class generates the derivatives on disk and answers template lookups from memory
+class ImageDerivatives:
+    """
+    Derivatives are written to output_dir under content-hashed names, so they can be cached
+    forever, along with a small manifest file per source image. Manifests are shared through
+    the disk, so images generated by another worker or by the build-images command are
+    picked up on the next lookup. A lookup for an image without derivatives schedules its
+    generation on a background thread and returns None, the template then falls back to the
+    original file.
+    """
+
+    def __init__(
+        self,
+        source_dir,
+        output_dir,
+        url_prefix,
+        widths=(160, 320, 640, 1280),
+        formats=("avif", "webp"),
+        quality=70,
+        workers=1,
+    ):
+        """
+        :param source_dir: directory holding the original images
+        :param output_dir: directory the derivatives and manifests are written to
+        :param url_prefix: url the output directory is served from
+        :param widths: widths to generate, in pixels
+        :param formats: formats to generate, formats the installed Pillow cannot encode are skipped
+        :param quality: encoder quality, 0 to 100
+        :param workers: number of background threads generating derivatives
+        """
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.widths = sorted(widths)
+        self.formats = [
+            image_format for image_format in formats if features.check(image_format)
+        ]
+        self.quality = quality
+        self.workers = workers
+        self._sets = {}
+        self._pending = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _manifest_path(self, name):
+        return os.path.join(self.output_dir, name + ".json")
+
+    def _source_path(self, name):
+        path = os.path.normpath(os.path.join(self.source_dir, name))
+        if os.path.dirname(path) != os.path.normpath(self.source_dir):
+            raise ValueError("Image must be a file of the images directory: " + name)
+        return path
+
+    def _load_manifest(self, name):
+        try:
+            with open(self._manifest_path(name)) as manifest:
+                data = json.load(manifest)
+        except (OSError, ValueError):
+            return None
+        return ImageSet(
+            data["name"],
+            data["digest"],
+            data["widths"],
+            data["formats"],
+            self.url_prefix,
+        )
+
+    def lookup(self, name):
+        """
+        :param name: file name of a source image
+        :return: ImageSet, or None if its derivatives are not generated yet
+        """
+        if not name or not self.formats or os.path.basename(name) != name:
+            return None
+        image_set = self._sets.get(name)
+        if image_set is not None:
+            return image_set
+        image_set = self._load_manifest(name)
+        if image_set is not None:
+            with self._lock:
+                self._sets[name] = image_set
+            return image_set
+        if name not in self._failed:
+            self.generate_async(name)
+        return None
+
+    def generate_async(self, name):
+        """
+        Schedules the generation of the derivatives of name on a background thread.
+        Called by the admin routes when a product registers an image, which also retries
+        images that could not be generated before.
+        :param name: file name of a source image
+        """
+        if not name or not self.formats or not self.workers:
+            return
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+            self._failed.discard(name)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="images"
+                )
+            self._executor.submit(self._generate_logged, name)
+
+    def _generate_logged(self, name):
+        try:
+            self.generate(name)
+        except Exception as e:
+            logging.warning("Could not generate derivatives of %s: %s", name, e)
+            with self._lock:
+                self._failed.add(name)
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def generate(self, name):
+        """
+        Writes the derivatives of name unless they exist for its current content.
+        :param name: file name of a source image
+        :return: ImageSet
+        """
+        source = self._source_path(name)
+        with open(source, "rb") as source_file:
+            digest = hashlib.sha256(source_file.read()).hexdigest()[:12]
+        current = self._load_manifest(name)
+        if (
+            current is not None
+            and current.digest == digest
+            and current.formats == self.formats
+            and all(
+                os.path.exists(os.path.join(self.output_dir, current.file_name(w, f)))
+                for w in current.widths
+                for f in current.formats
+            )
+        ):
+            image_set = current
+        else:
+            image_set = self._write(name, source, digest)
+        with self._lock:
+            self._sets[name] = image_set
+        return image_set
+
+    def _write(self, name, source, digest):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with Image.open(source) as original:
+            original.load()
+            image = original.convert(
+                "RGBA"
+                if "A" in original.getbands() or "transparency" in original.info
+                else "RGB"
+            )
+        largest = min(image.width, self.widths[-1])
+        widths = [width for width in self.widths if width < largest] + [largest]
+        image_set = ImageSet(name, digest, widths, self.formats, self.url_prefix)
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for image_format in self.formats:
+                path = os.path.join(
+                    self.output_dir, image_set.file_name(width, image_format)
+                )
+                # written under a temporary name first so no reader sees a partial file
+                temporary = "{}.{}.tmp".format(path, os.getpid())
+                resized.save(
+                    temporary,
+                    format=image_format.upper(),
+                    quality=self.quality,
+                    **SAVE_OPTIONS[image_format],
+                )
+                os.replace(temporary, path)
+        manifest_path = self._manifest_path(name)
+        temporary = "{}.{}.tmp".format(manifest_path, os.getpid())
+        with open(temporary, "w") as manifest:
+            json.dump(image_set.to_dict(), manifest)
+        os.replace(temporary, manifest_path)
+        return image_set
+
+    def build(self):
+        """
+        Generates the derivatives of every image of the source directory.
+        :return: list of (name, ImageSet or None) pairs, None for files that could not be read
+        """
+        results = []
+        for name in sorted(os.listdir(self.source_dir)):
+            if not os.path.isfile(os.path.join(self.source_dir, name)):
+                continue
+            try:
+                results.append((name, self.generate(name)))
+            except Exception as e:
+                logging.warning("Could not generate derivatives of %s: %s", name, e)
+                results.append((name, None))
+        return results
@@ -0,0 +1,49 @@
+# Per-request counters collected from SQLAlchemy events
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+
+# This function counts and times every statement sent to the database during a request
+def count_queries(engine):
+    """
+    :param engine: SQLAlchemy engine of the application, the count is kept in g.query_count
+    and the time spent in g.query_time
+    """
+    event.listen(engine, "before_cursor_execute", _count_query)
+    event.listen(engine, "after_cursor_execute", _time_query)
+    event.listen(engine, "handle_error", _drop_query)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if starts and has_request_context():
+        g.query_time = g.get("query_time", 0.0) + time.perf_counter() - starts.pop()
+
+
+def _drop_query(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+
+def query_count():
+    """
+    :return: number of statements sent to the database by the current request
+    """
+    return g.get("query_count", 0)
+
+
+def query_time():
+    """
+    :return: seconds spent in the statements of the current request
+    """
+    return g.get("query_time", 0.0)
@@ -0,0 +1,211 @@
+# Logging off the request threads: records are queued and written as JSON lines by a listener thread
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+try:
+    import fcntl
+except ImportError:  # Windows, served by a single waitress process
+    fcntl = None
+
+# Attributes copied from the request context onto each record, and written when present
+CONTEXT_FIELDS = ("request_id", "route", "user_id", "method", "status", "duration_ms")
+
+_listener = None
+
+
+# This class writes each record as one JSON object per line
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        """
+        :param record: log record, formatted on the listener thread
+        :return: JSON line with the time, level, logger, message, request fields and traceback
+        """
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# This class tags records logged during a request with its id, route and user
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.route = (
+                request.url_rule.rule if request.url_rule is not None else request.path
+            )
+            # only read the user flask-login already loaded, never query for it here
+            record.user_id = getattr(g.get("_login_user"), "id", None)
+        return True
+
+
+# This class keeps a fraction of the records of high volume loggers, warnings and errors are always kept
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        """
+        :param rates: dict of logger name to the fraction of its records kept, 0 to 1
+        """
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+# This class queues records as they are, the traceback is formatted by the listener instead
+class RequestQueueHandler(QueueHandler):
+    """
+    The standard QueueHandler formats the message and traceback in the logging thread so
+    records can be pickled. The queue here never leaves the process, so only the message
+    arguments are merged, against later changes to the objects they reference.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# This class rotates a log file shared by every server process of the host
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler sizes the file from its own stream and renames it without telling
+    the other processes, so workers sharing a file would truncate each other's records.
+    Here the size is read from the file itself, a process finding the file was rotated
+    reopens it, and the rotation holds a lock file, so only one of the processes waiting on
+    it renames the files. The host keeps at most backup_count + 1 files of max_bytes,
+    however many workers come and go.
+    """
+
+    def __init__(self, filename, **kwargs):
+        self._identity = None
+        super().__init__(filename, **kwargs)
+        self.lock_path = self.baseFilename + ".lock"
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def _rotated(self):
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._identity
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self._rotated():
+            self.stream.close()
+            self.stream = None
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes <= 0:
+            return False
+        message = "{}{}".format(self.format(record), self.terminator)
+        size = os.fstat(self.stream.fileno()).st_size
+        return size + len(message.encode(self.encoding or "utf-8")) >= self.maxBytes
+
+    def doRollover(self):
+        if fcntl is None:
+            super().doRollover()
+            return
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # another process may have rotated the file while this one waited
+                if self._rotated():
+                    self.stream.close()
+                    self.stream = self._open()
+                else:
+                    super().doRollover()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# This function sends the root logger through a queue to a rotating JSON log file
+def configure_logging(
+    path="./spwebapp.log",
+    max_bytes=10485760,
+    backup_count=5,
+    level="INFO",
+    sample_rates=None,
+    enabled=True,
+):
+    """
+    Replaces the handlers of the root logger. Calling it again stops the previous listener
+    after it has written the records already queued.
+    :param path: log file, shared by the server processes of the host
+    :param max_bytes: size at which the file is rotated
+    :param backup_count: number of rotated files kept
+    :param level: level name of the root logger
+    :param sample_rates: dict of logger name to the fraction of its records kept
+    :param enabled: False discards every record
+    :return: the started QueueListener, None when logging is disabled
+    """
+    global _listener
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    if not enabled:
+        root.addHandler(logging.NullHandler())
+        root.setLevel(logging.CRITICAL + 1)
+        return None
+    file_handler = SharedRotatingFileHandler(
+        path,
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JSONFormatter())
+    queue_handler = RequestQueueHandler(queue.SimpleQueue())
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    queue_handler.addFilter(RequestContextFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(
+        queue_handler.queue, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
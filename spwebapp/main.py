@@ -1,45 +1,155 @@
 # Import required modules
 import configparser
+import hmac
+import io
 import logging
+import mimetypes
+import os
 import re
-
-from flask import Flask, flash, redirect, render_template, request, session, url_for
-from flask_bcrypt import Bcrypt
-from flask_login import LoginManager, UserMixin, login_required, login_user, logout_user
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    current_app,
+    flash,
+    g,
+    has_request_context,
+    redirect,
+    render_template,
+    request,
+    send_from_directory,
+    session,
+    stream_with_context,
+    url_for,
+)
+from flask_login import (
+    LoginManager,
+    UserMixin,
+    current_user,
+    login_required,
+    login_user,
+    logout_user,
+)
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
-
-# Set config for logging
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-logging.basicConfig(
-    filename="./spwebapp.log",
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import create_engine
+
+from assets import AssetBundler
+from bulk_import import PRODUCT_COLUMNS, ImportReport, read_rows, upsert_products
+from cart_store import MemoryCartStore, SQLCartStore, new_cart_id
+from catalog_cache import CachedProduct, CatalogCache, snapshot
+from db_pool import engine_options, pool_stats
+from db_routing import (
+    REPLICA_BIND,
+    ReplicaSet,
+    RoutingSession,
+    primary_reads,
+    read_engine,
+    replica_reads,
+    stick_to_primary,
 )
-
-# Read config from ini file
+from export import EXPORT_FORMATS, stream_rows
+from fragment_cache import FragmentCacheExtension
+from hashing import HasherBusy, PasswordHasher
+from images import ImageDerivatives
+from instrumentation import count_queries, query_count, query_time
+from log_queue import configure_logging
+from metrics import Metrics
+from order_queue import OrderQueue
+from page_cache import CSRF_PLACEHOLDER, PageCache
+from pagination import KeysetPage, keyset_page, parse_page_args, to_int
+from responses import compress, conditional
+from search_index import SearchIndex, cursor_of, parse_cursor
+from stock import OutOfStock, release, reserve, retry_conflicts
+from summary_tables import SummaryTables
+from user_cache import CachedUser, UserCache
+
+# One record per request, sampled by the access_sample setting of the [logging] section of config.ini
+access_log = logging.getLogger("spwebapp.access")
+
+# Config read from the ini file by create_app
 config = configparser.ConfigParser()
-config.read("./config.ini")
-# Create the application
-app = Flask(__name__)
-
-# Define the configuration for your application
-app.config["SQLALCHEMY_DATABASE_URI"] = config["sql"]["uri"]
-app.config["SECRET_KEY"] = config["flask"]["session_secret"]
-app.static_folder = "./static"
-app.config.update(
-    SESSION_COOKIE_SECURE=True,
-    SESSION_COOKIE_HTTPONLY=True,
-    SESSION_COOKIE_SAMESITE="Strict",
-)
-# Initialize database and cryptography
-db = SQLAlchemy()
-bcrypt = Bcrypt(app)
+
+# Initialize database, the routes blueprint and the caches and stores built by create_app
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+bp = Blueprint("spwebapp", __name__, cli_group=None)
+hasher = None
+catalog = None
+users = None
+carts = None
+images = None
+assets = None
+pages = None
+fragments = None
+metrics = None
+checkouts = None
+search_index = None
+summaries = None
+
+
+# Start the clock of the request metrics and give the request an id for the logs
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex
+
+
+# Record the request metrics, registered before the other hooks so it runs after them
+@bp.after_app_request
+def record_request_metrics(response):
+    """
+    Latency, SQL statements and time, and the size of the body once compressed, per endpoint.
+    :param response:
+    :return: the response unchanged
+    """
+    if metrics is not None and "request_start" in g:
+        metrics.observe_request(
+            (request.endpoint or "unmatched").rpartition(".")[2],
+            request.method,
+            response.status_code,
+            time.perf_counter() - g.request_start,
+            query_count(),
+            query_time(),
+            None if response.is_streamed else response.calculate_content_length(),
+        )
+    return response
+
+
+# Log the request once the other hooks settled its status
+@bp.after_app_request
+def log_request(response):
+    """
+    :param response:
+    :return: the response with the X-Request-ID header
+    """
+    if "request_start" in g:
+        response.headers["X-Request-ID"] = g.request_id
+        if access_log.isEnabledFor(logging.INFO):
+            access_log.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                response.status_code,
+                extra={
+                    "method": request.method,
+                    "status": response.status_code,
+                    "duration_ms": round(
+                        (time.perf_counter() - g.request_start) * 1e3, 3
+                    ),
+                },
+            )
+    return response
 
 
 # Define Security header
-@app.after_request
+@bp.after_app_request
 def add_security_header(response):
     """
     Function to define security headers
@@ -56,16 +166,67 @@ def add_security_header(response):
     return response
 
 
+# Report the number of database queries made by the request when enabled in config.ini
+@bp.after_app_request
+def add_query_count_header(response):
+    """
+    :param response:
+    :return: response with the X-Query-Count header if query_count_header is enabled
+    """
+    if current_app.config["QUERY_COUNT_HEADER"]:
+        response.headers["X-Query-Count"] = str(query_count())
+    return response
+
+
+# Answer conditional GETs and compress responses, configured in the [compression] section of config.ini
+@bp.after_app_request
+def compress_response(response):
+    """
+    :param response:
+    :return: 304 response if the client's ETag matches, otherwise the response compressed
+    with gzip or brotli when the client accepts it
+    """
+    if current_app.config["ETAGS"]:
+        response = conditional(
+            response,
+            request,
+            csrf_token=g.get("csrf_token"),
+            csrf_time_limit=current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600),
+            csrf_secret=session.get(
+                current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+            ),
+        )
+    if current_app.config["COMPRESS"]:
+        response = compress(
+            response,
+            request,
+            min_size=current_app.config["COMPRESS_MIN_SIZE"],
+            gzip_level=current_app.config["COMPRESS_GZIP_LEVEL"],
+            brotli_quality=current_app.config["COMPRESS_BROTLI_QUALITY"],
+        )
+    return response
+
+
 # Define login manager/handler
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "users.login"
+login_manager.login_view = "spwebapp.login"
 login_manager.login_message = "Please login to continue"
 login_manager.login_message_category = "info"
 
 # Initialize protection against cross site request forgery
 csrf = CSRFProtect()
-csrf.init_app(app)
+
+
+# This function answers requests that could not get a password hashing slot
+def hasher_busy():
+    """
+    :return: 503 response asking the client to retry shortly
+    """
+    return (
+        "Too many login attempts are being processed. Try again in a moment.",
+        503,
+        {"Retry-After": "1"},
+    )
 
 
 # This function handles unauthorized login attempts
@@ -90,7 +251,7 @@ class Users(UserMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(13), unique=True, nullable=False)
-    password = db.Column(db.String(12, 128), nullable=False)
+    password = db.Column(db.String(128), nullable=False)
     email = db.Column(db.String(30), unique=True, nullable=False)
     accesslevel = db.Column(db.String(13), default="user", nullable=False)
     isactive = db.Column(db.String(3), default="yes", nullable=False)
@@ -102,71 +263,496 @@ class Products(db.Model):
     id - primary key
     name - product name, not nullable.
     brand - brand name for product, not nullable.
-    code - unique identifier for each product, not nullable.
+    code - unique identifier for each product, not nullable. Indexed for lookups.
     price - price value for each product.
     image - name of the image file for the product stored in /static/images.
+    stock - units left to sell, NULL when the product's stock is not tracked.
+    stock_version - bumped by every change of the row but the sales of an untracked stock, so
+    an update made from an older read of it fails instead of overwriting the sales made
+    since, see reserve in stock.py.
+    The (brand, id) and (price, id) indexes back the filtered, paginated listings.
     """
 
+    __table_args__ = (
+        db.Index("ix_products_brand_id", "brand", "id"),
+        db.Index("ix_products_price_id", "price", "id"),
+        db.CheckConstraint("stock >= 0", name="ck_products_stock"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     brand = db.Column(db.String(128), nullable=False)
-    code = db.Column(db.String(128), nullable=False)
+    code = db.Column(db.String(128), unique=True, index=True, nullable=False)
     price = db.Column(db.Integer, nullable=False)
     image = db.Column(db.String(128), nullable=False)
+    stock = db.Column(db.Integer, nullable=True)
+    stock_version = db.Column(db.Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": stock_version}
 
 
-# This class defines the schema model for orders table in the database
+# This class defines the schema model for order headers table in the database
+class OrderHeaders(db.Model):
+    """
+    id - primary key
+    user_id - id of the user who checked out.
+    username - username of the logged in user at checkout.
+    email - email of the logged in user at checkout.
+    Address - Delivery address shared by every line of the order.
+    created_at - time of checkout.
+    The (user_id, id) index backs the checkouts of a user.
+    """
+
+    __table_args__ = (db.Index("ix_order_headers_user_id_id", "user_id", "id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    username = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), nullable=False)
+    Address = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# This class defines the schema model for orders table in the database, one row per ordered product
 class Orders(db.Model):
     """
     order_id - primary key
+    header_id - order header holding the user and delivery address of the checkout.
+    user_id - id of the user who placed the order, copied from the order header.
     product - product code, unique identifier for product, not nullable.
     name - product name, not nullable.
-    username - username of the logged in user.
-    email - email of the logged in user.
-    price - price value for the product.
+    username - username of the logged in user. Only set on orders placed before order headers.
+    email - email of the logged in user. Only set on orders placed before order headers.
+    price - unit price of the product in whole euros, as in the products table.
     quantity - quantity ordered for the product.
-    Address - Delivery address for the specific order.
+    Address - Delivery address for the specific order. Only set on orders placed before order headers.
+    status - fulfillment status, set to placed when the order is created.
+    created_at - time the order was placed.
+    The (status, order_id) and (created_at, order_id) indexes back the filtered order listings,
+    the (user_id, order_id) index the order history of a user.
     """
 
+    __table_args__ = (
+        db.Index("ix_orders_status_order_id", "status", "order_id"),
+        db.Index("ix_orders_created_at_order_id", "created_at", "order_id"),
+        db.Index("ix_orders_user_id_order_id", "user_id", "order_id"),
+    )
+
     order_id = db.Column(db.Integer, primary_key=True)
+    header_id = db.Column(db.Integer, db.ForeignKey("order_headers.id"), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     product = db.Column(db.String(128), nullable=False)
     name = db.Column(db.String(128), nullable=False)
-    username = db.Column(db.String(128), nullable=False)
-    email = db.Column(db.String(128), nullable=False)
-    price = db.Column(db.String(128), nullable=False)
-    quantity = db.Column(db.String(128), nullable=False)
-    Address = db.Column(db.String(128), nullable=False)
+    username = db.Column(db.String(255))
+    email = db.Column(db.String(255))
+    price = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    Address = db.Column(db.String(255))
+    status = db.Column(db.String(32), default="placed", nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
 
-# Add the initialized db to the application context
-db.init_app(app)
+# This class defines the schema model for the catalog version stamp in the database
+class CatalogVersion(db.Model):
+    """
+    id - primary key, the table holds a single row.
+    version - incremented in the same transaction as every change to the products table.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
 
 
 # This function creates database values if they do not already exist.
-with app.app_context():
-    db.create_all()
+def init_db():
+    """
+    Creates the tables of the models, of the cart store, of the order queue and of the
+    summaries and the catalog version row. Must run inside an application context, see
+    the init-db command. Tables are created on the primary only, replicas copy them.
+    """
+    db.create_all(bind_key=None)
+    if db.session.get(CatalogVersion, 1) is None:
+        db.session.add(CatalogVersion(id=1, version=0))
+        db.session.commit()
+    carts.create_tables()
+    checkouts.create_tables()
+    summaries.create_tables()
+
+
+# This function writes the order header and lines of a checkout event, run by the order queue workers
+def write_order(conn, event_id, order):
+    """
+    Runs in the transaction marking the event done, so an order is written exactly once,
+    along with its share of the summary tables.
+    :param conn: connection of the queue transaction
+    :param event_id: id of the order event
+    :param order: payload recorded at checkout
+    """
+    created_at = datetime.fromisoformat(order["created_at"])
+    header_id = conn.execute(
+        db.insert(OrderHeaders).values(
+            user_id=order["user_id"],
+            username=order["username"],
+            email=order["email"],
+            Address=order["address"],
+            created_at=created_at,
+        )
+    ).inserted_primary_key[0]
+    lines = [
+        {
+            "header_id": header_id,
+            "user_id": order["user_id"],
+            "product": item["code"],
+            "name": item["name"],
+            "price": int(item["price"]),
+            "quantity": int(item["quantity"]),
+            "status": "placed",
+            "created_at": created_at,
+        }
+        for item in order["items"]
+    ]
+    conn.execute(db.insert(Orders), lines)
+    summaries.add_orders(conn, lines)
+
+
+# This function puts back the stock reserved by a checkout whose order could not be written
+def release_order(conn, event_id, order):
+    """
+    Run by the order queue in the transaction marking the event failed.
+    :param conn: connection of the queue transaction
+    :param event_id: id of the order event
+    :param order: payload recorded at checkout
+    """
+    quantities = {}
+    for item in order["items"]:
+        quantities[item["code"]] = quantities.get(item["code"], 0) + int(
+            item["quantity"]
+        )
+    release(conn, Products.__table__, quantities)
+    logging.warning("Order event %s failed, its stock was released", event_id)
+
+
+# One-off command creating the database values, run with: flask --app main init-db
+@bp.cli.command("init-db")
+def init_db_command():
+    init_db()
+    print("Database initialised")
+
+
+# Recompute the summary tables from the orders, run with: flask --app main rebuild-summaries
+@bp.cli.command("rebuild-summaries")
+def rebuild_summaries_command():
+    daily, statuses = summaries.rebuild(Orders.__table__)
+    print("Summaries rebuilt: {} product days, {} statuses".format(daily, statuses))
+
+
+# This function disables or enables an account or changes its role
+def set_user_access(username, accesslevel=None, isactive=None):
+    """
+    The cached copy of the user is dropped once the change is committed, so this process stops
+    serving the old role at once; other processes reload the user within [cache] user_ttl seconds.
+    :param username: login name of the account to change
+    :param accesslevel: new role, one of user, fulfillment or admin, unchanged if not given
+    :param isactive: yes to enable the account or no to disable it, unchanged if not given
+    :return: Users row after the change, or None if there is no such user
+    """
+    user = Users.query.filter_by(username=username).first()
+    if user is None:
+        return None
+    if accesslevel is not None:
+        user.accesslevel = accesslevel
+    if isactive is not None:
+        user.isactive = isactive
+    db.session.commit()
+    users.invalidate(user.id)
+    return user
+
+
+# Change an account from the command line, run with: flask --app main set-user alice --active no
+@bp.cli.command("set-user")
+@click.argument("username")
+@click.option(
+    "--role", "accesslevel", type=click.Choice(["user", "fulfillment", "admin"])
+)
+@click.option("--active", "isactive", type=click.Choice(["yes", "no"]))
+def set_user_command(username, accesslevel, isactive):
+    user = set_user_access(username, accesslevel=accesslevel, isactive=isactive)
+    if user is None:
+        raise click.ClickException("No user named {}".format(username))
+    print(
+        "User {}: role {}, active {}".format(
+            user.username, user.accesslevel, user.isactive
+        )
+    )
+
+
+# Functions used by the catalog cache to read from the database
+@primary_reads
+def load_product(code):
+    product = Products.query.filter_by(code=code).first()
+    return snapshot(product) if product is not None else None
+
 
+@primary_reads
+def load_products():
+    # plain column rows, building 100k ORM objects only to copy them is several times slower
+    columns = [getattr(Products, name) for name in CachedProduct._fields]
+    return [CachedProduct._make(row) for row in db.session.query(*columns)]
 
-# Function to load the user in login manager
+
+@primary_reads
+def load_catalog_version():
+    return db.session.query(CatalogVersion.version).filter_by(id=1).scalar() or 0
+
+
+def bump_catalog_version():
+    """
+    Increments the catalog version stamp as part of the current transaction.
+    :return: the new version
+    """
+    CatalogVersion.query.filter_by(id=1).update(
+        {CatalogVersion.version: CatalogVersion.version + 1}
+    )
+    return load_catalog_version()
+
+
+# This function returns one page of the catalog, filtered by brand and price range
+def product_page(args):
+    """
+    :param args: request.args with optional after/before/size paging values and brand,
+    min_price and max_price filters
+    :return: KeysetPage of CachedProduct, served from the catalog cache when possible
+    """
+    page_args = parse_page_args(
+        args,
+        default_size=config.getint("pagination", "page_size", fallback=24),
+        max_size=config.getint("pagination", "max_page_size", fallback=100),
+    )
+
+    @primary_reads
+    def load():
+        query = Products.query
+        if page_args.get("brand"):
+            query = query.filter(Products.brand == page_args["brand"])
+        if to_int(page_args.get("min_price")) is not None:
+            query = query.filter(Products.price >= to_int(page_args["min_price"]))
+        if to_int(page_args.get("max_price")) is not None:
+            query = query.filter(Products.price <= to_int(page_args["max_price"]))
+        return keyset_page(query, Products.id, page_args, transform=snapshot)
+
+    return catalog.listing(tuple(sorted(page_args.items())), load)
+
+
+# This function reads the stock of a page of products, which the catalog cache does not hold
+def stock_levels(products):
+    """
+    Stock changes with every checkout without moving the catalog version, so it is read
+    from the database each time.
+    :param products: list of CachedProduct
+    :return: dict of the stock of each product by code, None for a stock not tracked
+    """
+    if not products:
+        return {}
+    return dict(
+        Products.query.filter(Products.code.in_([product.code for product in products]))
+        .with_entities(Products.code, Products.stock)
+        .all()
+    )
+
+
+# This function returns one page of the products matching a search, ordered by price
+def search_page(args):
+    """
+    :param args: request.args with the q search text, optional brand, min_price and
+    max_price filters and after/before/size paging values, after and before being the
+    "price:code" keys of the products bounding the page
+    :return: KeysetPage of CachedProduct, served from the search index
+    """
+    page_args = parse_page_args(
+        args,
+        default_size=config.getint("pagination", "page_size", fallback=24),
+        max_size=config.getint("pagination", "max_page_size", fallback=100),
+    )
+    filters = {
+        name: value
+        for name, value in page_args.items()
+        if name not in ("after", "before") and value is not None
+    }
+    after = parse_cursor(args.get("after"))
+    before = parse_cursor(args.get("before"))
+    search_index.sync(catalog.current_version())
+    products, more = search_index.search(
+        args.get("q", ""),
+        brand=page_args.get("brand"),
+        min_price=to_int(page_args.get("min_price")),
+        max_price=to_int(page_args.get("max_price")),
+        after=after,
+        before=before,
+        limit=page_args["size"],
+    )
+    if before is not None:
+        return KeysetPage(products, cursor_of, more, True, filters)
+    return KeysetPage(products, cursor_of, after is not None, more, filters)
+
+
+# This function builds the orders query for the filter values of a fulfillment request
+def filtered_orders(args):
+    """
+    :param args: request.args with optional status, date_from and date_to (YYYY-MM-DD) filters
+    :return: query over Orders, not ordered
+    """
+    query = Orders.query
+    if args.get("status"):
+        query = query.filter(Orders.status == args["status"])
+    try:
+        if args.get("date_from"):
+            date_from = datetime.strptime(args["date_from"], "%Y-%m-%d")
+            query = query.filter(Orders.created_at >= date_from)
+        if args.get("date_to"):
+            date_to = datetime.strptime(args["date_to"], "%Y-%m-%d")
+            query = query.filter(Orders.created_at < date_to + timedelta(days=1))
+    except ValueError:
+        flash("Dates should be in the YYYY-MM-DD format")
+    return query
+
+
+# Columns shown in the orders listing and export, user and address come from the order header
+ORDER_COLUMNS = [
+    Orders.order_id,
+    Orders.header_id,
+    Orders.product,
+    Orders.name,
+    db.func.coalesce(OrderHeaders.username, Orders.username).label("username"),
+    db.func.coalesce(OrderHeaders.email, Orders.email).label("email"),
+    Orders.price,
+    Orders.quantity,
+    db.func.coalesce(OrderHeaders.Address, Orders.Address).label("Address"),
+    Orders.status,
+    Orders.created_at,
+]
+
+
+def order_rows(query):
+    """
+    :param query: query over Orders, as returned by filtered_orders
+    :return: query returning ORDER_COLUMNS rows
+    """
+    return query.outerjoin(
+        OrderHeaders, Orders.header_id == OrderHeaders.id
+    ).with_entities(*ORDER_COLUMNS)
+
+
+# Columns shown in the order history of a user, read from the orders table alone
+MY_ORDER_COLUMNS = [
+    Orders.order_id,
+    Orders.product,
+    Orders.name,
+    Orders.price,
+    Orders.quantity,
+    (Orders.price * Orders.quantity).label("total"),
+    Orders.status,
+    Orders.created_at,
+]
+
+
+# This function computes the sales figures of the matching orders in the database
+def sales_summary(query, top=10):
+    """
+    Every figure is a SUM/COUNT with GROUP BY run by the database, only the aggregated rows
+    are fetched.
+    :param query: query over Orders, as returned by filtered_orders
+    :param top: number of products and customers listed
+    :return: dict with the totals, the figures per status and the products and customers
+    with the highest revenue
+    """
+    lines = db.func.count(Orders.order_id).label("lines")
+    units = db.func.coalesce(db.func.sum(Orders.quantity), 0).label("units")
+    revenue = db.func.coalesce(db.func.sum(Orders.price * Orders.quantity), 0).label(
+        "revenue"
+    )
+    checkouts_count = db.func.count(db.distinct(Orders.header_id)).label("checkouts")
+    return {
+        "totals": query.with_entities(checkouts_count, lines, units, revenue).one(),
+        "statuses": query.with_entities(Orders.status, lines, units, revenue)
+        .group_by(Orders.status)
+        .order_by(Orders.status)
+        .all(),
+        "products": query.with_entities(
+            Orders.product, db.func.max(Orders.name).label("name"), units, revenue
+        )
+        .group_by(Orders.product)
+        .order_by(revenue.desc())
+        .limit(top)
+        .all(),
+        "customers": query.outerjoin(Users, Orders.user_id == Users.id)
+        .with_entities(
+            Orders.user_id,
+            db.func.max(Users.username).label("username"),
+            checkouts_count,
+            units,
+            revenue,
+        )
+        .group_by(Orders.user_id)
+        .order_by(revenue.desc())
+        .limit(top)
+        .all(),
+    }
+
+
+# This function builds the cart store selected by the [cart] section of config.ini
+def create_cart_store():
+    """
+    backend = memory keeps carts in the worker process, which only suits a single process.
+    backend = sql keeps them in the database given by uri, or the application database if uri is empty.
+    The SQL store always gets its own engine and pool, since a request holding a session connection
+    could otherwise wait on the same pool for a cart connection and exhaust it under load.
+    :return: CartStore
+    """
+    ttl = config.getint("cart", "ttl", fallback=86400)
+    if config.get("cart", "backend", fallback="sql") == "memory":
+        return MemoryCartStore(
+            max_carts=config.getint("cart", "max_carts", fallback=100000), ttl=ttl
+        )
+    uri = config.get("cart", "uri", fallback="") or config["sql"]["uri"]
+    if uri == config["sql"]["uri"] and not engine_options(config, uri):
+        # an in-memory SQLite database only exists within its own engine
+        return SQLCartStore(db.engine, ttl=ttl)
+    return SQLCartStore(create_engine(uri, **engine_options(config, uri)), ttl=ttl)
+
+
+# Function used by the user cache to read a user from the database
+@primary_reads
+def load_user(user_id):
+    """
+    :return: CachedUser or None if the user does not exist or the account is disabled
+    """
+    user = db.session.get(Users, int(user_id))
+    if user is None or user.isactive != "yes":
+        return None
+    return CachedUser(user)
+
+
+# Function to load the user in login manager, Flask-Login keeps the result for the rest of the request
 @login_manager.user_loader
 def user_loader(user_id):
     try:
-        return Users.query.get(user_id)
+        return users.get(user_id)
     except Exception as e:
         logging.exception(e)
         return "Oops....Unexpected error. Contact Site Administrator if it persists."
 
 
 # Define the endpoint for admin portal
-@app.route("/admin", methods=["GET", "POST"])
+@bp.route("/admin", methods=["GET", "POST"])
 @login_required
+@replica_reads
 def admin():
     """
     Function to check user's access level for admin capabilities.
     :return: return to admin portal if user's access level is admin or redirect to index
     """
     try:
-        user = Users.query.filter_by(id=session["_user_id"]).first()
+        user = current_user
     except Exception as e:
         logging.exception(e)
         return print(
@@ -175,21 +761,59 @@ def admin():
     if user.accesslevel:
         if user.accesslevel == "admin":
             try:
-                product = Products.query.all()
-                return render_template("admin.html", products=product)
+                version = catalog.current_version()
+                page = product_page(request.args)
+                stock = stock_levels(page.items)
+                return render_template(
+                    "admin.html",
+                    products=page.items,
+                    page=page,
+                    catalog_version=version,
+                    stock=stock,
+                    stock_key=tuple(sorted(stock.items())),
+                    dashboard=summaries.dashboard(
+                        days=config.getint("dashboard", "days", fallback=30),
+                        top=config.getint("dashboard", "top_products", fallback=10),
+                        engine=read_engine(db.engine),
+                    ),
+                )
             except Exception as e:
                 logging.exception(e)
                 print(
                     "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
                 )
         else:
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
     else:
-        return redirect(url_for("index"))
+        return redirect(url_for(".index"))
+
+
+# Define the endpoint reporting the state of the database connection pools
+@bp.route("/admin/pool", methods=["GET"])
+@login_required
+def admin_pool():
+    """
+    Reports size, checked out and overflow connections and the checkout wait times of the
+    application pool, of the read replica pools and of the cart store pool, and the health
+    of the replicas.
+    :return: JSON pool stats if user's access level is admin or redirect to index
+    """
+    if current_user.accesslevel != "admin":
+        return redirect(url_for(".index"))
+    stats = {"app": pool_stats(db.engine)}
+    replicas = current_app.extensions.get("replicas")
+    if replicas is not None:
+        stats["replicas"] = [
+            dict(replica, pool=pool_stats(engine))
+            for replica, engine in zip(replicas.stats(), replicas.engines)
+        ]
+    if isinstance(carts, SQLCartStore) and carts.engine is not db.engine:
+        stats["cart"] = pool_stats(carts.engine)
+    return stats
 
 
 # Define the endpoint for registration portal
-@app.route("/sign_up", methods=["GET", "POST"])
+@bp.route("/sign_up", methods=["GET", "POST"])
 def register():
     """
     GET - renders registration page.
@@ -206,51 +830,51 @@ def register():
         ):
             if len(request.form.get("username")) > 13:
                 flash("Username can be max 13 characters.")
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
             elif len(request.form.get("password")) > 128:
                 flash("Password can be max 128 characters.")
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
             elif len(request.form.get("email")) > 30:
                 flash("Email can be max 30 characters.")
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
             elif bool(
                 re.match("^[a-zA-Z0-9]*$", request.form.get("username")) == False
             ):
                 flash("Username cannot contain any special characters")
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
             elif len(request.form.get("password")) < 12:
                 flash("Password should be minimum 12 characters")
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
             try:
                 user = Users(
                     username=request.form.get("username"),
-                    password=bcrypt.generate_password_hash(
-                        request.form.get("password")
-                    ).decode("utf-8"),
+                    password=hasher.hash(request.form.get("password")),
                     email=request.form.get("email"),
                 )
                 db.session.add(user)
                 db.session.commit()
                 flash("User Created. You can now log in")
-                return redirect(url_for("login"))
+                return redirect(url_for(".login"))
+            except HasherBusy:
+                return hasher_busy()
             except Exception as e:
                 logging.exception(e)
                 flash(
                     "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
                 )
-                return redirect(url_for("register"))
+                return redirect(url_for(".register"))
         flash("one of the required fields is blank")
-        return redirect(url_for("register"))
+        return redirect(url_for(".register"))
     try:
         if session["_user_id"]:
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
     except Exception as e:
         logging.exception(e)
         return render_template("sign_up.html")
 
 
 # Define the endpoint for login portal
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     """
     GET - renders login page.
@@ -266,34 +890,34 @@ def login():
                 ).first()
                 if user is None:
                     flash("Incorrect Username or Password")
-                    return redirect(url_for("login"))
-                if bcrypt.check_password_hash(
-                    user.password, request.form.get("password")
-                ):
+                    return redirect(url_for(".login"))
+                if hasher.check(user.password, request.form.get("password")):
                     if user.isactive == "yes":
                         login_user(user)
                         flash("You are now logged in")
                         if user.accesslevel == "admin":
-                            return redirect(url_for("admin"))
+                            return redirect(url_for(".admin"))
                         if user.accesslevel == "fulfillment":
-                            return redirect(url_for("orders"))
-                        return redirect(url_for("home"))
+                            return redirect(url_for(".orders"))
+                        return redirect(url_for(".home"))
                     flash("Your account is disabled. Contact administrator")
-                    return redirect(url_for("login"))
+                    return redirect(url_for(".login"))
                 flash("Incorrect Username or Password")
+            except HasherBusy:
+                return hasher_busy()
             except Exception as e:
                 logging.exception(e)
                 print(
                     "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
                 )
-            return redirect(url_for("login"))
+            return redirect(url_for(".login"))
         flash("one of the required fields is blank")
-        return redirect(url_for("login"))
+        return redirect(url_for(".login"))
     return render_template("login.html")
 
 
 # Define the endpoint for logout portal
-@app.route("/logout", methods=["GET"])
+@bp.route("/logout", methods=["GET"])
 @login_required
 def logout():
     """
@@ -304,7 +928,7 @@ def logout():
         logout_user()
         session.clear()
         flash("You have been logged out")
-        return redirect(url_for("home"))
+        return redirect(url_for(".home"))
     except Exception as e:
         logging.exception(e)
         print(
@@ -312,77 +936,276 @@ def logout():
         )
 
 
+# This function serves the pages without per-user content from the page cache
+def render_page(template):
+    """
+    Pages are cached per template and login state, the visitor's CSRF token is put back on
+    every hit. Requests with flashed messages pending bypass the cache.
+    :param template: name of the template
+    :return: rendered page
+    """
+    if session.get("_flashes"):
+        pages.bypass()
+        return render_template(template)
+    return pages.get(
+        (template, current_user.is_authenticated),
+        lambda: render_template(template, csrf_token=lambda: CSRF_PLACEHOLDER),
+        generate_csrf,
+    )
+
+
+# Define the endpoint reporting the page cache counters
+@bp.route("/admin/page_cache", methods=["GET"])
+@login_required
+def admin_page_cache():
+    """
+    :return: JSON page and fragment cache size, hits, misses and bypasses if user's access
+    level is admin or redirect to index
+    """
+    if current_user.accesslevel != "admin":
+        return redirect(url_for(".index"))
+    return {"pages": pages.stats(), "fragments": fragments.stats()}
+
+
+# Define the endpoint exposing the request metrics to a Prometheus scraper
+@bp.route("/metrics", methods=["GET"])
+def export_metrics():
+    """
+    Scrapers authenticate with the token of the [metrics] section of config.ini, sent as
+    Authorization: Bearer <token>. A logged in admin can read the metrics too.
+    :return: metrics in the Prometheus text exposition format, 401 if not authorized or 404
+    if metrics are disabled
+    """
+    if metrics is None:
+        abort(404)
+    token = current_app.config["METRICS_TOKEN"]
+    if not (
+        token
+        and hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            "Bearer {}".format(token).encode(),
+        )
+    ) and not (current_user.is_authenticated and current_user.accesslevel == "admin"):
+        return "Unauthorized", 401, {"WWW-Authenticate": "Bearer"}
+    return Response(
+        metrics.expose(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# Start the order queue workers of this process, and with them the events left by a restart
+@bp.before_app_request
+def start_order_queue():
+    checkouts.start()
+
+
+# Define the endpoint reporting the order queue
+@bp.route("/admin/order_queue", methods=["GET"])
+@login_required
+def admin_order_queue():
+    """
+    :return: JSON number of pending, done and failed order events and the age of the oldest
+    pending one if user's access level is admin or redirect to index
+    """
+    if current_user.accesslevel != "admin":
+        return redirect(url_for(".index"))
+    return checkouts.stats()
+
+
+# Process the order events from the command line, run with: flask --app main process-orders
+@bp.cli.command("process-orders")
+def process_orders_command():
+    print("{} order events processed".format(checkouts.process_pending()))
+
+
 # Define the endpoint for default path
-@app.route("/")
+@bp.route("/")
 def default_path():
     """
     :return: returns to home page
     """
-    return render_template("index.html")
+    return render_page("index.html")
 
 
 # Define the endpoint for the index page
-@app.route("/index")
+@bp.route("/index")
 def index():
     """
     :return: returns to home page
     """
-    return render_template("index.html")
+    return render_page("index.html")
 
 
 # Define the endpoint for home page
-@app.route("/home")
+@bp.route("/home")
 def home():
     """
     :return: returns to home page
     """
-    return render_template("index.html")
+    return render_page("index.html")
 
 
 # Define the endpoint for about page
-@app.route("/about")
+@bp.route("/about")
 def about():
     """
     :return: returns to about page
     """
-    return render_template("about.html")
+    return render_page("about.html")
 
 
 # Define the endpoint for contact page
-@app.route("/contact")
+@bp.route("/contact")
 def contact():
     """
     :return: returns to contact page
     """
-    return render_template("contact.html")
+    return render_page("contact.html")
 
 
 # Define the endpoint for frequently asked questions page
-@app.route("/faq")
+@bp.route("/faq")
 def faq():
     """
     :return: returns to page faq page
     """
-    return render_template("faq.html")
+    return render_page("faq.html")
 
 
 # Define the endpoint for orders management portal
-@app.route("/orders")
+@bp.route("/orders")
 @login_required
+@replica_reads
 def orders():
     """
     function checks if currently logged in user has the role 'fulfillment'
-    and also loads the orders info into the page.
+    and also loads one page of the orders info into the page.
+    Paging values and the status/date filters are read from the query string.
     :return: returns to order management page if user has the right role
     or redirects to index if user does not have fulfillment role.
     """
     try:
-        user = Users.query.filter_by(id=session["_user_id"]).first()
+        user = current_user
         if user.accesslevel == "fulfillment":
-            total_orders = Orders.query.all()
-            return render_template("orders.html", orders=total_orders)
+            page_args = parse_page_args(
+                request.args,
+                default_size=config.getint("pagination", "page_size", fallback=24),
+                max_size=config.getint("pagination", "max_page_size", fallback=100),
+            )
+            page = keyset_page(
+                order_rows(filtered_orders(page_args)),
+                Orders.order_id,
+                page_args,
+                key=lambda order: order.order_id,
+            )
+            return render_template("orders.html", orders=page.items, page=page)
         else:
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
+    except Exception as e:
+        logging.exception(e)
+        print(
+            "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
+        )
+
+
+# Define the endpoint for exporting orders
+@bp.route("/orders/export")
+@login_required
+@replica_reads
+def export_orders():
+    """
+    function streams the orders matching the status/date filters as csv or ndjson
+    (format query value, defaults to csv). Rows are fetched in batches with yield_per
+    so memory use does not grow with the size of the table.
+    :return: streamed export if user has the fulfillment role or redirects to index.
+    """
+    try:
+        user = current_user
+        if user.accesslevel != "fulfillment":
+            return redirect(url_for(".index"))
+        export_format = request.args.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            flash("Export format should be one of {}".format(", ".join(EXPORT_FORMATS)))
+            return redirect(url_for(".orders"))
+        rows = (
+            order_rows(filtered_orders(request.args))
+            .order_by(Orders.order_id)
+            .yield_per(1000)
+        )
+        columns = [column.key for column in ORDER_COLUMNS]
+        return Response(
+            stream_with_context(stream_rows(rows, columns, export_format)),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={
+                "Content-Disposition": "attachment; filename=orders.{}".format(
+                    export_format
+                )
+            },
+        )
+    except Exception as e:
+        logging.exception(e)
+        print(
+            "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
+        )
+
+
+# Define the endpoint for the order history of a shopper
+@bp.route("/my_orders")
+@login_required
+@replica_reads
+def my_orders():
+    """
+    function checks if currently logged in user has the role 'user' and loads one page
+    of the orders the user placed, newest first, from the (user_id, order_id) index.
+    Paging values are read from the query string.
+    :return: returns to the order history page if user has the user role
+    or redirects to index otherwise.
+    """
+    try:
+        user = current_user
+        if user.accesslevel != "user":
+            return redirect(url_for(".index"))
+        page_args = parse_page_args(
+            request.args,
+            default_size=config.getint("pagination", "page_size", fallback=24),
+            max_size=config.getint("pagination", "max_page_size", fallback=100),
+        )
+        page = keyset_page(
+            Orders.query.filter(Orders.user_id == user.id).with_entities(
+                *MY_ORDER_COLUMNS
+            ),
+            Orders.order_id,
+            page_args,
+            key=lambda order: order.order_id,
+            descending=True,
+        )
+        return render_template("my_orders.html", orders=page.items, page=page)
+    except Exception as e:
+        logging.exception(e)
+        print(
+            "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
+        )
+
+
+# Define the endpoint for the sales summary of the admin portal
+@bp.route("/admin/sales")
+@login_required
+@replica_reads
+def admin_sales():
+    """
+    function checks if currently logged in user has the role 'admin' and loads the sales
+    figures of the orders matching the status/date filters, see sales_summary.
+    :return: returns to the sales summary page if user has the admin role
+    or redirects to index otherwise.
+    """
+    try:
+        if current_user.accesslevel != "admin":
+            return redirect(url_for(".index"))
+        filters = {key: value for key, value in request.args.items() if value}
+        return render_template(
+            "sales.html",
+            page={"filters": filters},
+            **sales_summary(filtered_orders(filters)),
+        )
     except Exception as e:
         logging.exception(e)
         print(
@@ -391,74 +1214,26 @@ def orders():
 
 
 # Define the endpoint for adding items to cart
-@app.route("/add", methods=["POST"])
+@bp.route("/add", methods=["POST"])
 @login_required
 def add_product_to_cart():
     """
-    function builds a cart array from the chosen product and adds it to the user's cart
+    function adds the chosen product to the user's cart in the cart store, the session
+    only holds the id of the cart
     :return: returns updated cart to the user
     """
     try:
         _quantity = int(request.form["quantity"])
         _code = request.form["code"]
-        # validate the received values
-        if _quantity and _code and request.method == "POST":
-            product_value = ""
-            product_list = Products.query.all()
-            for product in product_list:
-                if product.code == _code:
-                    product_value = product
-                    break
-            product = product_value
-            itemArray = {
-                product.code: {
-                    "name": product.name,
-                    "code": product.code,
-                    "quantity": _quantity,
-                    "price": product.price,
-                    "image": product.image,
-                    "total_price": _quantity * product.price,
-                }
-            }
-
-            all_total_price = 0
-            all_total_quantity = 0
-            session.modified = True
-            if "cart_item" in session:
-                if session["cart_item"] is not None:
-                    if product.code in session["cart_item"]:
-                        for key, value in session["cart_item"].items():
-                            if product.code == key:
-                                old_quantity = session["cart_item"][key]["quantity"]
-                                total_quantity = old_quantity + _quantity
-                                session["cart_item"][key]["quantity"] = total_quantity
-                                session["cart_item"][key]["total_price"] = (
-                                    total_quantity * product.price
-                                )
-                    else:
-                        session["cart_item"] = array_merge(
-                            session["cart_item"], itemArray
-                        )
-
-                    for key, value in session["cart_item"].items():
-                        individual_quantity = int(session["cart_item"][key]["quantity"])
-                        individual_price = float(
-                            session["cart_item"][key]["total_price"]
-                        )
-                        all_total_quantity = all_total_quantity + individual_quantity
-                        all_total_price = all_total_price + individual_price
-                else:
-                    session["cart_item"] = itemArray
-                    all_total_quantity = all_total_quantity + _quantity
-                    all_total_price = all_total_price + _quantity * product.price
-            else:
-                session["cart_item"] = itemArray
-                all_total_quantity = all_total_quantity + _quantity
-                all_total_price = all_total_price + _quantity * product.price
-
-            session["all_total_quantity"] = all_total_quantity
-            session["all_total_price"] = all_total_price
-            return redirect(url_for("shop"))
+        # validate the received values, a negative quantity would add units to the stock
+        if _quantity > 0 and _code and request.method == "POST":
+            product = catalog.get(_code)
+            if product is None:
+                return "Error while adding item to cart"
+            if "cart_id" not in session:
+                session["cart_id"] = new_cart_id()
+            carts.add(session["cart_id"], product, _quantity)
+            return redirect(url_for(".shop"))
         else:
             return "Error while adding item to cart"
     except Exception as e:
@@ -469,16 +1244,43 @@ def add_product_to_cart():
 
 
 # Define endpoint for shop page
-@app.route("/shop", methods=["GET"])
+@bp.route("/shop", methods=["GET"])
 @login_required
 def shop():
     """
-    function loads product values into the shop page. Login is required.
+    function loads one page of product values into the shop page. Login is required.
+    Paging and filter values are read from the query string, see product_page.
     :return: returns logged in user to the shop page
     """
     try:
-        product = Products.query.all()
-        return render_template("shop.html", products=product)
+        version = catalog.current_version()
+        page = product_page(request.args)
+        return render_template(
+            "shop.html", products=page.items, page=page, catalog_version=version
+        )
+    except Exception as e:
+        logging.exception(e)
+        print(
+            "Oops....Unexpected error. Try reloading the page. Contact Site Administrator if it persists."
+        )
+
+
+# Define endpoint for the product search page
+@bp.route("/search", methods=["GET"])
+@login_required
+def search():
+    """
+    function loads the products whose name or brand words start with the words of the q
+    query value into the search page, cheapest first. Login is required.
+    Filter and paging values are read from the query string, see search_page.
+    :return: returns logged in user to the search page
+    """
+    try:
+        version = catalog.current_version()
+        page = search_page(request.args)
+        return render_template(
+            "search.html", products=page.items, page=page, catalog_version=version
+        )
     except Exception as e:
         logging.exception(e)
         print(
@@ -487,7 +1289,7 @@ def shop():
 
 
 # Define the endpoint for emptying cart
-@app.route("/empty")
+@bp.route("/empty")
 @login_required
 def empty_cart():
     """
@@ -495,8 +1297,8 @@ def empty_cart():
     :return: returns user to the shop page after emptying the cart
     """
     try:
-        session["cart_item"] = None
-        return redirect(url_for("shop"))
+        carts.clear(session.get("cart_id"))
+        return redirect(url_for(".shop"))
     except Exception as e:
         logging.exception(e)
         print(
@@ -505,64 +1307,85 @@ def empty_cart():
 
 
 # Define the endpoint for checkout/cart page
-@app.route("/cart", methods=["GET", "POST"])
+@bp.route("/cart", methods=["GET", "POST"])
 @login_required
 def cart_load():
     """
     function checks if user's access role is user or not
     GET - if access role is user then renders the checkout page
-    POST - if access role is user then user can place orders
+    POST - if access role is user then user can place orders. The units ordered are taken
+    off the stock and the order recorded in the order queue in one transaction, retried on
+    conflicts, and written by its workers, see write_order. A cart asking for more units
+    than are left is sent back to the checkout page. The checkout_token form value keeps a
+    form submitted twice from placing two orders.
     :return: GET returns user to checkout page if accesslevel is user or
     returns user to index page if accesslevels is not user
     """
     try:
-        user = Users.query.filter_by(id=session["_user_id"]).first()
+        user = current_user
         if user.accesslevel == "admin" or user.accesslevel == "fulfillment":
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
+        cart = carts.get(session.get("cart_id"))
+        total_items = list(cart.items.values())
         if request.method == "POST":
-            total_items = []
-            if "cart_item" in session:
-                if session["cart_item"] is not None:
-                    for item in (session["cart_item"]).keys():
-                        total_items.append(session["cart_item"][item])
-            for item in total_items:
-                user = Users.query.filter_by(id=session["_user_id"]).first()
-                Address = (
-                    request.form.get("fullname")
-                    + ", "
-                    + request.form.get("address")
-                    + ", "
-                    + request.form.get("city")
-                    + ", "
-                    + request.form.get("eir")
-                )
-                order = Orders(
-                    product=item["code"],
-                    name=item["name"],
-                    username=user.username,
-                    email=user.email,
-                    price=item["price"],
-                    quantity=item["quantity"],
-                    Address=Address,
-                )
-                db.session.add(order)
-                db.session.commit()
-            return redirect(url_for("empty_cart"))
-        total_items = []
-        if "cart_item" in session:
-            if session["cart_item"] is not None:
-                for item in (session["cart_item"]).keys():
-                    total_items.append(session["cart_item"][item])
-                total_items_count = len(total_items)
-                return render_template(
-                    "checkout.html",
-                    total_items=total_items,
-                    total_items_count=total_items_count,
+            if total_items:
+                key = request.form.get("checkout_token", "")[:64] or uuid.uuid4().hex
+                quantities = {item["code"]: item["quantity"] for item in total_items}
+                order = {
+                    "user_id": user.id,
+                    "username": user.username,
+                    "email": user.email,
+                    "address": ", ".join(
+                        request.form.get(field) or ""
+                        for field in ("fullname", "address", "city", "eir")
+                    ),
+                    "created_at": datetime.utcnow().isoformat(),
+                    "items": [
+                        {
+                            "code": item["code"],
+                            "name": item["name"],
+                            "price": item["price"],
+                            "quantity": item["quantity"],
+                        }
+                        for item in total_items
+                    ],
+                }
+                try:
+                    retry_conflicts(
+                        lambda: checkouts.enqueue(
+                            key,
+                            order,
+                            before=lambda conn: reserve(
+                                conn, Products.__table__, quantities
+                            ),
+                        ),
+                        attempts=config.getint("stock", "retries", fallback=3),
+                    )
+                except OutOfStock as e:
+                    names = {item["code"]: item["name"] for item in total_items}
+                    flash(
+                        "Not enough stock left of {}".format(
+                            ", ".join(
+                                "{} ({} left)".format(names[code], left)
+                                for code, left in e.available.items()
+                            )
+                        )
+                    )
+                    return redirect(url_for(".cart_load"))
+                # the order history should show the order even while the replicas lag
+                stick_to_primary(
+                    config.getfloat("sql", "read_your_writes", fallback=10)
                 )
-            else:
-                return render_template("checkout.html")
-        else:
-            return render_template("checkout.html")
+            return redirect(url_for(".empty_cart"))
+        if total_items:
+            return render_template(
+                "checkout.html",
+                cart=cart,
+                total_items=total_items,
+                total_items_count=len(total_items),
+                checkout_token=uuid.uuid4().hex,
+            )
+        return render_template("checkout.html")
     except Exception as e:
         logging.exception(e)
         print(
@@ -570,25 +1393,8 @@ def cart_load():
         )
 
 
-# This function is used to merge individual item arrays into the existing cart array
-def array_merge(first_array, second_array):
-    """
-    function to merge cart items
-    :param first_array: existing cart array
-    :param second_array: user selected product's array
-    :return: return merged cart array
-    """
-    if isinstance(first_array, list) and isinstance(second_array, list):
-        return first_array + second_array
-    elif isinstance(first_array, dict) and isinstance(second_array, dict):
-        return dict(list(first_array.items()) + list(second_array.items()))
-    elif isinstance(first_array, set) and isinstance(second_array, set):
-        return first_array.union(second_array)
-    return False
-
-
 # Define the endpoint for adding a product into the database from the admin portal
-@app.route("/add_product", methods=["POST"])
+@bp.route("/add_product", methods=["POST"])
 @login_required
 def add_product():
     """
@@ -599,26 +1405,41 @@ def add_product():
         if (
             not request.form.get("name")
             or not request.form.get("brand")
+            or not request.form.get("code")
             or not request.form.get("price")
             or not request.form.get("image")
         ):
             flash("One of the mandatory fields not supplied")
-            return redirect(url_for("admin"))
+            return redirect(url_for(".admin"))
+        stock = request.form.get("stock")
+        if stock and (to_int(stock) is None or to_int(stock) < 0):
+            flash("Stock should be a whole number of units, or empty if not tracked")
+            return redirect(url_for(".admin"))
+        if Products.query.filter_by(code=request.form.get("code")).first() is not None:
+            flash(
+                "Product with code {} already exists".format(request.form.get("code"))
+            )
+            return redirect(url_for(".admin"))
         product = Products(
             name=request.form.get("name"),
             brand=request.form.get("brand"),
             code=request.form.get("code"),
             price=request.form.get("price"),
             image=request.form.get("image"),
+            stock=to_int(stock) if stock else None,
         )
         db.session.add(product)
+        version = bump_catalog_version()
         db.session.commit()
+        catalog.updated(version, product=snapshot(product))
+        search_index.updated(version, products=[snapshot(product)])
+        images.generate_async(product.image)
         flash(
             "Data for product with code {} has been added".format(
                 request.form.get("code")
             )
         )
-        return redirect(url_for("admin"))
+        return redirect(url_for(".admin"))
     except Exception as e:
         logging.exception(e)
         print(
@@ -626,30 +1447,206 @@ def add_product():
         )
 
 
+# This function upserts the products of an import file, shared by the import endpoint and command
+def import_products_from(stream, import_format):
+    """
+    Rows are written in chunks of chunk_size from the [import] section of config.ini, each
+    chunk bumps the catalog version in its own transaction.
+    :param stream: text stream of the file
+    :param import_format: csv or ndjson
+    :return: ImportReport
+    """
+    generated = set()
+
+    def commit():
+        version = bump_catalog_version()
+        db.session.commit()
+        return version
+
+    def committed(version, rows):
+        codes = [row["code"] for row in rows]
+        catalog.updated(version, codes=codes)
+        # the generator only queries the rows when the index is applied in place
+        search_index.updated(
+            version,
+            products=(
+                snapshot(product)
+                for product in Products.query.filter(Products.code.in_(codes))
+            ),
+        )
+        for image in {row["image"] for row in rows} - generated:
+            images.generate_async(image)
+            generated.add(image)
+
+    return upsert_products(
+        db.session,
+        Products,
+        read_rows(stream, import_format),
+        commit,
+        chunk_size=config.getint("import", "chunk_size", fallback=500),
+        report=ImportReport(
+            max_errors=config.getint("import", "max_errors", fallback=1000)
+        ),
+        on_commit=committed,
+    )
+
+
+# This function picks the format of an import file from the format query value or the file extension
+def import_format_of(file_name):
+    """
+    :param file_name: name of the uploaded file, may be empty
+    :return: format name, csv when nothing tells otherwise
+    """
+    if has_request_context() and request.args.get("format"):
+        return request.args["format"]
+    if "." in (file_name or ""):
+        return file_name.rsplit(".", 1)[1].lower()
+    return "csv"
+
+
+# Define the endpoint for adding and updating products in bulk from the admin portal
+@bp.route("/admin/products/import", methods=["POST"])
+@login_required
+def import_products():
+    """
+    Function upserts by code the products of the uploaded file (file form field) or of the
+    request body, as csv with a code,name,brand,price,image header or as ndjson. Valid rows
+    are saved in chunked transactions, invalid ones are reported and skipped.
+    :return: JSON report of the rows read, inserted, updated and failed with the per-row
+    errors if user's access level is admin, 400 for an unknown format, or redirect to index
+    """
+    if current_user.accesslevel != "admin":
+        return redirect(url_for(".index"))
+    upload = request.files.get("file")
+    import_format = import_format_of(upload.filename if upload is not None else "")
+    if import_format not in EXPORT_FORMATS:
+        return {
+            "error": "format should be one of {}".format(", ".join(EXPORT_FORMATS))
+        }, 400
+    stream = io.TextIOWrapper(
+        upload.stream if upload is not None else request.stream,
+        encoding="utf-8-sig",
+        newline="",
+    )
+    try:
+        return import_products_from(stream, import_format).as_dict()
+    finally:
+        stream.detach()
+
+
+# Define the endpoint streaming the catalog in the import file format
+@bp.route("/admin/products/export", methods=["GET"])
+@login_required
+def export_products():
+    """
+    function streams every product as csv or ndjson (format query value, defaults to csv),
+    in the columns the import endpoint reads.
+    :return: streamed export if user's access level is admin or redirect to index
+    """
+    if current_user.accesslevel != "admin":
+        return redirect(url_for(".index"))
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        flash("Export format should be one of {}".format(", ".join(EXPORT_FORMATS)))
+        return redirect(url_for(".admin"))
+    rows = (
+        Products.query.with_entities(
+            *[getattr(Products, column) for column in PRODUCT_COLUMNS]
+        )
+        .order_by(Products.id)
+        .yield_per(1000)
+    )
+    return Response(
+        stream_with_context(stream_rows(rows, PRODUCT_COLUMNS, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": "attachment; filename=products.{}".format(
+                export_format
+            )
+        },
+    )
+
+
+# Bulk catalog changes from the command line, run with: flask --app main import-products products.csv
+@bp.cli.command("import-products")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format", "import_format", type=click.Choice(list(EXPORT_FORMATS)), default=None
+)
+def import_products_command(path, import_format):
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        report = import_products_from(stream, import_format or import_format_of(path))
+    for error in report.errors:
+        print("line {line} ({code}): {error}".format(**error))
+    print(
+        "{} rows: {} inserted, {} updated, {} failed".format(
+            report.rows, report.inserted, report.updated, report.failed
+        )
+    )
+
+
+# Run with: flask --app main export-products products.csv, or - for stdout
+@bp.cli.command("export-products")
+@click.argument("path", type=click.File("w", encoding="utf-8"))
+@click.option(
+    "--format", "export_format", type=click.Choice(list(EXPORT_FORMATS)), default="csv"
+)
+def export_products_command(path, export_format):
+    rows = (
+        Products.query.with_entities(
+            *[getattr(Products, column) for column in PRODUCT_COLUMNS]
+        )
+        .order_by(Products.id)
+        .yield_per(1000)
+    )
+    for chunk in stream_rows(rows, PRODUCT_COLUMNS, export_format):
+        path.write(chunk)
+
+
 # Define the endpoint for deleting a product from the database from the admin portal
-@app.route("/delete_product_data", methods=["POST"])
+@bp.route("/delete_product_data", methods=["POST"])
 @login_required
 def delete_product_data():
     """
-    Function allows admin to delete a product from the database using the code as unique identifier
+    Function allows admin to delete a product from the database using the code as unique identifier.
+    The delete is checked against the stock_version read with the product and made again from
+    a fresh read if a checkout changed the row meanwhile.
     :return: returns to admin page with message about result of deletion procedure.
     """
     try:
         if request.form.get("code"):
-            product = Products.query.filter_by(code=request.form.get("code")).first()
-            if product is not None:
-                db.session.delete(product)
-                db.session.commit()
+
+            def write():
+                try:
+                    product = Products.query.filter_by(
+                        code=request.form.get("code")
+                    ).first()
+                    if product is None:
+                        return None
+                    db.session.delete(product)
+                    version = bump_catalog_version()
+                    db.session.commit()
+                    return version
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+            version = retry_conflicts(
+                write, attempts=config.getint("stock", "retries", fallback=3)
+            )
+            if version is not None:
+                catalog.updated(version, code=request.form.get("code"))
+                search_index.updated(version, codes=[request.form.get("code")])
                 flash(
                     "Data for product with code {} has been deleted".format(
                         request.form.get("code")
                     )
                 )
-                return redirect(url_for("admin"))
+                return redirect(url_for(".admin"))
             flash("Ooops.....Incorrect Code Supplied")
-            return redirect(url_for("admin"))
+            return redirect(url_for(".admin"))
         flash("You need to supply the product's code value to be able to delete it")
-        return redirect(url_for("admin"))
+        return redirect(url_for(".admin"))
     except Exception as e:
         logging.exception(e)
         print(
@@ -658,11 +1655,14 @@ def delete_product_data():
 
 
 # Define the endpoint for updating a product into the database from the admin portal
-@app.route("/update_product", methods=["POST"])
+@bp.route("/update_product", methods=["POST"])
 @login_required
 def update_product():
     """
-    Function allows admin to update a product into the database using the code as unique identifier
+    Function allows admin to update a product into the database using the code as unique identifier.
+    A stock value replaces the units left, "none" stops tracking them. The update is checked
+    against the stock_version read with the product and made again from a fresh read if a
+    checkout changed the row meanwhile.
     :return: returns to admin page with message about result of update procedure
     """
     try:
@@ -672,29 +1672,65 @@ def update_product():
                 and not request.form.get("brand")
                 and not request.form.get("price")
                 and not request.form.get("image")
+                and not request.form.get("stock")
             ):
                 flash("You need to supply at least one value to update apart from code")
-                return redirect(url_for("admin"))
-            product = Products.query.filter_by(code=request.form.get("code")).first()
-            if request.form.get("name"):
-                product.name = request.form.get("name")
-            if request.form.get("brand"):
-                product.brand = request.form.get("brand")
-            if request.form.get("price"):
-                product.price = request.form.get("price")
+                return redirect(url_for(".admin"))
+            stock = request.form.get("stock")
+            if (
+                stock
+                and stock != "none"
+                and (to_int(stock) is None or to_int(stock) < 0)
+            ):
+                flash(
+                    "Stock should be a whole number of units, or none to stop tracking it"
+                )
+                return redirect(url_for(".admin"))
+
+            def write():
+                try:
+                    product = Products.query.filter_by(
+                        code=request.form.get("code")
+                    ).first()
+                    if product is None:
+                        return None, None
+                    if request.form.get("name"):
+                        product.name = request.form.get("name")
+                    if request.form.get("brand"):
+                        product.brand = request.form.get("brand")
+                    if request.form.get("price"):
+                        product.price = request.form.get("price")
+                    if request.form.get("image"):
+                        product.image = request.form.get("image")
+                    if stock:
+                        product.stock = None if stock == "none" else to_int(stock)
+                    version = bump_catalog_version()
+                    db.session.commit()
+                    return product, version
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+            product, version = retry_conflicts(
+                write, attempts=config.getint("stock", "retries", fallback=3)
+            )
+            if product is None:
+                flash("Ooops.....Incorrect Code Supplied")
+                return redirect(url_for(".admin"))
+            catalog.updated(version, product=snapshot(product))
+            search_index.updated(version, products=[snapshot(product)])
             if request.form.get("image"):
-                product.image = request.form.get("image")
-            db.session.commit()
+                images.generate_async(product.image)
             flash(
                 "Data for product with code {} has been updated".format(
                     request.form.get("code")
                 )
             )
-            return redirect(url_for("admin"))
+            return redirect(url_for(".admin"))
         flash(
             "You need to supply the product's code value to be able to update information"
         )
-        return redirect(url_for("admin"))
+        return redirect(url_for(".admin"))
     except Exception as e:
         logging.exception(e)
         print(
@@ -702,8 +1738,229 @@ def update_product():
         )
 
 
+# Define the endpoint serving the fingerprinted CSS/JS bundles, see assets.py
+@bp.route("/static/dist/<path:filename>", methods=["GET"])
+def asset(filename):
+    """
+    Sends the brotli or gzip copy of a bundle when the client accepts it. Bundle names change
+    with their content, so they are cached by browsers and proxies for a year.
+    :param filename: fingerprinted file name from the asset manifest
+    :return: the bundle
+    """
+    file_name, encoding = assets.variant(filename, request.accept_encodings)
+    response = send_from_directory(
+        assets.output_dir,
+        file_name,
+        mimetype=mimetypes.guess_type(filename)[0],
+        max_age=31536000,
+    )
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
+
+# Template helper resolving the logical name of a bundle to its fingerprinted url
+@bp.app_template_global()
+def asset_url(name):
+    """
+    :param name: logical name of a bundle, such as site.css
+    :return: url of the bundle
+    """
+    return assets.url(name)
+
+
+# One-off command rebuilding the CSS/JS bundles, run with: flask --app main build-assets
+@bp.cli.command("build-assets")
+def build_assets_command():
+    for name, (file_name, size, gzip_size, brotli_size) in assets.build().items():
+        print(
+            "{} -> {} {} bytes, gzip {}, brotli {}".format(
+                name, file_name, size, gzip_size, brotli_size
+            )
+        )
+
+
+# Template helper returning the srcset derivatives of a static image, see templates/images.html
+@bp.app_template_global()
+def image_set(image):
+    """
+    :param image: file name of an image of static/images
+    :return: ImageSet or None while its derivatives are not generated yet
+    """
+    return images.lookup(image)
+
+
+# One-off command generating the derivatives of every static image, run with: flask --app main build-images
+@bp.cli.command("build-images")
+def build_images_command():
+    for name, image_set in images.build():
+        if image_set is None:
+            print("{} skipped".format(name))
+        else:
+            print("{} {} widths {}".format(name, image_set.digest, image_set.widths))
+
+
+# Application factory used by the development server below, wsgi.py and the flask command
+def create_app(config_path=None):
+    """
+    Reads the config from config_path, SPWEBAPP_CONFIG or ./config.ini and builds the application
+    along with the caches and stores used by the routes. Tables are not created here, run the
+    init-db command once instead.
+    :param config_path: optional path of the ini file
+    :return: Flask application
+    """
+    global hasher, catalog, users, carts, images, assets, pages, fragments, metrics
+    global checkouts, search_index, summaries
+    config.clear()
+    config.read(config_path or os.environ.get("SPWEBAPP_CONFIG", "./config.ini"))
+    configure_logging(
+        path=config.get("logging", "path", fallback="./spwebapp.log"),
+        max_bytes=config.getint("logging", "max_bytes", fallback=10485760),
+        backup_count=config.getint("logging", "backup_count", fallback=5),
+        level=config.get("logging", "level", fallback="INFO"),
+        sample_rates={
+            access_log.name: config.getfloat("logging", "access_sample", fallback=0.1)
+        },
+        enabled=config.getboolean("logging", "enabled", fallback=True),
+    )
+    # Create the application
+    app = Flask(__name__)
+
+    # Define the configuration for your application
+    app.config["SQLALCHEMY_DATABASE_URI"] = config["sql"]["uri"]
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        config, config["sql"]["uri"]
+    )
+    replicas = [
+        uri.strip()
+        for uri in config.get("sql", "replicas", fallback="").split(",")
+        if uri.strip()
+    ]
+    app.config["SQLALCHEMY_BINDS"] = {
+        REPLICA_BIND.format(i): dict(url=uri, **engine_options(config, uri))
+        for i, uri in enumerate(replicas)
+    }
+    app.config["SECRET_KEY"] = config["flask"]["session_secret"]
+    app.static_folder = "./static"
+    app.config.update(
+        SESSION_COOKIE_SECURE=True,
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE="Strict",
+        QUERY_COUNT_HEADER=config.getboolean(
+            "flask", "query_count_header", fallback=False
+        ),
+        ETAGS=config.getboolean("compression", "etags", fallback=True),
+        COMPRESS=config.getboolean("compression", "enabled", fallback=True),
+        COMPRESS_MIN_SIZE=config.getint("compression", "min_size", fallback=1024),
+        COMPRESS_GZIP_LEVEL=config.getint("compression", "gzip_level", fallback=6),
+        COMPRESS_BROTLI_QUALITY=config.getint(
+            "compression", "brotli_quality", fallback=4
+        ),
+        METRICS_TOKEN=config.get("metrics", "token", fallback=""),
+    )
+    db.init_app(app)
+    login_manager.init_app(app)
+    csrf.init_app(app)
+    app.register_blueprint(bp)
+
+    metrics = (
+        Metrics(
+            directory=config.get("metrics", "directory", fallback="./metrics") or None,
+            flush_interval=config.getfloat("metrics", "flush_interval", fallback=1),
+        )
+        if config.getboolean("metrics", "enabled", fallback=True)
+        else None
+    )
+    hasher = PasswordHasher(
+        rounds=config.getint("bcrypt", "rounds", fallback=12),
+        workers=config.getint("bcrypt", "workers", fallback=2),
+        max_pending=config.getint("bcrypt", "max_pending", fallback=16),
+        timeout=config.getfloat("bcrypt", "timeout", fallback=10),
+        observe=metrics.bcrypt.observe if metrics is not None else None,
+    )
+    catalog = CatalogCache(
+        load_product,
+        load_products,
+        load_catalog_version,
+        max_size=config.getint("cache", "catalog_size", fallback=10000),
+        ttl=config.getfloat("cache", "catalog_ttl", fallback=300),
+        check_interval=config.getfloat("cache", "catalog_version_check", fallback=1),
+    )
+    search_index = SearchIndex(
+        load_products,
+        max_prefix_words=config.getint("search", "max_prefix_words", fallback=1000),
+    )
+    users = UserCache(
+        load_user,
+        max_size=config.getint("cache", "user_size", fallback=10000),
+        ttl=config.getfloat("cache", "user_ttl", fallback=5),
+    )
+    pages = PageCache(
+        max_size=config.getint("cache", "page_size", fallback=64),
+        ttl=config.getfloat("cache", "page_ttl", fallback=60),
+    )
+    fragments = PageCache(
+        max_size=config.getint("cache", "fragment_size", fallback=1024),
+        ttl=config.getfloat("cache", "fragment_ttl", fallback=300),
+    )
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragments
+    app.jinja_env.fragment_csrf_token = generate_csrf
+    images = ImageDerivatives(
+        os.path.join(app.static_folder, "images"),
+        os.path.join(app.static_folder, "images", "derived"),
+        "/static/images/derived",
+        widths=[
+            int(width)
+            for width in config.get(
+                "images", "widths", fallback="160,320,640,1280"
+            ).split(",")
+        ],
+        formats=config.get("images", "formats", fallback="avif,webp").split(","),
+        quality=config.getint("images", "quality", fallback=70),
+        workers=config.getint("images", "workers", fallback=1),
+    )
+    assets = AssetBundler(
+        app.static_folder,
+        os.path.join(app.static_folder, "dist"),
+        "/static/dist",
+    )
+    assets.load()
+    with app.app_context():
+        count_queries(db.engine)
+        if replicas:
+            engines = [db.engines[REPLICA_BIND.format(i)] for i in range(len(replicas))]
+            for engine in engines:
+                count_queries(engine)
+            app.extensions["replicas"] = ReplicaSet(
+                engines,
+                health_interval=config.getfloat(
+                    "sql", "replica_health_interval", fallback=5
+                ),
+            )
+        carts = create_cart_store()
+        checkouts = OrderQueue(
+            db.engine,
+            write_order,
+            workers=config.getint("orders", "workers", fallback=2),
+            max_attempts=config.getint("orders", "max_attempts", fallback=5),
+            retry_delay=config.getint("orders", "retry_delay", fallback=2),
+            lock_timeout=config.getint("orders", "lock_timeout", fallback=60),
+            poll_interval=config.getfloat("orders", "poll_interval", fallback=1),
+            retention=config.getint("orders", "retention", fallback=86400),
+            on_failed=release_order,
+        )
+        summaries = SummaryTables(db.engine)
+        if isinstance(carts, SQLCartStore) and carts.engine is not db.engine:
+            count_queries(carts.engine)
+    return app
+
+
 """
-Run the app with the desired flags
+Run the app with the desired flags, for development only. Production deployments serve
+wsgi.py with gunicorn or waitress instead, see gunicorn.conf.py.
 ssl_context is used for specifying the path to the ssl certificate.
 The "adhoc" parameter creates a dummy cert which enables us to use https
 without buying a real certificate from a Certificate Authority.
@@ -713,4 +1970,5 @@ Port flag can be used to specify different ports.
 Debug can be enabled by setting to True for debugging purposes.
 """
 if __name__ == "__main__":
+    app = create_app()
     app.run(ssl_context="adhoc", port=int(config["flask"]["port"]), debug=False)
@@ -0,0 +1,419 @@
+# Request metrics exposed in the Prometheus text exposition format, summed over the server processes
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+try:
+    import fcntl
+except ImportError:  # Windows, served by a single waitress process
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Methods kept as label values, any other method a client sends is counted as "other"
+METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+# This class counts events per label values, such as requests per endpoint and status
+class Counter:
+    def __init__(self, name, description, labels=()):
+        """
+        :param name: metric name
+        :param description: help text of the metric
+        :param labels: names of the labels, values are passed to inc in the same order
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        """
+        :param values: label values
+        :param amount: value added to the counter
+        """
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def empty(self):
+        """
+        :return: Counter with the same name and labels and no values
+        """
+        return Counter(self.name, self.description, self.labels)
+
+    def state(self):
+        """
+        :return: list of [label values, value] pairs, JSON serializable
+        """
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, state):
+        """
+        :param state: values returned by state, added to this counter
+        """
+        for labels, value in state:
+            self.inc(*labels, amount=value)
+
+    def expose(self):
+        """
+        :return: list of lines in the text exposition format
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} counter".format(self.name),
+        ]
+        for labels, value in values:
+            lines.append(
+                "{}{} {}".format(
+                    self.name,
+                    _format_labels(self.labels, labels),
+                    _format_value(value),
+                )
+            )
+        return lines
+
+
+# This class keeps a bucketed distribution of observations per label values
+class Histogram:
+    """
+    Buckets are upper bounds, an observation is counted in the first bucket it does not exceed
+    and exposed cumulatively like Prometheus client histograms, with a final +Inf bucket.
+    """
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        :param name: metric name
+        :param description: help text of the metric
+        :param labels: names of the labels, values are passed to observe in the same order
+        :param buckets: sorted upper bounds of the buckets
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *values):
+        """
+        :param value: observed value, such as a duration in seconds
+        :param values: label values
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def empty(self):
+        """
+        :return: Histogram with the same name, labels and buckets and no observations
+        """
+        return Histogram(self.name, self.description, self.labels, self.buckets)
+
+    def state(self):
+        """
+        :return: list of [label values, bucket counts, sum] lists, JSON serializable
+        """
+        with self._lock:
+            return [
+                [list(labels), list(counts), total]
+                for labels, (counts, total) in self._series.items()
+            ]
+
+    def merge(self, state):
+        """
+        :param state: series returned by state, added to this histogram
+        """
+        with self._lock:
+            for labels, counts, total in state:
+                if len(counts) != len(self.buckets) + 1:
+                    # written with other buckets, by a previous version
+                    continue
+                series = self._series.get(tuple(labels))
+                if series is None:
+                    series = self._series[tuple(labels)] = [
+                        [0] * (len(self.buckets) + 1),
+                        0.0,
+                    ]
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+
+    def expose(self):
+        """
+        :return: list of lines in the text exposition format
+        """
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            )
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} histogram".format(self.name),
+        ]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        self.name,
+                        _format_labels(
+                            self.labels,
+                            labels,
+                            'le="{}"'.format(
+                                "+Inf" if bound == math.inf else _format_value(bound)
+                            ),
+                        ),
+                        cumulative,
+                    )
+                )
+            lines.append(
+                "{}_sum{} {}".format(
+                    self.name, _format_labels(self.labels, labels), _format_value(total)
+                )
+            )
+            lines.append(
+                "{}_count{} {}".format(
+                    self.name, _format_labels(self.labels, labels), cumulative
+                )
+            )
+        return lines
+
+
+# This class holds the metrics recorded by the request hooks and the password hasher
+class Metrics:
+    """
+    Without a directory every metric lives in the memory of the process that recorded it,
+    which is only right for a single process server. With a directory each process writes
+    its series to a file of its own there every flush_interval seconds and at exit, and a
+    scrape reaching any worker sums the files of every process of the host, so totals do
+    not depend on the worker answering. The files of dead workers, such as those recycled
+    by gunicorn, are added to one file of the dead processes and removed, under a lock file.
+    """
+
+    def __init__(self, prefix="spwebapp", directory=None, flush_interval=1):
+        """
+        :param prefix: prepended to every metric name
+        :param directory: directory shared by the server processes of the host, None keeps
+        the metrics of each process apart. Not used without fcntl, where a single process serves.
+        :param flush_interval: seconds between two writes of the file of this process
+        """
+        self.directory = None
+        if directory and fcntl is not None:
+            self.directory = os.path.abspath(directory)
+        self.flush_interval = flush_interval
+        self.path = None
+        self._pid = None
+        self._flush_lock = threading.Lock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        self.requests = Counter(
+            prefix + "_requests_total",
+            "Requests handled, by endpoint, method and status code.",
+            ("endpoint", "method", "status"),
+        )
+        self.latency = Histogram(
+            prefix + "_request_duration_seconds",
+            "Time spent handling a request, up to the response being built.",
+            ("endpoint", "method"),
+            LATENCY_BUCKETS,
+        )
+        self.queries = Histogram(
+            prefix + "_request_queries",
+            "SQL statements sent to the database per request.",
+            ("endpoint",),
+            QUERY_BUCKETS,
+        )
+        self.sql_time = Histogram(
+            prefix + "_request_sql_seconds",
+            "Time spent in SQL statements per request.",
+            ("endpoint",),
+            LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            prefix + "_response_size_bytes",
+            "Size of the response body as sent, after compression. Streamed bodies are not counted.",
+            ("endpoint",),
+            SIZE_BUCKETS,
+        )
+        self.bcrypt = Histogram(
+            prefix + "_bcrypt_duration_seconds",
+            "Time a request waited for a password hash or check, including the hashing pool queue.",
+            ("operation",),
+            BCRYPT_BUCKETS,
+        )
+
+    def observe_request(
+        self, endpoint, method, status, seconds, queries, sql_seconds, size
+    ):
+        """
+        :param endpoint: name of the view, without the blueprint prefix
+        :param method: HTTP method, counted as "other" when not in METHODS
+        :param status: response status code
+        :param seconds: time spent handling the request
+        :param queries: number of SQL statements sent by the request
+        :param sql_seconds: time spent in those statements
+        :param size: response body size in bytes, None for streamed responses
+        """
+        if self.directory is not None and self._pid != os.getpid():
+            self._start()
+        if method not in METHODS:
+            method = "other"
+        self.requests.inc(endpoint, method, status)
+        self.latency.observe(seconds, endpoint, method)
+        self.queries.observe(queries, endpoint)
+        self.sql_time.observe(sql_seconds, endpoint)
+        if size is not None:
+            self.response_size.observe(size, endpoint)
+
+    def _metrics(self):
+        return (
+            self.requests,
+            self.latency,
+            self.queries,
+            self.sql_time,
+            self.response_size,
+            self.bcrypt,
+        )
+
+    def _start(self):
+        # the file is named after the process recording, a forked child gets its own
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.path = os.path.join(
+                self.directory,
+                "metrics.{}.{}.json".format(self._pid, uuid.uuid4().hex),
+            )
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the series of this process to its file in the directory, if it has one.
+        """
+        if self.path is None or self._pid != os.getpid():
+            return
+        state = {metric.name: metric.state() for metric in self._metrics()}
+        with self._flush_lock:
+            _write_state(self.path, state)
+
+    def _collect(self):
+        """
+        :return: list of metrics summing the files of every process of the directory
+        """
+        self.flush()
+        totals = [metric.empty() for metric in self._metrics()]
+        with open(os.path.join(self.directory, "metrics.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                _merge_dead(self.directory, totals)
+                for path in glob.glob(os.path.join(self.directory, "metrics.*.json")):
+                    _add_state(totals, _read_state(path))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return totals
+
+    def expose(self):
+        """
+        :return: every metric in the text exposition format, summed over the processes
+        writing to the directory if there is one
+        """
+        lines = []
+        metrics = self._metrics() if self.directory is None else self._collect()
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+def _write_state(path, state):
+    # replaced in one step, a scrape never reads a half written file
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file)
+    os.replace(temporary, path)
+
+
+def _read_state(path):
+    try:
+        with open(path, encoding="utf-8") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logging.warning("Skipping unreadable metrics file %s", path)
+        return {}
+
+
+def _add_state(metrics, state):
+    for metric in metrics:
+        metric.merge(state.get(metric.name, ()))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_dead(directory, metrics):
+    """
+    Adds the files of the processes that exited to metrics.dead.json and removes them, so
+    the directory does not grow as workers are recycled. Called under the lock file.
+    :param metrics: metrics of the Metrics collecting, only used for their names and buckets
+    """
+    dead_path = os.path.join(directory, "metrics.dead.json")
+    dead = None
+    for path in glob.glob(os.path.join(directory, "metrics.*.json")):
+        pid = os.path.basename(path).split(".")[1]
+        if not pid.isdigit() or _alive(int(pid)):
+            continue
+        if dead is None:
+            dead = [metric.empty() for metric in metrics]
+            _add_state(dead, _read_state(dead_path))
+        _add_state(dead, _read_state(path))
+        _write_state(dead_path, {metric.name: metric.state() for metric in dead})
+        os.remove(path)
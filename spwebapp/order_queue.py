@@ -0,0 +1,332 @@
+# Durable queue of checkout events kept in a database table, processed by background worker threads
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    and_,
+    delete,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+
+
+# This exception rolls back an event handled by a worker whose lock expired meanwhile
+class LostLock(Exception):
+    pass
+
+
+# This class records events in the order_events table and hands them to a handler exactly once
+class OrderQueue:
+    """
+    enqueue commits the event and returns, workers threads of every process using the table
+    claim pending events with a conditional update and run handler(connection, event_id,
+    payload) in the transaction that marks the event done, so the work of a handler using
+    that connection is committed once or not at all. A failing event is retried with an
+    exponential delay and left failed after max_attempts, on_failed(connection, event_id,
+    payload) running in the transaction that marks it failed. With workers set to 0 events are
+    processed in the thread that enqueues them, and retried on the next enqueue.
+    Worker threads are started lazily in each process, so it is safe to create the queue
+    before a preforking server forks its workers.
+    """
+
+    def __init__(
+        self,
+        engine,
+        handler,
+        workers=2,
+        max_attempts=5,
+        retry_delay=2,
+        lock_timeout=60,
+        poll_interval=1.0,
+        retention=86400,
+        on_failed=None,
+    ):
+        """
+        :param engine: SQLAlchemy engine holding the order_events table and the handler's tables
+        :param handler: callable taking a connection, the event id and the decoded payload
+        :param workers: number of worker threads per process, 0 processes events inline
+        :param max_attempts: attempts before an event is left failed
+        :param retry_delay: seconds before the first retry, doubled on each further attempt
+        :param lock_timeout: seconds after which an event claimed by a stalled worker is retried
+        :param poll_interval: seconds between two looks at the table when no event was enqueued
+        by this process
+        :param retention: seconds done events are kept before being purged
+        :param on_failed: optional callable taking a connection, the event id and the decoded
+        payload, undoing what was done when the event was enqueued
+        """
+        self.engine = engine
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.on_failed = on_failed
+        self._threads = []
+        self._pid = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.metadata = MetaData()
+        self.events = Table(
+            "order_events",
+            self.metadata,
+            Column("id", Integer, primary_key=True),
+            Column("idempotency_key", String(64), unique=True, nullable=False),
+            Column("payload", Text, nullable=False),
+            Column("status", String(16), nullable=False, default="pending"),
+            Column("attempts", Integer, nullable=False, default=0),
+            Column("available_at", Integer, nullable=False),
+            Column("locked_by", String(64)),
+            Column("locked_until", Integer),
+            Column("last_error", String(255)),
+            Column("created_at", Integer, nullable=False),
+            Column("processed_at", Integer),
+            Index("ix_order_events_status_available_at", "status", "available_at"),
+        )
+
+    def create_tables(self):
+        """
+        Creates the order_events table if it does not already exist.
+        """
+        self.metadata.create_all(self.engine)
+
+    def enqueue(self, key, payload, before=None):
+        """
+        Durably records the event. A key already recorded is not enqueued again, so a
+        checkout form submitted twice makes a single order.
+        :param key: idempotency key of the event, at most 64 characters
+        :param payload: JSON serializable event data
+        :param before: optional callable taking the connection, run in the transaction
+        recording the event, whose work is rolled back with the event if it raises or if the
+        key was already recorded
+        :return: id of the event
+        """
+        now = int(time.time())
+        try:
+            with self.engine.begin() as conn:
+                if before is not None:
+                    before(conn)
+                event_id = conn.execute(
+                    self.events.insert().values(
+                        idempotency_key=key,
+                        payload=json.dumps(payload),
+                        status="pending",
+                        attempts=0,
+                        available_at=now,
+                        created_at=now,
+                    )
+                ).inserted_primary_key[0]
+        except IntegrityError:
+            with self.engine.connect() as conn:
+                return conn.execute(
+                    select(self.events.c.id).where(self.events.c.idempotency_key == key)
+                ).scalar()
+        if self.workers:
+            self.start()
+            self._wake.set()
+        else:
+            self.process_pending()
+        return event_id
+
+    def start(self):
+        """
+        Starts the worker threads of this process if they are not running.
+        """
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._work,
+                    name="order-queue-{}".format(index),
+                    daemon=True,
+                )
+                for index in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stops the worker threads of this process once their current event is done.
+        """
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def process_pending(self, limit=None):
+        """
+        Claims and processes due events until none is left.
+        :param limit: optional maximum number of events to process
+        :return: number of events processed, successfully or not
+        """
+        worker = "{}-{}-{}".format(
+            socket.gethostname(), os.getpid(), threading.get_ident()
+        )[-64:]
+        processed = 0
+        while limit is None or processed < limit:
+            event = self._claim(worker)
+            if event is None:
+                break
+            self._process(worker, event)
+            processed += 1
+        return processed
+
+    def stats(self):
+        """
+        :return: dict with the number of events per status and the age in seconds of the
+        oldest pending event
+        """
+        with self.engine.connect() as conn:
+            counts = dict(
+                conn.execute(
+                    select(self.events.c.status, func.count()).group_by(
+                        self.events.c.status
+                    )
+                ).all()
+            )
+            oldest = conn.execute(
+                select(func.min(self.events.c.created_at)).where(
+                    self.events.c.status == "pending"
+                )
+            ).scalar()
+        return {
+            "pending": counts.get("pending", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_pending_seconds": int(time.time()) - oldest if oldest else 0,
+        }
+
+    def _claimable(self, now):
+        return and_(
+            self.events.c.status == "pending",
+            self.events.c.available_at <= now,
+            or_(
+                self.events.c.locked_until.is_(None),
+                self.events.c.locked_until < now,
+            ),
+        )
+
+    def _claim(self, worker):
+        now = int(time.time())
+        with self.engine.begin() as conn:
+            candidates = conn.execute(
+                select(self.events.c.id)
+                .where(self._claimable(now))
+                .order_by(self.events.c.id)
+                .limit(8)
+            ).scalars()
+            for event_id in list(candidates):
+                claimed = conn.execute(
+                    update(self.events)
+                    .where(and_(self.events.c.id == event_id, self._claimable(now)))
+                    .values(
+                        locked_by=worker,
+                        locked_until=now + self.lock_timeout,
+                        attempts=self.events.c.attempts + 1,
+                    )
+                ).rowcount
+                if claimed:
+                    return conn.execute(
+                        select(
+                            self.events.c.id,
+                            self.events.c.payload,
+                            self.events.c.attempts,
+                        ).where(self.events.c.id == event_id)
+                    ).first()
+        return None
+
+    def _process(self, worker, event):
+        owned = and_(
+            self.events.c.id == event.id,
+            self.events.c.locked_by == worker,
+            self.events.c.status == "pending",
+        )
+        try:
+            with self.engine.begin() as conn:
+                self.handler(conn, event.id, json.loads(event.payload))
+                done = conn.execute(
+                    update(self.events)
+                    .where(owned)
+                    .values(
+                        status="done",
+                        processed_at=int(time.time()),
+                        locked_by=None,
+                        locked_until=None,
+                        last_error=None,
+                    )
+                ).rowcount
+                if not done:
+                    raise LostLock()
+        except LostLock:
+            logging.warning("Order event %s was claimed by another worker", event.id)
+        except Exception as e:
+            logging.exception(e)
+            failed = event.attempts >= self.max_attempts
+            with self.engine.begin() as conn:
+                marked = conn.execute(
+                    update(self.events)
+                    .where(owned)
+                    .values(
+                        status="failed" if failed else "pending",
+                        available_at=int(time.time())
+                        + self.retry_delay * 2 ** (event.attempts - 1),
+                        locked_by=None,
+                        locked_until=None,
+                        last_error=str(e)[:255],
+                    )
+                ).rowcount
+                if failed and marked and self.on_failed is not None:
+                    self.on_failed(conn, event.id, json.loads(event.payload))
+
+    def _purge(self):
+        now = time.monotonic()
+        if now - self._purged_at < self.retention / 10:
+            return
+        self._purged_at = now
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(self.events).where(
+                    and_(
+                        self.events.c.status == "done",
+                        self.events.c.processed_at < int(time.time()) - self.retention,
+                    )
+                )
+            )
+
+    def _work(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                processed = self.process_pending()
+                self._purge()
+            except Exception as e:
+                # the database may be briefly unavailable, try again after the poll interval
+                logging.exception(e)
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
@@ -0,0 +1,84 @@
+# Process-wide cache of rendered pages and template fragments without per-user content
+import threading
+import time
+from collections import OrderedDict
+
+# Marker rendered in place of the CSRF token, replaced with the visitor's token on every hit
+CSRF_PLACEHOLDER = "\x00csrf-token\x00"
+
+
+# This class keeps rendered pages or fragments in memory, split around their CSRF token placeholders
+class PageCache:
+    """
+    Pages are cached by key with LRU eviction once max_size entries are held, and expire after
+    ttl seconds so that image derivatives generated meanwhile show up. A ttl of 0 disables the
+    cache. hits, misses and bypasses count the lookups since startup.
+    """
+
+    def __init__(self, max_size=64, ttl=60):
+        """
+        :param max_size: maximum number of pages held in memory
+        :param ttl: seconds after which a cached page is rendered again
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render, csrf_token):
+        """
+        :param key: hashable key of the page, such as its template and the visitor's login state
+        :param render: callable rendering the page with CSRF_PLACEHOLDER as the token
+        :param csrf_token: callable returning the visitor's CSRF token
+        :return: the page as a str
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                parts = entry[1]
+            else:
+                self.misses += 1
+                parts = None
+        if parts is None:
+            parts = render().split(CSRF_PLACEHOLDER)
+            if self.ttl > 0:
+                with self._lock:
+                    self._pages[key] = (now, parts)
+                    self._pages.move_to_end(key)
+                    while len(self._pages) > self.max_size:
+                        self._pages.popitem(last=False)
+        if len(parts) == 1:
+            return parts[0]
+        return csrf_token().join(parts)
+
+    def bypass(self):
+        """
+        Counts a request served without the cache, such as one with flashed messages pending.
+        """
+        with self._lock:
+            self.bypasses += 1
+
+    def invalidate(self):
+        """
+        Drops every cached page.
+        """
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self):
+        """
+        :return: dict with size, hits, misses and bypasses
+        """
+        with self._lock:
+            return {
+                "size": len(self._pages),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+            }
@@ -0,0 +1,101 @@
+# Keyset (seek) pagination helpers used by the listing pages
+from operator import gt, lt
+
+
+# This function reads and validates the paging and filtering values of a listing request
+def parse_page_args(args, default_size=24, max_size=100):
+    """
+    :param args: request.args of the listing request
+    :param default_size: page size used when none or an invalid one is requested
+    :param max_size: upper limit for the requested page size
+    :return: dict with after, before and size plus every filter key that was supplied
+    """
+    page_args = {
+        "after": to_int(args.get("after")),
+        "before": to_int(args.get("before")),
+        "size": to_int(args.get("size")) or default_size,
+    }
+    page_args["size"] = max(1, min(page_args["size"], max_size))
+    for key, value in args.items():
+        if key not in page_args and value:
+            page_args[key] = value
+    return page_args
+
+
+def to_int(value):
+    """
+    :return: value as an int or None if it is missing or not a number
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# This class holds one page of a listing along with what is needed to link its neighbours
+class KeysetPage:
+    """
+    items - rows on this page, ordered by the key column.
+    has_prev / has_next - whether there are rows before / after this page.
+    filters - filter values the page was built with, carried over to the neighbour links.
+    """
+
+    def __init__(self, items, key, has_prev, has_next, filters):
+        self.items = tuple(items)
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.filters = filters
+        self._first = key(self.items[0]) if self.items else None
+        self._last = key(self.items[-1]) if self.items else None
+
+    @property
+    def prev_args(self):
+        return dict(self.filters, before=self._first)
+
+    @property
+    def next_args(self):
+        return dict(self.filters, after=self._last)
+
+
+# This function applies a keyset page to a query ordered by a unique column
+def keyset_page(
+    query, column, page_args, key=lambda row: row.id, transform=None, descending=False
+):
+    """
+    Seeks past the given key instead of using OFFSET, so every page costs the same
+    whatever its position in the table.
+    :param query: filtered query to paginate
+    :param column: unique, indexed column the listing is ordered by
+    :param page_args: dict returned by parse_page_args
+    :param key: function returning the column value of a row
+    :param transform: optional function applied to every row before it is put on the page
+    :param descending: list the highest keys first, e.g. the newest rows
+    :return: KeysetPage
+    """
+    size = page_args["size"]
+    transform = transform or (lambda row: row)
+    filters = {
+        name: value
+        for name, value in page_args.items()
+        if name not in ("after", "before") and value is not None
+    }
+    forward, backward = (
+        (column.desc(), column) if descending else (column, column.desc())
+    )
+    follows, precedes = (lt, gt) if descending else (gt, lt)
+    if page_args["before"] is not None:
+        rows = (
+            query.filter(precedes(column, page_args["before"]))
+            .order_by(backward)
+            .limit(size + 1)
+            .all()
+        )
+        has_prev = len(rows) > size
+        rows = [transform(row) for row in reversed(rows[:size])]
+        return KeysetPage(rows, key, has_prev, True, filters)
+    if page_args["after"] is not None:
+        query = query.filter(follows(column, page_args["after"]))
+    rows = query.order_by(forward).limit(size + 1).all()
+    has_next = len(rows) > size
+    rows = [transform(row) for row in rows[:size]]
+    return KeysetPage(rows, key, page_args["after"] is not None, has_next, filters)
@@ -0,0 +1,133 @@
+# Response post-processing: conditional GET with weak ETags and gzip/brotli compression
+import hashlib
+import time
+import zlib
+
+import brotli
+from werkzeug.http import generate_etag
+
+from page_cache import CSRF_PLACEHOLDER
+
+COMPRESSIBLE = {
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+    "text/css",
+    "text/csv",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+
+def _compressible(response):
+    return (
+        response.status_code == 200
+        and not response.direct_passthrough
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in COMPRESSIBLE
+    )
+
+
+# This function answers 304 Not Modified when a rendered page did not change
+def conditional(
+    response, request, csrf_token=None, csrf_time_limit=None, csrf_secret=None
+):
+    """
+    Rendered GET responses get a weak ETag computed from their body, which stays valid whatever
+    encoding is negotiated afterwards. Streamed and file responses are left alone, files
+    already carry their own validators.
+    The CSRF token is re-signed every second, so it is hashed as CSRF_PLACEHOLDER. The tag
+    then also changes every half csrf_time_limit, so a page revalidated with a 304 never
+    holds a token older than the limit, and a hash of the session's raw token is added, so a
+    page is never revalidated in a session whose token it cannot carry.
+    :param response: response of the view
+    :param request: current request
+    :param csrf_token: CSRF token rendered in the page, None if the request rendered none
+    :param csrf_time_limit: seconds a CSRF token stays valid, None if it does not expire
+    :param csrf_secret: raw CSRF token kept in the session, the rendered token is signed from it
+    :return: the response, turned into a 304 if the client already holds this version
+    """
+    if (
+        request.method in ("GET", "HEAD")
+        and _compressible(response)
+        and not response.is_streamed
+        and "ETag" not in response.headers
+    ):
+        body = response.get_data()
+        if csrf_token and csrf_token.encode() in body:
+            body = body.replace(csrf_token.encode(), CSRF_PLACEHOLDER.encode())
+            if csrf_time_limit:
+                body += str(int(time.time() // (csrf_time_limit / 2))).encode()
+            if csrf_secret:
+                body += hashlib.sha256(csrf_secret.encode()).hexdigest().encode()
+        response.set_etag(generate_etag(body), weak=True)
+        response.make_conditional(request)
+    return response
+
+
+# This function compresses the response with the best encoding the client accepts
+def compress(response, request, min_size=1024, gzip_level=6, brotli_quality=4):
+    """
+    Buffered responses smaller than min_size are sent as they are. Streamed responses are
+    compressed chunk by chunk and flushed after each one, so they stay streamable.
+    :param response: response of the view
+    :param request: current request
+    :param min_size: smallest body in bytes worth compressing
+    :param gzip_level: zlib compression level, 1 to 9
+    :param brotli_quality: brotli quality, 0 to 11
+    :return: the response, compressed if the client accepts gzip or br
+    """
+    if not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    accepted = request.accept_encodings
+    if accepted["br"]:
+        encoding = "br"
+    elif accepted["gzip"]:
+        encoding = "gzip"
+    else:
+        return response
+    if response.is_streamed:
+        source = response.response
+        response.response = _compress_stream(
+            response.iter_encoded(), source, encoding, gzip_level, brotli_quality
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        if encoding == "br":
+            response.set_data(brotli.compress(body, quality=brotli_quality))
+        else:
+            compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            response.set_data(compressor.compress(body) + compressor.flush())
+    response.content_encoding = encoding
+    return response
+
+
+def _compress_stream(chunks, source, encoding, gzip_level, brotli_quality):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=brotli_quality)
+        process, flush, finish = (
+            compressor.process,
+            compressor.flush,
+            compressor.finish,
+        )
+    else:
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    try:
+        for chunk in chunks:
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # the view's iterable may hold a request context, see stream_with_context
+        if hasattr(source, "close"):
+            source.close()
@@ -0,0 +1,359 @@
+# In-process inverted index of the product catalog backing the /search endpoint
+import bisect
+import heapq
+import re
+import threading
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    :param text: name, brand or search query
+    :return: list of the lowercase words of text
+    """
+    return WORD.findall(str(text).lower())
+
+
+def entry_of(product):
+    """
+    :param product: CachedProduct
+    :return: (product, distinct words of its name and brand, the same words joined in a
+    string each preceded by a space, so a word prefix is found with a substring test)
+    """
+    words = tuple(set(tokenize(product.name) + tokenize(product.brand)))
+    return product, words, "".join(" " + word for word in words)
+
+
+def prefixes_of(words):
+    """
+    :param words: words of a product
+    :return: set of every prefix of the words, the words included
+    """
+    return {word[:end] for word in words for end in range(1, len(word) + 1)}
+
+
+def cursor_of(product):
+    """
+    :param product: CachedProduct
+    :return: "price:code" paging key of the product in search results
+    """
+    return "{}:{}".format(product.price, product.code)
+
+
+def parse_cursor(value):
+    """
+    :param value: paging key written by cursor_of
+    :return: (price, code) tuple or None if value is missing or malformed
+    """
+    price, _, code = (value or "").partition(":")
+    try:
+        return (int(price), code) if code else None
+    except ValueError:
+        return None
+
+
+# This class indexes the words and prices of the catalog and follows its version stamp
+class SearchIndex:
+    """
+    Products are kept sorted by (price, code), so a price range is a slice of that list and
+    results come in price order with keyset paging on that key. Every prefix of a word of a
+    product's name and brand maps to the same sorted list of the products holding it, and
+    each word also maps to the set of their codes.
+    A query walks the prefix list of its word with the fewest products in the price range
+    and checks the other words against each product's words, stopping once the page is full.
+    When the other words look too rare for that to end soon, or the walk runs past its
+    budget, the code sets of the words are intersected from the smallest and what is left
+    is sorted instead.
+    Like CatalogCache, changes committed by this worker are applied in place, and the index is
+    rebuilt from the database on the next search once another worker moved the version.
+    """
+
+    def __init__(self, load_products, max_prefix_words=1000):
+        """
+        :param load_products: callable returning a list of CachedProduct for the whole catalog
+        :param max_prefix_words: a query word that is the prefix of more distinct words than
+        this is not used to intersect code sets, only to check the products left
+        """
+        self.load_products = load_products
+        self.max_prefix_words = max_prefix_words
+        self.version = None
+        self._products = {}
+        self._postings = {}
+        self._prefixes = {}
+        self._words = []
+        self._prices = []
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def sync(self, version):
+        """
+        Rebuilds the index if it does not hold the given catalog version.
+        :param version: current catalog version stamp, see CatalogCache.current_version
+        """
+        if version == self.version:
+            return
+        with self._build_lock:
+            if version == self.version:
+                return
+            products = {}
+            postings = {}
+            for product in self.load_products():
+                entry = entry_of(product)
+                products[product.code] = entry
+                for word in entry[1]:
+                    postings.setdefault(word, set()).add(product.code)
+            prices = sorted((entry[0].price, code) for code, entry in products.items())
+            # appended in price order, so each list is already sorted
+            prefixes = {}
+            for key in prices:
+                for prefix in prefixes_of(products[key[1]][1]):
+                    prefixes.setdefault(prefix, []).append(key)
+            with self._lock:
+                self._products = products
+                self._postings = postings
+                self._prefixes = prefixes
+                self._words = sorted(postings)
+                self._prices = prices
+                self.version = version
+
+    def updated(self, version, products=(), codes=()):
+        """
+        Applies a catalog change committed by this worker.
+        :param version: catalog version stamp written by the change
+        :param products: iterable of CachedProduct added or updated, only consumed when the
+        index holds the previous version
+        :param codes: codes of deleted products
+        """
+        with self._lock:
+            if self.version is None or version != self.version + 1:
+                # another worker changed the catalog since, rebuild on the next search
+                self.version = None
+                return
+            # keys removed from and added to each prefix list, "" being the price list,
+            # merged once at the end so a whole import chunk does not insert one by one
+            changes = {}
+            for code in codes:
+                self._remove(code, changes)
+            for product in products:
+                self._remove(product.code, changes)
+                self._add(product, changes)
+            for prefix, (removed, added) in changes.items():
+                self._merge(prefix, removed, added)
+            self.version = version
+
+    def _add(self, product, changes):
+        entry = entry_of(product)
+        self._products[product.code] = entry
+        for word in entry[1]:
+            if word not in self._postings:
+                self._postings[word] = set()
+                bisect.insort(self._words, word)
+            self._postings[word].add(product.code)
+        key = (product.price, product.code)
+        for prefix in prefixes_of(entry[1]) | {""}:
+            changes.setdefault(prefix, (set(), {}))[1][key] = None
+
+    def _remove(self, code, changes):
+        entry = self._products.pop(code, None)
+        if entry is None:
+            return
+        product, words, _ = entry
+        for word in words:
+            codes = self._postings[word]
+            codes.discard(code)
+            if not codes:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        key = (product.price, code)
+        for prefix in prefixes_of(words) | {""}:
+            removed, added = changes.setdefault(prefix, (set(), {}))
+            if key in added:
+                del added[key]
+            else:
+                removed.add(key)
+
+    def _merge(self, prefix, removed, added):
+        keys = self._prices if prefix == "" else self._prefixes.get(prefix, [])
+        if len(removed) == 1:
+            del keys[bisect.bisect_left(keys, next(iter(removed)))]
+        elif removed:
+            keys[:] = [key for key in keys if key not in removed]
+        if len(added) == 1:
+            bisect.insort(keys, next(iter(added)))
+        elif added:
+            keys.extend(added)
+            keys.sort()
+        if prefix == "":
+            return
+        if keys:
+            self._prefixes[prefix] = keys
+        else:
+            self._prefixes.pop(prefix, None)
+
+    def _prefixed(self, term):
+        """
+        :return: slice bounds of the words starting with term in the sorted word list
+        """
+        start = bisect.bisect_left(self._words, term)
+        end = bisect.bisect_left(self._words, term + "\U0010ffff", start)
+        return start, end
+
+    def search(
+        self,
+        query,
+        brand=None,
+        min_price=None,
+        max_price=None,
+        after=None,
+        before=None,
+        limit=24,
+    ):
+        """
+        Every word of the query must start a word of the product's name or brand.
+        :param query: search text, an empty query matches every product
+        :param brand: optional brand the products must have
+        :param min_price: optional lowest price
+        :param max_price: optional highest price
+        :param after: optional (price, code) key, returns the products following it
+        :param before: optional (price, code) key, returns the products preceding it
+        :param limit: maximum number of products returned
+        :return: (list of CachedProduct ordered by price then code, whether more products
+        match past the returned ones in the paging direction)
+        """
+        terms = sorted(set(tokenize(query)))
+        with self._lock:
+            start = 0
+            end = len(self._prices)
+            if min_price is not None:
+                start = bisect.bisect_left(self._prices, (min_price,))
+            if max_price is not None:
+                end = bisect.bisect_left(self._prices, (max_price + 1,))
+            if after is not None:
+                start = max(start, bisect.bisect_right(self._prices, tuple(after)))
+            if before is not None:
+                end = min(end, bisect.bisect_left(self._prices, tuple(before)))
+            if start >= end:
+                return [], False
+
+            low = self._prices[start]
+            high = self._prices[end - 1]
+            backwards = before is not None
+
+            # the price range of the prefix list of each query word, the shortest is walked
+            walked = (self._prices, start, end)
+            walked_term = None
+            counts = []
+            for term in terms:
+                keys = self._prefixes.get(term)
+                if keys is None:
+                    return [], False
+                first = bisect.bisect_left(keys, low)
+                last = bisect.bisect_right(keys, high)
+                if first == last:
+                    return [], False
+                counts.append(last - first)
+                if last - first < walked[2] - walked[1]:
+                    walked = (keys, first, last)
+                    walked_term = term
+            patterns = [" " + term for term in terms if term != walked_term]
+            if not patterns:
+                return self._walk(*walked, patterns, brand, limit, backwards)
+
+            # products the walk is expected to visit to fill the page, assuming the query
+            # words are independent, against a budget of about the cost of intersecting
+            fraction = 1.0
+            for count in counts:
+                fraction *= count / (end - start)
+            fraction /= (walked[2] - walked[1]) / (end - start)
+            budget = limit + 1 + (walked[2] - walked[1]) * len(patterns) // 16
+            if (limit + 1) / fraction <= budget:
+                found = self._walk(*walked, patterns, brand, limit, backwards, budget)
+                if found is not None:
+                    return found
+            found = self._intersect(terms, low, high, brand, limit, backwards)
+            if found is not None:
+                return found
+            return self._walk(*walked, patterns, brand, limit, backwards)
+
+    def _walk(self, keys, first, last, patterns, brand, limit, backwards, budget=None):
+        """
+        :return: (products, more) like search, or None if budget products were visited
+        without filling the page
+        """
+        positions = range(last - 1, first - 1, -1) if backwards else range(first, last)
+        capped = budget is not None and budget < len(positions)
+        if capped:
+            positions = positions[:budget]
+        products = self._products
+        found = []
+        for position in positions:
+            product, _, text = products[keys[position][1]]
+            for pattern in patterns:
+                if pattern not in text:
+                    break
+            else:
+                if not brand or product.brand == brand:
+                    found.append(product)
+                    if len(found) > limit:
+                        break
+        else:
+            if capped:
+                return None
+        more = len(found) > limit
+        found = found[:limit]
+        if backwards:
+            found.reverse()
+        return found, more
+
+    def _intersect(self, terms, low, high, brand, limit, backwards):
+        """
+        :return: (products, more) like search, or None if every query word is the prefix
+        of too many words to intersect their code sets
+        """
+        groups = []
+        checked = []
+        for term in terms:
+            first, last = self._prefixed(term)
+            if last - first > self.max_prefix_words:
+                checked.append(" " + term)
+                continue
+            sets = [self._postings[word] for word in self._words[first:last]]
+            groups.append((sum(len(codes) for codes in sets), sets))
+        if not groups:
+            return None
+        groups.sort(key=lambda group: group[0])
+        codes = None
+        for _, sets in groups:
+            found = sets[0].union(*sets[1:]) if len(sets) > 1 else sets[0]
+            codes = found if codes is None else codes.intersection(found)
+            if not codes:
+                return [], False
+        products = self._products
+        keys = [(products[code][0].price, code) for code in codes]
+        keys = [key for key in keys if low <= key <= high]
+        if brand or checked:
+            keys = [
+                key
+                for key in keys
+                if (not brand or products[key[1]][0].brand == brand)
+                and all(pattern in products[key[1]][2] for pattern in checked)
+            ]
+        if backwards:
+            found = heapq.nlargest(limit + 1, keys)[::-1]
+            page = found[-limit:] if len(found) > limit else found
+        else:
+            found = heapq.nsmallest(limit + 1, keys)
+            page = found[:limit]
+        return [products[code][0] for _, code in page], len(found) > limit
+
+    def stats(self):
+        """
+        :return: dict with the number of products and distinct words indexed
+        """
+        with self._lock:
+            return {
+                "version": self.version,
+                "products": len(self._products),
+                "words": len(self._words),
+            }
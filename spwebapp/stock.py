@@ -0,0 +1,144 @@
+# Stock levels of the products, reserved at checkout with a conditional decrement
+import logging
+import random
+import time
+
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+
+
+# This exception rolls back a checkout asking for more units than a product has left
+class OutOfStock(Exception):
+    def __init__(self, available):
+        """
+        :param available: dict of the units left of each product short of stock, by code,
+        0 for a product that no longer exists
+        """
+        super().__init__(
+            "Out of stock: {}".format(
+                ", ".join("{} ({} left)".format(*item) for item in available.items())
+            )
+        )
+        self.available = available
+
+
+# This function takes the units of a checkout off the stock of its products
+def reserve(conn, products, quantities):
+    """
+    One UPDATE decrements every product of the checkout, only where enough units are left,
+    and bumps the stock_version of the rows whose stock is tracked. Unless it changed a row per product
+    the checkout is short and OutOfStock is raised, which rolls the whole transaction back,
+    so concurrent checkouts never sell more than the stock without locking the rows before
+    the update. A NULL stock is not tracked and never runs out.
+    :param conn: connection of the transaction recording the checkout
+    :param products: products Table, with code, stock and stock_version columns
+    :param quantities: dict of the units wanted by product code, each at least 1
+    """
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError(
+            "Quantities to reserve must be positive: {}".format(quantities)
+        )
+    wanted = case(quantities, value=products.c.code)
+    reserved = conn.execute(
+        update(products)
+        .where(
+            products.c.code.in_(list(quantities)),
+            or_(products.c.stock.is_(None), products.c.stock >= wanted),
+        )
+        .values(
+            stock=products.c.stock - wanted,
+            # untracked rows do not change, admin updates of them need not be retried
+            stock_version=case(
+                (products.c.stock.is_(None), products.c.stock_version),
+                else_=products.c.stock_version + 1,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if reserved == len(quantities):
+        return
+    left = dict(
+        conn.execute(
+            select(products.c.code, products.c.stock).where(
+                products.c.code.in_(list(quantities))
+            )
+        ).all()
+    )
+    raise OutOfStock(
+        {
+            code: left.get(code) or 0
+            for code, quantity in quantities.items()
+            if code not in left or (left[code] is not None and left[code] < quantity)
+        }
+    )
+
+
+# This function puts the units of a checkout that will not be ordered back on the stock
+def release(conn, products, quantities):
+    """
+    :param conn: connection of the transaction giving up the checkout
+    :param products: products Table, with code, stock and stock_version columns
+    :param quantities: dict of the units reserved by product code
+    """
+    returned = case(quantities, value=products.c.code)
+    conn.execute(
+        update(products)
+        .where(products.c.code.in_(list(quantities)), products.c.stock.isnot(None))
+        .values(
+            stock=products.c.stock + returned,
+            stock_version=products.c.stock_version + 1,
+        )
+    )
+
+
+# SQLSTATE of serialization failures and deadlock victims, and of a lock not granted
+# in PostgreSQL
+CONFLICT_STATES = ("40001", "40P01", "55P03")
+# Error numbers of MySQL drivers for a lock wait timeout and a deadlock
+MYSQL_CONFLICTS = (1205, 1213)
+
+
+# This function tells a transaction that lost a race for a lock from any other database error
+def is_conflict(error):
+    """
+    :param error: DBAPIError raised by SQLAlchemy
+    :return: True if the driver reported a deadlock, a serialization failure or a lock
+    wait that timed out, False for anything else such as a lost connection
+    """
+    original = error.orig
+    args = getattr(original, "args", ())
+    if args and isinstance(args[0], int):
+        return args[0] in MYSQL_CONFLICTS
+    # psycopg sets pgcode, pyodbc passes the SQLSTATE as the first argument
+    state = getattr(original, "pgcode", None) or (args[0] if args else None)
+    if state in CONFLICT_STATES:
+        return True
+    message = str(original)
+    # SQL Server reports a lock timeout as error 1222 under a generic SQLSTATE, SQLite as a
+    # busy database once its busy timeout expired
+    return "(1222)" in message or "database is locked" in message
+
+
+# This function runs a transaction again when it lost a race with a concurrent one
+def retry_conflicts(function, attempts=3, delay=0.05):
+    """
+    A conflict is a stale stock_version met by an optimistic update, a lock wait that timed
+    out or a deadlock victim, see is_conflict. Any other error is raised at once. Retries
+    wait a random delay, doubled on each attempt, so the transactions that conflicted do
+    not meet again.
+    :param function: callable running one whole transaction, rolled back when it raises
+    :param attempts: number of runs before the conflict is raised
+    :param delay: seconds of the longest wait before the first retry
+    :return: what function returns
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return function()
+        except (StaleDataError, DBAPIError) as e:
+            if attempt == attempts or (
+                isinstance(e, DBAPIError) and not is_conflict(e)
+            ):
+                raise
+            logging.warning("Retrying after a conflict: %s", e)
+            time.sleep(random.uniform(0, delay * 2 ** (attempt - 1)))
@@ -0,0 +1,219 @@
+# Sales and fulfillment figures kept in summary tables, updated with every order written
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    delete,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+# This expression returns the date part of a datetime column, as the dialect spells it
+class day_of(FunctionElement):
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(day_of)
+def compile_day_of(element, compiler, **kw):
+    return "CAST({} AS DATE)".format(compiler.process(element.clauses, **kw))
+
+
+@compiles(day_of, "sqlite")
+def compile_day_of_sqlite(element, compiler, **kw):
+    return "date({})".format(compiler.process(element.clauses, **kw))
+
+
+# This class maintains the per product per day sales and the per status order figures
+class SummaryTables:
+    """
+    product_sales_daily holds the order lines, units and revenue of each product per day and
+    order_status_counts the same figures per fulfillment status. add_orders updates them in
+    the transaction writing the orders, so they always agree with the orders table, and the
+    dashboard reads only these rows whatever the size of the order history. rebuild
+    recomputes them from the orders table, for backfills and for status changes made
+    outside the application.
+    """
+
+    def __init__(self, engine):
+        """
+        :param engine: SQLAlchemy engine holding the orders and the summary tables
+        """
+        self.engine = engine
+        self.metadata = MetaData()
+        self.daily = Table(
+            "product_sales_daily",
+            self.metadata,
+            Column("product", String(128), primary_key=True),
+            Column("day", Date, primary_key=True),
+            Column("name", String(128), nullable=False),
+            Column("lines", Integer, nullable=False),
+            Column("units", Integer, nullable=False),
+            Column("revenue", BigInteger, nullable=False),
+            Index("ix_product_sales_daily_day", "day"),
+        )
+        self.statuses = Table(
+            "order_status_counts",
+            self.metadata,
+            Column("status", String(32), primary_key=True),
+            Column("lines", Integer, nullable=False),
+            Column("units", BigInteger, nullable=False),
+            Column("revenue", BigInteger, nullable=False),
+        )
+
+    def create_tables(self):
+        """
+        Creates the summary tables if they do not already exist.
+        """
+        self.metadata.create_all(self.engine)
+
+    def add_orders(self, conn, lines):
+        """
+        Adds order lines to the figures. Two transactions creating the same row at once
+        make one of them fail on the primary key, the order queue then retries its event.
+        :param conn: connection of the transaction writing the orders
+        :param lines: list of dicts with the product, name, price, quantity, status and
+        created_at values of the order lines
+        """
+        daily = {}
+        statuses = {}
+        for line in lines:
+            revenue = line["price"] * line["quantity"]
+            key = (line["product"], line["created_at"].date())
+            figures = daily.setdefault(key, [line["name"], 0, 0, 0])
+            figures[1:] = [
+                figures[1] + 1,
+                figures[2] + line["quantity"],
+                figures[3] + revenue,
+            ]
+            figures = statuses.setdefault(line["status"], [None, 0, 0, 0])
+            figures[1:] = [
+                figures[1] + 1,
+                figures[2] + line["quantity"],
+                figures[3] + revenue,
+            ]
+        for (product, day), (name, count, units, revenue) in daily.items():
+            self._add(
+                conn,
+                self.daily,
+                and_(self.daily.c.product == product, self.daily.c.day == day),
+                dict(product=product, day=day, name=name),
+                count,
+                units,
+                revenue,
+            )
+        for status, (_, count, units, revenue) in statuses.items():
+            self._add(
+                conn,
+                self.statuses,
+                self.statuses.c.status == status,
+                dict(status=status),
+                count,
+                units,
+                revenue,
+            )
+
+    def _add(self, conn, table, where, key, count, units, revenue):
+        added = conn.execute(
+            update(table)
+            .where(where)
+            .values(
+                lines=table.c.lines + count,
+                units=table.c.units + units,
+                revenue=table.c.revenue + revenue,
+            )
+        ).rowcount
+        if not added:
+            conn.execute(
+                table.insert().values(lines=count, units=units, revenue=revenue, **key)
+            )
+
+    def rebuild(self, orders):
+        """
+        Recomputes both tables from the orders table in one transaction.
+        :param orders: orders Table, with product, name, price, quantity, status and
+        created_at columns
+        :return: number of product day rows and of status rows written
+        """
+        day = day_of(orders.c.created_at)
+        lines = func.count()
+        units = func.sum(orders.c.quantity)
+        revenue = func.sum(orders.c.price * orders.c.quantity)
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.daily))
+            conn.execute(delete(self.statuses))
+            daily = conn.execute(
+                self.daily.insert().from_select(
+                    ["product", "day", "name", "lines", "units", "revenue"],
+                    select(
+                        orders.c.product,
+                        day,
+                        func.max(orders.c.name),
+                        lines,
+                        units,
+                        revenue,
+                    ).group_by(orders.c.product, day),
+                )
+            ).rowcount
+            statuses = conn.execute(
+                self.statuses.insert().from_select(
+                    ["status", "lines", "units", "revenue"],
+                    select(orders.c.status, lines, units, revenue).group_by(
+                        orders.c.status
+                    ),
+                )
+            ).rowcount
+        return daily, statuses
+
+    def dashboard(self, days=30, top=10, today=None, engine=None):
+        """
+        :param days: number of days, today included, the sales figures cover
+        :param top: number of products listed
+        :param today: last day covered, the current UTC date by default as orders are
+        stamped in UTC
+        :param engine: engine to read the tables from, a read replica for instance, the
+        engine of the summary tables by default
+        :return: dict with the first day covered, the rows of each status, the totals of
+        each day and the products with the highest revenue over the period
+        """
+        since = (today or datetime.utcnow().date()) - timedelta(days=days - 1)
+        recent = self.daily.c.day >= since
+        units = func.sum(self.daily.c.units).label("units")
+        revenue = func.sum(self.daily.c.revenue).label("revenue")
+        with (engine or self.engine).connect() as conn:
+            return {
+                "since": since,
+                "statuses": conn.execute(
+                    select(self.statuses).order_by(self.statuses.c.status)
+                ).all(),
+                "days": conn.execute(
+                    select(self.daily.c.day, units, revenue)
+                    .where(recent)
+                    .group_by(self.daily.c.day)
+                    .order_by(self.daily.c.day.desc())
+                ).all(),
+                "products": conn.execute(
+                    select(
+                        self.daily.c.product,
+                        func.max(self.daily.c.name).label("name"),
+                        units,
+                        revenue,
+                    )
+                    .where(recent)
+                    .group_by(self.daily.c.product)
+                    .order_by(revenue.desc())
+                    .limit(top)
+                ).all(),
+            }
@@ -0,0 +1,73 @@
+# Process-wide cache of logged in users, read by the Flask-Login user loader
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+
+# This class is a detached copy of a users row, safe to share between requests and threads
+class CachedUser(UserMixin):
+    """
+    Holds the columns of Users that requests need, without the password hash.
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.accesslevel = user.accesslevel
+        self.isactive = user.isactive
+
+
+# This class keeps recently loaded users in memory for a short time
+class UserCache:
+    """
+    Users are cached by id with LRU eviction once max_size entries are held, and expire after
+    ttl seconds. invalidate() drops a user from this process as soon as their account is disabled
+    or their role changes; the cache is per process, so the other server processes see the change
+    once their entry expires, and ttl is kept short for that reason. A ttl of 0 disables the cache.
+    """
+
+    def __init__(self, load_user, max_size=10000, ttl=5):
+        """
+        :param load_user: callable taking a user id and returning a CachedUser or None
+        :param max_size: maximum number of users held in memory
+        :param ttl: seconds after which a cached user is reloaded
+        """
+        self.load_user = load_user
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        :param user_id: id stored in the session by Flask-Login
+        :return: CachedUser or None if the user does not exist or cannot log in
+        """
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._users.move_to_end(user_id)
+                return entry[1]
+        user = self.load_user(user_id)
+        if user is not None and self.ttl > 0:
+            with self._lock:
+                self._users[user_id] = (now, user)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """
+        :param user_id: id of the user whose account changed, every user is dropped if not given
+        """
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(str(user_id), None)
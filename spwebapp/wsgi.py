@@ -0,0 +1,27 @@
+# WSGI entry point for production servers, see gunicorn.conf.py
+import configparser
+import os
+
+from main import create_app
+
+app = create_app()
+
+
+"""
+Serve the app with waitress, for platforms gunicorn does not support such as Windows.
+Threads, connection limit and port are read from the [server] section of the config file.
+TLS is expected to be terminated by a reverse proxy in front of waitress.
+"""
+if __name__ == "__main__":
+    from waitress import serve
+
+    server = configparser.ConfigParser()
+    server.read(os.environ.get("SPWEBAPP_CONFIG", "./config.ini"))
+    serve(
+        app,
+        host=server.get("server", "host", fallback="0.0.0.0"),
+        port=server.getint("server", "port", fallback=8000),
+        threads=server.getint("server", "threads", fallback=4),
+        connection_limit=server.getint("server", "connection_limit", fallback=1000),
+        channel_timeout=server.getint("server", "timeout", fallback=30),
+    )
@@ -0,0 +1,20 @@
+# The tests run the application against a throwaway SQLite database, like the benchmarks
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    os.path.join(ROOT_DIR, "benchmarks"),
+    os.path.join(ROOT_DIR, "spwebapp"),
+]
+
+from harness import load_app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    main = load_app()
+    yield main
+    main.checkouts.stop()
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import create_engine, event
+
+from cart_store import CartStore, MemoryCartStore, SQLCartStore
+from catalog_cache import CachedProduct
+
+
+def test_incomplete_store_cannot_be_instantiated():
+    class NoClear(CartStore):
+        def get(self, cart_id):
+            pass
+
+        def add(self, cart_id, product, quantity):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClear()
+    with pytest.raises(TypeError):
+        CartStore()
+
+
+def test_memory_store_is_complete():
+    assert len(MemoryCartStore().get(None)) == 0
+
+
+def test_concurrent_first_adds_are_both_counted(tmp_path):
+    store = SQLCartStore(create_engine("sqlite:///{}".format(tmp_path / "carts.db")))
+    store.create_tables()
+    product = CachedProduct(1, "chair", "brand", "code1", 10, "chair.png")
+    store.add("cart", product, 1)
+    raced = []
+
+    # the first attempt of the next add runs its updates as if the add above had not
+    # committed yet, like a second tab adding at the same time
+    @event.listens_for(store.engine, "before_cursor_execute", retval=True)
+    def before_update(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE") and not raced:
+            raced.append(statement)
+            statement += " AND 1 = 0"
+        return statement, parameters
+
+    store.add("cart", product, 2)
+    cart = store.get("cart")
+    assert cart.items["code1"]["quantity"] == 3
+    assert (cart.total_quantity, cart.total_price) == (3, 30)
@@ -0,0 +1,51 @@
+import threading
+
+from catalog_cache import CachedProduct, CatalogCache
+
+
+def product(price):
+    return CachedProduct(1, "chair", "brand", "code1", price, "chair.png")
+
+
+def test_load_racing_an_update_is_not_stored():
+    loading = threading.Event()
+    written = threading.Event()
+
+    def load_product(code):
+        # read the row, then let the write commit before returning it
+        row = product(10)
+        loading.set()
+        written.wait()
+        return row
+
+    cache = CatalogCache(load_product, list, lambda: 1, check_interval=300)
+    cache.current_version()
+    reader = threading.Thread(target=cache.get, args=("code1",))
+    reader.start()
+    loading.wait()
+    cache.updated(2, codes=["code1"])
+    written.set()
+    reader.join()
+    cache.load_product = lambda code: product(99)
+    assert cache.get("code1").price == 99
+
+
+def test_listing_racing_an_update_is_not_stored():
+    loading = threading.Event()
+    written = threading.Event()
+
+    def load():
+        rows = [product(10)]
+        loading.set()
+        written.wait()
+        return rows
+
+    cache = CatalogCache(None, list, lambda: 1, check_interval=300)
+    cache.current_version()
+    reader = threading.Thread(target=cache.listing, args=(("page",), load))
+    reader.start()
+    loading.wait()
+    cache.updated(2, product=product(99))
+    written.set()
+    reader.join()
+    assert cache.listing(("page",), lambda: [product(99)])[0].price == 99
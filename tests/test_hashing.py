@@ -0,0 +1,20 @@
+import os
+import signal
+
+import pytest
+
+from hashing import HasherBusy, PasswordHasher
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        pw_hash = hasher.hash("secret")
+        for process in list(hasher._pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        with pytest.raises(HasherBusy):
+            hasher.hash("secret")
+        assert hasher.check(pw_hash, "secret")
+    finally:
+        hasher.shutdown()
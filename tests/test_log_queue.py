@@ -0,0 +1,33 @@
+import glob
+import logging
+import os
+
+from log_queue import SharedRotatingFileHandler
+
+
+def test_workers_share_one_rotated_file_set(tmp_path):
+    path = str(tmp_path / "spwebapp.log")
+    # one handler per server process writing to the same file
+    workers = [
+        SharedRotatingFileHandler(path, maxBytes=2000, backupCount=50, encoding="utf-8")
+        for _ in range(3)
+    ]
+    for number in range(600):
+        record = logging.LogRecord(
+            "test", logging.INFO, __file__, 0, "record %04d", (number,), None
+        )
+        workers[number % 3].emit(record)
+    for handler in workers:
+        handler.close()
+    files = glob.glob(path + "*")
+    lines = []
+    for name in files:
+        if not name.endswith(".lock"):
+            with open(name, encoding="utf-8") as log_file:
+                lines.extend(log_file.read().splitlines())
+            assert os.path.getsize(name) <= 2000
+            # a file is only rotated once full, never again by another worker
+            if name != path:
+                assert os.path.getsize(name) > 2000 - 20, name
+    assert sorted(lines) == ["record {:04d}".format(number) for number in range(600)]
+    assert len(files) <= 50 + 2
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from metrics import Metrics
+
+
+def request(metrics, method="GET"):
+    metrics.observe_request("index", method, 200, 0.01, 1, 0.001, 100)
+
+
+def test_scrape_sums_every_process(tmp_path):
+    # one Metrics per server process, sharing the directory
+    workers = [Metrics(directory=str(tmp_path), flush_interval=60) for _ in range(2)]
+    for _ in range(3):
+        request(workers[0])
+    request(workers[1])
+    workers[1].flush()
+    for worker in workers:
+        text = worker.expose()
+        assert (
+            'spwebapp_requests_total{endpoint="index",method="GET",status="200"} 4'
+            in text
+        )
+
+
+def test_files_of_dead_processes_are_kept_in_one_file(tmp_path):
+    worker = Metrics(directory=str(tmp_path), flush_interval=60)
+    request(worker)
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    recycled = Metrics(directory=str(tmp_path), flush_interval=60)
+    request(recycled)
+    recycled.flush()
+    os.rename(
+        recycled.path,
+        os.path.join(str(tmp_path), "metrics.{}.old.json".format(exited.pid)),
+    )
+    recycled.path = None
+    for _ in range(2):
+        text = worker.expose()
+        assert 'method="GET",status="200"} 2' in text
+    assert set(os.listdir(str(tmp_path))) == {
+        "metrics.dead.json",
+        "metrics.lock",
+        os.path.basename(worker.path),
+    }
+
+
+def test_unknown_methods_share_one_label():
+    metrics = Metrics()
+    request(metrics, "BREW")
+    request(metrics, "PROPFIND")
+    assert 'method="other",status="200"} 2' in metrics.expose()
@@ -0,0 +1,9 @@
+def test_page_is_not_revalidated_in_a_new_session(app_module):
+    client = app_module.app.test_client()
+    etag = client.get("/login").headers["ETag"]
+    assert client.get("/login", headers={"If-None-Match": etag}).status_code == 304
+    # a cleared session or an expired cookie gets a new raw CSRF token
+    other = app_module.app.test_client()
+    response = other.get("/login", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
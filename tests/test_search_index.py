@@ -0,0 +1,58 @@
+from catalog_cache import CachedProduct
+from search_index import SearchIndex, tokenize
+
+COLOURS = ["black", "white", "oak", "walnut"]
+ITEMS = ["chair", "chaise", "table", "desk", "lamp"]
+
+
+def catalog(count):
+    return [
+        CachedProduct(
+            i,
+            "{} {} {}".format(COLOURS[i % 4], ITEMS[i // 3 % 5], i),
+            "brand{}".format(i % 7),
+            "code{}".format(i),
+            i * 7919 % 100 + 1,
+            "chair.png",
+        )
+        for i in range(count)
+    ]
+
+
+def expected(products, query, brand=None, limit=24):
+    terms = tokenize(query)
+    found = sorted(
+        (
+            product
+            for product in products
+            if (not brand or product.brand == brand)
+            and all(
+                any(word.startswith(term) for word in tokenize(product.name))
+                or any(word.startswith(term) for word in tokenize(product.brand))
+                for term in terms
+            )
+        ),
+        key=lambda product: (product.price, product.code),
+    )
+    return [product.code for product in found[:limit]], len(found) > limit
+
+
+def test_walk_and_intersection_match_a_scan():
+    products = catalog(3000)
+    # a max_prefix_words of 2 leaves short query words to the product checks
+    index = SearchIndex(lambda: products, max_prefix_words=2)
+    index.sync(1)
+    updated = [products[5]._replace(name="oak lamp 5", price=1)]
+    index.updated(2, products=updated, codes=["code6", "code7"])
+    products = [
+        product
+        for product in products
+        if product.code not in ("code5", "code6", "code7")
+    ] + updated
+    queries = ["", "ch", "chair", "oak table", "walnut oak", "brand3 desk", "c 1", "x"]
+    for query in queries:
+        for brand in (None, "brand2"):
+            found, more = index.search(query, brand=brand)
+            assert ([product.code for product in found], more) == expected(
+                products, query, brand
+            ), (query, brand)
@@ -0,0 +1,163 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from harness import logged_in_client, seed_products, seed_user
+from stock import retry_conflicts
+
+
+def set_stock(main, code, stock):
+    with main.app.app_context():
+        main.Products.query.filter_by(code=code).first().stock = stock
+        main.db.session.commit()
+
+
+def stock_of(main, code):
+    with main.app.app_context():
+        return main.Products.query.filter_by(code=code).first().stock
+
+
+@pytest.fixture(scope="module")
+def shopper(app_module):
+    seed_products(app_module, 10)
+    return seed_user(app_module)
+
+
+def test_negative_quantity_leaves_stock_unchanged(app_module, shopper):
+    set_stock(app_module, "code1", 2)
+    client = logged_in_client(app_module, shopper)
+    client.post("/add", data={"code": "code1", "quantity": "-50"})
+    client.post("/cart", data={"checkout_token": "negative"})
+    assert stock_of(app_module, "code1") == 2
+
+
+@pytest.mark.parametrize("quantity", [0, -50])
+def test_reserve_rejects_non_positive_quantities(app_module, shopper, quantity):
+    set_stock(app_module, "code2", 2)
+    with app_module.app.app_context():
+        with pytest.raises(ValueError):
+            with app_module.db.engine.begin() as conn:
+                app_module.reserve(
+                    conn, app_module.Products.__table__, {"code2": quantity}
+                )
+    assert stock_of(app_module, "code2") == 2
+
+
+def test_reserve_stops_at_the_stock(app_module, shopper):
+    set_stock(app_module, "code3", 2)
+    with app_module.app.app_context():
+        with pytest.raises(app_module.OutOfStock):
+            with app_module.db.engine.begin() as conn:
+                app_module.reserve(conn, app_module.Products.__table__, {"code3": 3})
+        with app_module.db.engine.begin() as conn:
+            app_module.reserve(conn, app_module.Products.__table__, {"code3": 2})
+    assert stock_of(app_module, "code3") == 0
+
+
+def test_failed_order_releases_its_stock(app_module, shopper):
+    set_stock(app_module, "code4", 5)
+    # keep the application's workers from writing the event first
+    app_module.checkouts.stop()
+
+    def fail(conn, event_id, order):
+        raise RuntimeError("order not written")
+
+    order = {"items": [{"code": "code4", "quantity": 2}]}
+    with app_module.app.app_context():
+        queue = app_module.OrderQueue(
+            app_module.db.engine,
+            fail,
+            workers=0,
+            max_attempts=1,
+            on_failed=app_module.release_order,
+        )
+        queue.enqueue(
+            "released",
+            order,
+            before=lambda conn: app_module.reserve(
+                conn, app_module.Products.__table__, {"code4": 2}
+            ),
+        )
+        assert queue.stats()["failed"] == 1
+    assert stock_of(app_module, "code4") == 5
+
+
+def version_of(main, code):
+    with main.app.app_context():
+        return main.Products.query.filter_by(code=code).first().stock_version
+
+
+def test_reserve_bumps_the_version_of_tracked_rows_only(app_module, shopper):
+    set_stock(app_module, "code5", None)
+    set_stock(app_module, "code6", 4)
+    untracked, tracked = version_of(app_module, "code5"), version_of(
+        app_module, "code6"
+    )
+    with app_module.app.app_context():
+        with app_module.db.engine.begin() as conn:
+            app_module.reserve(
+                conn, app_module.Products.__table__, {"code5": 1, "code6": 1}
+            )
+    assert version_of(app_module, "code5") == untracked
+    assert version_of(app_module, "code6") == tracked + 1
+
+
+def test_delete_racing_a_checkout_is_retried(app_module, shopper, monkeypatch):
+    set_stock(app_module, "code7", 4)
+    admin = logged_in_client(
+        app_module, seed_user(app_module, "admin", accesslevel="admin")
+    )
+    bump = app_module.bump_catalog_version
+    calls = []
+
+    def racing():
+        # a checkout commits between the read of the product and its delete
+        if not calls:
+            with app_module.db.engine.begin() as conn:
+                app_module.reserve(conn, app_module.Products.__table__, {"code7": 1})
+        calls.append(1)
+        return bump()
+
+    monkeypatch.setattr(app_module, "bump_catalog_version", racing)
+    response = admin.post("/delete_product_data", data={"code": "code7"})
+    assert response.status_code == 302
+    assert len(calls) == 2
+    with app_module.app.app_context():
+        assert app_module.Products.query.filter_by(code="code7").first() is None
+
+
+def database_error(message):
+    return OperationalError("UPDATE products", {}, sqlite3.OperationalError(message))
+
+
+def test_only_conflicts_are_retried():
+    calls = []
+
+    def lost_connection():
+        calls.append(1)
+        raise database_error("unable to open database file")
+
+    with pytest.raises(OperationalError):
+        retry_conflicts(lost_connection, attempts=3, delay=0)
+    assert len(calls) == 1
+
+    def locked():
+        calls.append(1)
+        if len(calls) < 3:
+            raise database_error("database is locked")
+        return "written"
+
+    assert retry_conflicts(locked, attempts=3, delay=0) == "written"
+
+
+def test_admin_grid_shows_the_current_stock(app_module, shopper):
+    set_stock(app_module, "code8", 47)
+    admin = logged_in_client(
+        app_module, seed_user(app_module, "stockadmin", accesslevel="admin")
+    )
+    assert "<td>47</td>" in admin.get("/admin").get_data(as_text=True)
+    with app_module.app.app_context():
+        with app_module.db.engine.begin() as conn:
+            app_module.reserve(conn, app_module.Products.__table__, {"code8": 1})
+    assert "<td>46</td>" in admin.get("/admin").get_data(as_text=True)
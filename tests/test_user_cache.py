@@ -0,0 +1,31 @@
+import pytest
+
+from harness import logged_in_client, seed_user
+
+
+@pytest.fixture
+def long_ttl(app_module):
+    ttl, app_module.users.ttl = app_module.users.ttl, 3600
+    yield
+    app_module.users.ttl = ttl
+
+
+def set_user(main, *args):
+    result = main.app.test_cli_runner().invoke(args=["set-user", *args])
+    assert result.exit_code == 0, result.output
+
+
+def test_role_change_and_disable_are_seen_before_the_ttl(app_module, long_ttl):
+    user_id = seed_user(app_module, "demoted", accesslevel="admin")
+    client = logged_in_client(app_module, user_id)
+    assert b"Stock" in client.get("/admin").data
+
+    set_user(app_module, "demoted", "--role", "user")
+    response = client.get("/admin")
+    assert response.status_code == 302 and b"Stock" not in response.data
+
+    set_user(app_module, "demoted", "--active", "no")
+    assert str(user_id) not in app_module.users._users
+    assert client.get("/orders").status_code == 302
+    with app_module.app.app_context():
+        assert app_module.users.get(user_id) is None